@@ -2,13 +2,17 @@
 健康检查API路由
 """
 
+import sys
+
 import psutil
 from datetime import datetime
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 
 from ...config import settings
 from ...core.model_manager import model_manager
-from ...models.response import HealthCheckResponse
+from ...core.task_manager import task_manager
+from ...models.response import HealthCheckResponse, ReadinessResponse
 
 router = APIRouter()
 
@@ -26,19 +30,37 @@ async def health_check():
         "percent": f"{(disk_usage.used / disk_usage.total) * 100:.1f}%"
     }
     
-    # 检查GPU是否可用
-    gpu_available = False
-    try:
-        import torch
-        gpu_available = torch.cuda.is_available()
-    except ImportError:
-        pass
+    # 检查GPU是否可用（PyTorch随模型在后台导入，导入前不在此处阻塞导入）
+    torch = sys.modules.get("torch")
+    gpu_available = torch is not None and torch.cuda.is_available()
     
     return HealthCheckResponse(
         status="healthy",
         timestamp=datetime.now().isoformat(),
-        model_loaded=model_manager.is_loaded,
+        model_loaded=task_manager.model_ready,
         gpu_available=gpu_available,
         disk_space=disk_space,
         version=settings.app_version
-    ) 
\ No newline at end of file
+    )
+
+
+@router.get("/health/live")
+async def liveness_check():
+    """存活检查端点：进程能响应即返回200，不依赖模型状态"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+
+@router.get("/health/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """就绪检查端点：模型可以处理请求时返回200，加载中或加载失败时返回503"""
+    status = task_manager.model_status
+    body = ReadinessResponse(
+        status=status,
+        timestamp=datetime.now().isoformat(),
+        error=model_manager.load_error if status == "failed" else None,
+    )
+    if status == "ready":
+        return body
+    
+    headers = {"Retry-After": str(settings.ready_retry_after)} if status == "loading" else None
+    return JSONResponse(status_code=503, content=body.dict(), headers=headers)
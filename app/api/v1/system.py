@@ -2,13 +2,19 @@
 系统状态API路由
 """
 
+import asyncio
 import psutil
+import sys
 import time
 from datetime import datetime
 from fastapi import APIRouter
 
 from ...config import settings
+from ...core.janitor import artifact_janitor
 from ...core.model_manager import model_manager
+from ...core.result_cache import result_cache
+from ...core.task_manager import task_manager
+from ...core.worker_pool import worker_pool
 from ...models.response import SystemStatusResponse
 
 router = APIRouter()
@@ -30,32 +36,29 @@ def get_gpu_info():
         "temperature": 0
     }
     
-    try:
-        import torch
-        if torch.cuda.is_available():
-            gpu_info["available"] = True
-            gpu_info["device_count"] = torch.cuda.device_count()
-            gpu_info["current_device"] = torch.cuda.current_device()
-            gpu_info["device_name"] = torch.cuda.get_device_name()
-            
-            # GPU内存信息
-            memory_stats = torch.cuda.memory_stats()
-            gpu_info["memory_total"] = torch.cuda.get_device_properties(0).total_memory
-            gpu_info["memory_used"] = memory_stats.get("allocated_bytes.all.current", 0)
-            gpu_info["memory_free"] = gpu_info["memory_total"] - gpu_info["memory_used"]
-            
-            # 尝试获取GPU温度
-            try:
-                import GPUtil
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu_info["temperature"] = gpus[0].temperature
-            except ImportError:
-                pass
-                
-    except ImportError:
-        pass
-    
+    # 在事件循环中执行，不为此导入PyTorch；模型加载前（或进程模式下的API进程）视为不可用
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        gpu_info["available"] = True
+        gpu_info["device_count"] = torch.cuda.device_count()
+        gpu_info["current_device"] = torch.cuda.current_device()
+        gpu_info["device_name"] = torch.cuda.get_device_name()
+        
+        # GPU内存信息
+        memory_stats = torch.cuda.memory_stats()
+        gpu_info["memory_total"] = torch.cuda.get_device_properties(0).total_memory
+        gpu_info["memory_used"] = memory_stats.get("allocated_bytes.all.current", 0)
+        gpu_info["memory_free"] = gpu_info["memory_total"] - gpu_info["memory_used"]
+        
+        # 尝试获取GPU温度
+        try:
+            import GPUtil
+            gpus = GPUtil.getGPUs()
+            if gpus:
+                gpu_info["temperature"] = gpus[0].temperature
+        except ImportError:
+            pass
+
     return gpu_info
 
 
@@ -81,12 +84,12 @@ async def get_system_status():
     
     return SystemStatusResponse(
         status="running",
-        model_loaded=model_manager.is_loaded,
-        active_tasks=0,  # TODO: 从任务管理器获取
-        max_concurrent=settings.max_workers or 4,
+        model_loaded=task_manager.model_ready,
+        active_tasks=task_manager.active_tasks,
+        max_concurrent=settings.worker_count,
         gpu_info=get_gpu_info(),
         memory_info=get_memory_info(),
-        queue_length=0,  # TODO: 从任务管理器获取
+        queue_length=task_manager.queue_length,
         uptime=uptime,
         version=settings.app_version
     )
@@ -94,15 +97,60 @@ async def get_system_status():
 
 @router.get("/system/model")
 async def get_model_info():
-    """获取模型信息"""
-    return model_manager.get_model_info()
+    """获取模型信息
+
+    进程模式下模型由各推理进程加载，API进程内没有模型，返回各推理进程的状态。
+    """
+    info = model_manager.get_model_info()
+    if not settings.use_worker_processes:
+        return info
+    
+    # API进程的驻留记录始终为空，不返回
+    for key in ("instances", "batching", "evictions", "residency", "retired_in_use", "loaded_models"):
+        info.pop(key)
+    for spec in info["available_models"]:
+        spec.pop("loaded")
+    workers = worker_pool.get_stats()
+    info.update({
+        "model_loaded": any(worker["ready"] for worker in workers["workers"]),
+        "worker_processes": True,
+        "registry": "模型由各推理进程分别加载，驻留状态见workers（/system/workers）",
+        "workers": workers["workers"],
+    })
+    return info
+
+
+@router.get("/system/workers")
+async def get_workers_info():
+    """获取推理进程状态"""
+    return worker_pool.get_stats()
+
+
+@router.get("/system/cache")
+async def get_cache_info():
+    """获取结果缓存信息"""
+    return {
+        "enabled": settings.cache_enabled,
+        **result_cache.get_stats()
+    }
+
+
+@router.get("/system/storage")
+async def get_storage_info():
+    """获取文件存储和清理状态"""
+    return artifact_janitor.get_stats()
 
 
 @router.post("/system/model/reload")
 async def reload_model():
-    """重新加载模型"""
+    """重新加载模型（热替换，加载期间继续使用旧模型处理请求）"""
     try:
-        success = model_manager.reload_model()
+        # 加载耗时较长，在线程中执行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        if worker_pool.is_running:
+            success = await loop.run_in_executor(None, worker_pool.reload)
+        else:
+            success = await loop.run_in_executor(None, model_manager.reload_model)
         return {
             "success": success,
             "message": "模型重新加载成功" if success else "模型重新加载失败"
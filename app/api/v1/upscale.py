@@ -2,112 +2,231 @@
 图片处理API路由
 """
 
+import asyncio
+import json
 import uuid
+from datetime import datetime
 from pathlib import Path
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
 from ...config import settings
+from ...core.artifact_index import artifact_index
 from ...core.model_manager import model_manager
-from ...models.response import UpscaleResponse
-from ...utils.exceptions import FileUploadError, ImageProcessingError
+from ...core.task_manager import task_manager
+from ...models.request import BulkStatusRequest
+from ...models.response import BulkStatusResponse, SuccessResponse, TaskBrief, UpscaleResponse
+from ...models.task import TaskState
+from ...utils.exceptions import TaskCancelledError, ValidationError
+from ...utils.image_io import media_type_for
+from ...utils.upload import read_multipart_upload
 
 router = APIRouter()
 
+# 长轮询最长等待时间(秒)
+MAX_STATUS_WAIT = 60
 
-@router.post("/upscale", response_model=UpscaleResponse)
-async def upscale_image(file: UploadFile = File(...)):
-    """图片放大处理"""
+# SSE心跳间隔(秒)
+SSE_KEEPALIVE_INTERVAL = 15
+
+# 内联模式下检查客户端是否断开连接的间隔(秒)
+DISCONNECT_POLL_INTERVAL = 1.0
+
+# 输出倍数范围
+MIN_OUTSCALE, MAX_OUTSCALE = 1.0, 8.0
+
+# 上传表单（请求体由接口流式解析，不经过FastAPI的表单参数，在此声明供文档使用）
+UPSCALE_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "ai_model_name": {
+                            "type": "string",
+                            "description": "使用的AI模型：RealESRGAN_x4plus_anime_6B、RealESRGAN_x4plus、"
+                                           "RealESRGAN_x2plus，默认为配置的模型",
+                        },
+                        "outscale": {
+                            "type": "number",
+                            "minimum": MIN_OUTSCALE,
+                            "maximum": MAX_OUTSCALE,
+                            "description": "输出倍数(1-8)，默认为模型自身倍数",
+                        },
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+def _parse_outscale(value: Optional[str]) -> Optional[float]:
+    """解析表单中的输出倍数，未填写时为None"""
+    if not value:
+        return None
+    try:
+        outscale = float(value)
+    except ValueError:
+        raise ValidationError(f"输出倍数无效: {value}")
+    if not MIN_OUTSCALE <= outscale <= MAX_OUTSCALE:
+        raise ValidationError(f"输出倍数须在{MIN_OUTSCALE:g}到{MAX_OUTSCALE:g}之间: {value}")
+    return outscale
+
+
+async def _wait_unless_disconnected(request: Request, pending: "asyncio.Future[bytes]") -> bytes:
+    """等待内联任务的结果，客户端断开连接时取消任务
+
+    Starlette不会因客户端断开而取消普通（非流式）接口，需要主动检查；
+    取消后排队中的任务被跳过，处理中的任务在下一个瓦片之间中止。
+    """
+    while True:
+        done, _ = await asyncio.wait({pending}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return pending.result()
+        if await request.is_disconnected():
+            pending.cancel()
+            raise TaskCancelledError("客户端已断开连接")
+
+
+@router.post("/upscale", response_model=UpscaleResponse, openapi_extra=UPSCALE_FORM)
+async def upscale_image(
+    request: Request,
+    response: Literal["task", "inline"] = Query(
+        default="task",
+        description="响应模式：task返回任务ID异步处理；inline同步等待并直接返回放大后的图片"
+    )
+):
+    """图片放大处理
+    
+    请求体边到达边解析并保存在内存中：文件格式、大小和图片尺寸在接收过程中
+    检查，超限时不再接收剩余内容。
+    """
     
     # 检查模型是否已加载
-    if not model_manager.is_loaded:
+    model_status = task_manager.model_status
+    if model_status == "loading":
+        raise HTTPException(
+            status_code=503,
+            detail="AI模型加载中，请稍后重试",
+            headers={"Retry-After": str(settings.ready_retry_after)},
+        )
+    if model_status == "failed":
         raise HTTPException(status_code=503, detail="AI模型未加载")
     
-    # 检查文件类型
-    file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in settings.allowed_extensions:
-        raise FileUploadError(f"不支持的文件格式: {file_ext}")
+    # 流式解析请求体，边接收边检查文件格式、大小和图片尺寸
+    upload = await read_multipart_upload(
+        request, "file", settings.allowed_extensions,
+        settings.max_file_size, settings.max_input_pixels
+    )
+    content = upload.content
+    file_ext = Path(upload.filename).suffix.lower()
+    outscale = _parse_outscale(upload.fields.get("outscale"))
     
-    # 检查文件大小
-    file_size = 0
-    content = await file.read()
-    file_size = len(content)
+    # 检查模型名称，未加载的模型在处理时按需加载；未指定时由规划器选择
+    ai_model_name = upload.fields.get("ai_model_name")
+    model_name = model_manager.resolve(ai_model_name) if ai_model_name else None
     
-    if file_size > settings.max_file_size:
-        raise FileUploadError(f"文件大小超出限制: {file_size} > {settings.max_file_size}")
+    # 检查任务队列是否已满
+    if task_manager.is_full:
+        raise HTTPException(status_code=503, detail="任务队列已满，请稍后重试")
     
     # 生成任务ID
     task_id = str(uuid.uuid4())
     
-    try:
-        # 保存上传的文件
-        input_path = settings.upload_dir / f"{task_id}_input{file_ext}"
-        with open(input_path, "wb") as f:
-            f.write(content)
-        
-        # TODO: 这里应该使用异步任务处理，现在先简化处理
-        # 处理图片
-        upsampler = model_manager.upsampler
-        if upsampler is None:
-            raise ImageProcessingError("AI模型未初始化")
-        
-        # 读取并处理图片
-        import cv2
-        img = cv2.imread(str(input_path), cv2.IMREAD_COLOR)
-        if img is None:
-            raise ImageProcessingError("无法读取图片文件")
-        
-        # AI处理
-        output, _ = upsampler.enhance(img, outscale=settings.model_scale)
-        
-        # 保存处理结果
-        output_path = settings.output_dir / f"{task_id}_output{file_ext}"
-        cv2.imwrite(str(output_path), output)
-        
-        return UpscaleResponse(
-            task_id=task_id,
-            status="completed",
-            message="图片处理完成",
-            download_url=f"/download/{task_id}",
-            estimated_time=None
+    # 同步内联模式：在内存中编码，结果直接随本次响应返回，响应发送后再保存供下载
+    if response == "inline":
+        data = await _wait_unless_disconnected(request, asyncio.ensure_future(
+            task_manager.run_inline(task_id, content, file_ext, model_name=model_name, outscale=outscale)
+        ))
+        return Response(
+            content=data,
+            media_type=media_type_for(file_ext),
+            headers={
+                "X-Task-Id": task_id,
+                "Content-Disposition": f'inline; filename="upscaled_{task_id}{file_ext}"'
+            },
+            background=BackgroundTask(task_manager.store_inline, task_id, data, file_ext)
         )
-        
-    except Exception as e:
-        raise ImageProcessingError(f"图片处理失败: {str(e)}")
+    
+    # 提交任务：缓存命中时直接完成，否则由推理工作池异步处理
+    task = await task_manager.submit(
+        task_id, content, file_ext, input_filename=upload.filename,
+        model_name=model_name, outscale=outscale
+    )
+    
+    return UpscaleResponse(
+        task_id=task_id,
+        status=task.status,
+        message=task.message if task.is_finished else "任务已提交，正在处理中",
+        download_url=task.download_url,
+        estimated_time=None
+    )
 
 
 @router.get("/download/{task_id}")
 async def download_result(task_id: str):
     """下载处理结果"""
     
-    # 查找输出文件
-    output_files = list(settings.output_dir.glob(f"{task_id}_output.*"))
+    # 从索引查找输出文件
+    artifact = artifact_index.get(task_id)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
     
-    if not output_files:
+    if not artifact.path.exists():
+        # 文件已被外部删除，同步移除索引
+        artifact_index.remove(task_id, delete_file=False)
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    output_file = output_files[0]
+    artifact_index.touch(task_id)
     
     return FileResponse(
-        path=str(output_file),
+        path=str(artifact.path),
         media_type="application/octet-stream",
-        filename=f"upscaled_{task_id}{output_file.suffix}"
+        filename=f"upscaled_{task_id}{artifact.format}"
     )
 
 
-@router.get("/status/{task_id}")
-async def get_task_status(task_id: str):
-    """获取任务状态 - 简化版本"""
+@router.delete("/task/{task_id}", response_model=SuccessResponse)
+async def delete_task(task_id: str):
+    """取消或删除任务
+    
+    排队中或处理中的任务被取消（处理中的任务在当前瓦片完成后中止）；
+    已结束的任务删除其记录和结果文件。
+    """
     
-    # 检查输出文件是否存在
-    output_files = list(settings.output_dir.glob(f"{task_id}_output.*"))
+    task = task_manager.get_task(task_id)
+    if task is not None and not task.is_finished:
+        task = task_manager.cancel(task_id)
+        return SuccessResponse(
+            message="任务已取消",
+            data={"task_id": task_id, "status": task.status}
+        )
+    
+    if not task_manager.remove(task_id):
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return SuccessResponse(message="任务已删除", data={"task_id": task_id})
+
+
+def _artifact_status(task_id: str) -> dict:
+    """任务记录不存在时（例如服务重启前完成的任务），从结果文件索引构造状态"""
+    artifact = artifact_index.get(task_id)
     
-    if output_files:
+    if artifact is not None:
         return {
             "task_id": task_id,
             "status": "completed",
             "progress": 100.0,
             "message": "处理完成",
+            "output_filename": artifact.path.name,
+            "output_size": f"{artifact.size / 1024:.1f}KB",
+            "completed_at": datetime.fromtimestamp(artifact.created_at).isoformat(),
             "download_url": f"/download/{task_id}"
         }
     else:
@@ -116,4 +235,89 @@ async def get_task_status(task_id: str):
             "status": "not_found",
             "progress": 0.0,
             "message": "任务不存在"
-        } 
\ No newline at end of file
+        }
+
+
+@router.post("/status/bulk", response_model=BulkStatusResponse, response_model_exclude_none=True)
+async def get_bulk_status(request: BulkStatusRequest):
+    """批量查询任务状态
+    
+    传入since游标时只返回此后状态发生变化的任务；响应中的cursor供下次查询使用。
+    游标大于服务端当前序号（例如服务已重启）时返回全部任务。
+    """
+    
+    cursor = task_manager.sequence
+    since = request.since if request.since is not None and request.since <= cursor else None
+    
+    tasks = []
+    for task_id in dict.fromkeys(request.task_ids):
+        task = task_manager.get_task(task_id)
+        if task is not None:
+            if since is not None and not task_manager.changed_since(task_id, since):
+                continue
+            tasks.append(TaskBrief(
+                task_id=task_id,
+                status=task.status,
+                progress=task.progress,
+                download_url=task.download_url,
+                message=task.message if task.status in (TaskState.FAILED, TaskState.CANCELLED) else None
+            ))
+        elif since is None:
+            # 没有内存记录的任务不会再变化，只在全量查询时返回
+            tasks.append(TaskBrief(**_artifact_status(task_id)))
+    
+    return BulkStatusResponse(cursor=cursor, tasks=tasks)
+
+
+@router.get("/status/{task_id}")
+async def get_task_status(
+    task_id: str,
+    wait: float = Query(
+        default=0,
+        ge=0,
+        le=MAX_STATUS_WAIT,
+        description="长轮询最长等待秒数，任务结束或超时即返回"
+    )
+):
+    """获取任务状态"""
+    
+    if wait > 0:
+        task = await task_manager.wait_until_finished(task_id, wait)
+    else:
+        task = task_manager.get_task(task_id)
+    
+    if task is not None:
+        return task
+    return _artifact_status(task_id)
+
+
+@router.get("/status/{task_id}/events")
+async def stream_task_status(task_id: str, request: Request):
+    """通过Server-Sent Events推送任务状态，任务结束后关闭连接"""
+    
+    async def event_stream():
+        version = -1
+        while True:
+            task = task_manager.get_task(task_id)
+            if task is None:
+                yield f"event: status\ndata: {json.dumps(_artifact_status(task_id), ensure_ascii=False)}\n\n"
+                return
+            
+            current = task_manager.get_version(task_id)
+            if current != version:
+                version = current
+                yield f"event: status\ndata: {task.json()}\n\n"
+            if task.is_finished:
+                return
+            
+            changed = await task_manager.wait_for_change(task_id, version, SSE_KEEPALIVE_INTERVAL)
+            if await request.is_disconnected():
+                return
+            if not changed:
+                yield ": keepalive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -3,6 +3,7 @@
 使用Pydantic Settings进行类型安全的配置管理
 """
 
+import os
 from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional, Union
@@ -34,13 +35,42 @@ class Settings(BaseSettings):
     model_name: str = Field(default="RealESRGAN_x4plus_anime_6B.pth", description="模型文件名")
     model_scale: int = Field(default=4, description="放大倍数")
     use_half_precision: bool = Field(default=True, description="使用半精度")
-    tile_size: int = Field(default=0, description="瓦片大小")
+    engine: str = Field(default="auto", description="推理引擎：auto(无GPU时使用cpu)、torch、cpu、onnx")
+    cpu_precision: str = Field(default="fp32", description="CPU引擎的推理精度：fp32、bf16、int8")
+    model_compile: str = Field(default="none", description="CPU引擎的模型编译方式：none、jit、compile")
+    compile_cache_size: int = Field(default=8, description="按输入形状缓存的编译结果数量上限")
+    serialize_models: bool = Field(default=True, description="保存可直接运行的预序列化模型，再次加载时跳过权重解析、量化和校准")
+    warmup_sizes: Union[List[int], str] = Field(default=[], description="加载后预热推理的输入边长(逗号分隔，空为探测尺寸和固定瓦片尺寸)")
+    warmup_runs: int = Field(default=2, description="每个预热尺寸的推理次数(0为不预热)")
+    max_loaded_models: int = Field(default=2, description="同时驻留内存的最大模型数")
+    model_memory_budget: int = Field(default=1024 * 1024 * 1024, description="驻留模型权重总大小上限(字节)，0表示不限制")
+    model_idle_timeout: int = Field(default=0, description="模型空闲多久后卸载(秒)，下次请求时重新加载，0为不卸载")
+    tile_size: Union[int, str] = Field(default="auto", description="瓦片大小(0为整图推理，auto为按图片尺寸和可用内存自动选择)")
+    min_tile_size: int = Field(default=64, description="瓦片大小下限")
+    outscale_chain_max_seconds: float = Field(default=30.0, description="输出倍数超过模型倍数时两次推理的预估耗时上限(秒)，超出则单次推理后缩放")
     tile_pad: int = Field(default=10, description="瓦片填充")
     pre_pad: int = Field(default=0, description="预填充")
     
     # 并发配置
     max_workers: Optional[int] = Field(default=2, description="最大工作进程数")
     auto_detect_workers: bool = Field(default=True, description="自动检测工作进程数")
+    max_queue_size: int = Field(default=100, description="任务队列最大长度")
+    server_workers: int = Field(default=1, description="uvicorn工作进程数(各进程以内存映射方式共享预序列化模型的权重)")
+    use_worker_processes: bool = Field(default=False, description="在独立进程中执行推理(每个工作一个进程，各自加载模型)")
+    ready_retry_after: int = Field(default=5, description="模型加载中时503响应的Retry-After(秒)")
+    
+    # 微批处理配置
+    batch_max_size: int = Field(default=4, description="微批处理最大批大小(1为关闭)")
+    batch_max_wait_ms: float = Field(default=5.0, description="微批处理最长等待时间(毫秒)")
+    # 合批不再填充输入，以下两项不再生效，保留以兼容已有的配置文件
+    batch_bucket_size: int = Field(default=32, description="已不再使用")
+    batch_max_image_side: int = Field(default=512, description="已不再使用")
+    
+    # CPU线程配置
+    cpu_threads: int = Field(default=0, description="单次前向计算的线程数(0为按工作数均分CPU核心)")
+    cpu_interop_threads: int = Field(default=1, description="torch inter-op线程数")
+    onnx_threads: int = Field(default=0, description="ONNX Runtime intra-op线程数(0与cpu_threads的划分相同)")
+    opencv_threads: int = Field(default=1, description="OpenCV线程数(0为单线程)")
     
     # GPU配置
     gpu_id: int = Field(default=0, description="GPU设备ID")
@@ -49,7 +79,18 @@ class Settings(BaseSettings):
     # 任务配置
     task_timeout: int = Field(default=300, description="任务超时时间(秒)")
     cleanup_interval: int = Field(default=3600, description="清理间隔(秒)")
+    artifact_ttl: int = Field(default=86400, description="上传文件和结果文件保留时间(秒)，0表示不按时间清理")
+    output_quota: int = Field(default=10 * 1024 * 1024 * 1024, description="输出目录容量上限(字节)")
+    upload_quota: int = Field(default=1024 * 1024 * 1024, description="上传目录容量上限(字节)")
+    cleanup_batch_size: int = Field(default=1000, description="清理时每批处理的文件数")
+    cleanup_scan_limit: int = Field(default=100000, description="每轮清理最多读取的目录项数，下一轮从停下的位置继续扫描")
     max_file_size: int = Field(default=50 * 1024 * 1024, description="最大文件大小(字节)")
+    max_input_pixels: int = Field(default=4096 * 4096, description="输入图片最大像素数(宽x高)")
+    save_uploads: bool = Field(default=False, description="将上传原图保存到上传目录(调试/审计)")
+    
+    # 结果缓存配置
+    cache_enabled: bool = Field(default=True, description="启用结果缓存")
+    cache_max_size: int = Field(default=2 * 1024 * 1024 * 1024, description="结果缓存最大容量(字节)")
     
     # 支持的文件格式
     allowed_extensions: Union[List[str], str] = Field(
@@ -83,6 +124,53 @@ class Settings(BaseSettings):
             v = [".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp"]
         return [ext if ext.startswith('.') else f'.{ext}' for ext in v]
     
+    @validator("tile_size", pre=True)
+    def parse_tile_size(cls, v):
+        """解析瓦片大小：非负整数或auto"""
+        if isinstance(v, str):
+            v = v.strip().lower()
+            if v == "auto":
+                return v
+            v = int(v)
+        if v < 0:
+            raise ValueError("tile_size必须为非负整数或auto")
+        return v
+    
+    @validator("engine")
+    def parse_engine(cls, v):
+        """校验推理引擎"""
+        v = v.strip().lower()
+        if v not in ("auto", "torch", "cpu", "onnx"):
+            raise ValueError("engine必须为auto、torch、cpu或onnx")
+        return v
+    
+    @validator("cpu_precision")
+    def parse_cpu_precision(cls, v):
+        """校验CPU推理精度"""
+        v = v.strip().lower()
+        if v not in ("fp32", "bf16", "int8"):
+            raise ValueError("cpu_precision必须为fp32、bf16或int8")
+        return v
+    
+    @validator("model_compile")
+    def parse_model_compile(cls, v):
+        """校验模型编译方式"""
+        v = v.strip().lower()
+        if v not in ("none", "jit", "compile"):
+            raise ValueError("model_compile必须为none、jit或compile")
+        return v
+    
+    @validator("warmup_sizes", pre=True)
+    def parse_warmup_sizes(cls, v):
+        """解析逗号分隔的预热尺寸"""
+        if isinstance(v, int):
+            v = [v]
+        elif isinstance(v, str):
+            v = [int(size) for size in v.split(',') if size.strip()]
+        if any(size <= 0 for size in v):
+            raise ValueError("warmup_sizes必须为正整数")
+        return v
+    
     @validator("cors_origins", pre=True)
     def parse_cors_origins(cls, v):
         """解析逗号分隔的CORS源"""
@@ -97,10 +185,43 @@ class Settings(BaseSettings):
         """获取模型文件完整路径"""
         return self.model_dir / self.model_name
     
+    @property
+    def auto_tile(self) -> bool:
+        """是否按请求自动选择瓦片大小"""
+        return self.tile_size == "auto"
+    
+    @property
+    def fixed_tile_size(self) -> int:
+        """固定瓦片大小（自动模式下为0）"""
+        return 0 if self.auto_tile else self.tile_size
+    
+    @property
+    def serialized_model_dir(self) -> Path:
+        """获取预序列化模型目录"""
+        return self.model_dir / "serialized"
+    
+    @property
+    def cache_dir(self) -> Path:
+        """获取结果缓存目录"""
+        return self.output_dir / "cache"
+    
+    @property
+    def worker_count(self) -> int:
+        """获取实际使用的推理工作数"""
+        if not self.auto_detect_workers:
+            return max(1, self.max_workers or 1)
+        
+        # 自动检测：每两个CPU核心分配一个工作，不超过max_workers
+        detected = max(1, (os.cpu_count() or 1) // 2)
+        if self.max_workers:
+            detected = min(detected, self.max_workers)
+        return detected
+    
     def create_directories(self):
         """创建必要的目录"""
         self.upload_dir.mkdir(parents=True, exist_ok=True)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
     
     class Config:
         env_file = ["config.env", ".env"]
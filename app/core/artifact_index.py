@@ -0,0 +1,218 @@
+"""
+结果文件索引
+维护任务ID到输出文件的内存索引，避免每次查询都扫描输出目录
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# 输出文件命名规则: {task_id}_output{ext}
+_OUTPUT_MARKER = "_output"
+
+
+@dataclass
+class ArtifactInfo:
+    """输出文件信息"""
+
+    task_id: str
+    path: Path
+    size: int
+    format: str
+    created_at: float
+    accessed_at: float
+
+
+class ArtifactIndex:
+    """任务结果文件索引
+
+    启动时扫描一次输出目录重建索引，之后由写入和删除操作同步维护，
+    状态查询和下载均为O(1)查找。多个服务进程共用输出目录时，其他进程
+    写入的文件在查找未命中时按文件名检查并登记。
+    """
+
+    def __init__(self, output_dir: Path):
+        self._output_dir = output_dir
+        self._artifacts: Dict[str, ArtifactInfo] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._artifacts)
+
+    @property
+    def total_bytes(self) -> int:
+        """索引中所有文件的总大小（字节）"""
+        return self._total_bytes
+
+    @staticmethod
+    def parse_task_id(filename: str) -> Optional[str]:
+        """从输出文件名解析任务ID"""
+        stem, _, _ = filename.rpartition(".")
+        if not stem.endswith(_OUTPUT_MARKER):
+            return None
+        return stem[:-len(_OUTPUT_MARKER)] or None
+
+    def rebuild(self):
+        """扫描输出目录重建索引（扫描期间新写入的文件保留在索引中）"""
+        with self._lock:
+            known = set(self._artifacts)
+        artifacts = {}
+        with os.scandir(self._output_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                task_id = self.parse_task_id(entry.name)
+                if task_id is None:
+                    continue
+                stat = entry.stat()
+                artifacts[task_id] = ArtifactInfo(
+                    task_id=task_id,
+                    path=Path(entry.path),
+                    size=stat.st_size,
+                    format=Path(entry.name).suffix,
+                    created_at=stat.st_mtime,
+                    # 最近一次下载时间（见touch）
+                    accessed_at=stat.st_atime,
+                )
+
+        with self._lock:
+            for task_id, info in self._artifacts.items():
+                if task_id not in artifacts and task_id not in known:
+                    artifacts[task_id] = info
+            self._artifacts = artifacts
+            self._total_bytes = sum(info.size for info in artifacts.values())
+        logger.info(f"结果文件索引已重建: {len(artifacts)} 个文件")
+
+    def observe(self, files: Iterable[Tuple[str, os.stat_result]]):
+        """登记增量扫描读到的输出文件
+
+        索引外的文件（其他服务进程写入）加入索引；已登记的文件按文件访问时间
+        更新最近下载时间（其他进程的下载写入了访问时间，见touch）。
+        """
+        with self._lock:
+            for name, stat in files:
+                task_id = self.parse_task_id(name)
+                if task_id is None:
+                    continue
+                info = self._artifacts.get(task_id)
+                if info is None:
+                    self._artifacts[task_id] = ArtifactInfo(
+                        task_id=task_id,
+                        path=self._output_dir / name,
+                        size=stat.st_size,
+                        format=Path(name).suffix,
+                        created_at=stat.st_mtime,
+                        accessed_at=stat.st_atime,
+                    )
+                    self._total_bytes += stat.st_size
+                elif stat.st_atime > info.accessed_at:
+                    info.accessed_at = stat.st_atime
+
+    def prune(self, seen: Set[str]):
+        """一遍增量扫描结束后，移除文件已被删除（例如被其他服务进程清理）的索引项
+
+        Args:
+            seen: 这一遍扫描读到的文件名
+        """
+        for info in self.snapshot():
+            if info.path.name not in seen and not info.path.exists():
+                self.remove(info.task_id, delete_file=False)
+
+    def add(self, task_id: str, path: Path) -> ArtifactInfo:
+        """登记新写入的输出文件"""
+        stat = path.stat()
+        info = ArtifactInfo(
+            task_id=task_id,
+            path=path,
+            size=stat.st_size,
+            format=path.suffix,
+            created_at=stat.st_mtime,
+            accessed_at=time.time(),
+        )
+        with self._lock:
+            previous = self._artifacts.get(task_id)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            self._artifacts[task_id] = info
+            self._total_bytes += info.size
+        return info
+
+    def get(self, task_id: str) -> Optional[ArtifactInfo]:
+        """查找任务的输出文件，索引中没有时检查输出目录（其他进程写入的文件）"""
+        info = self._artifacts.get(task_id)
+        if info is None:
+            info = self._discover(task_id)
+        return info
+
+    def _discover(self, task_id: str) -> Optional[ArtifactInfo]:
+        """按输出文件命名规则查找并登记索引外的文件"""
+        # 任务ID来自URL，不能包含路径
+        if not task_id or Path(task_id).name != task_id:
+            return None
+        for ext in settings.allowed_extensions:
+            path = self._output_dir / f"{task_id}{_OUTPUT_MARKER}{ext}"
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            info = ArtifactInfo(
+                task_id=task_id,
+                path=path,
+                size=stat.st_size,
+                format=ext,
+                created_at=stat.st_mtime,
+                accessed_at=stat.st_atime,
+            )
+            with self._lock:
+                if task_id not in self._artifacts:
+                    self._artifacts[task_id] = info
+                    self._total_bytes += info.size
+                return self._artifacts[task_id]
+        return None
+
+    def touch(self, task_id: str):
+        """记录一次下载访问
+
+        下载时间同时写入文件的访问时间（保留修改时间），重启后重建索引时
+        恢复最近下载顺序；relatime/noatime挂载下读取文件不会更新访问时间。
+        """
+        info = self._artifacts.get(task_id)
+        if info is None:
+            return
+        info.accessed_at = time.time()
+        try:
+            os.utime(info.path, (info.accessed_at, info.created_at))
+        except OSError:
+            # 文件已被删除，下次查找或清理时移除
+            pass
+
+    def remove(self, task_id: str, delete_file: bool = True) -> Optional[ArtifactInfo]:
+        """移除索引项，默认同时删除文件"""
+        with self._lock:
+            info = self._artifacts.pop(task_id, None)
+            if info is not None:
+                self._total_bytes -= info.size
+        if info is not None and delete_file:
+            try:
+                info.path.unlink()
+            except FileNotFoundError:
+                pass
+        return info
+
+    def snapshot(self) -> List[ArtifactInfo]:
+        """获取当前索引项列表的快照"""
+        with self._lock:
+            return list(self._artifacts.values())
+
+
+# 全局结果文件索引实例
+artifact_index = ArtifactIndex(settings.output_dir)
@@ -0,0 +1,132 @@
+"""
+动态微批处理器
+将来自不同请求、形状相同的瓦片合并为一个批次，单次前向计算后再分发结果
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """动态微批处理器
+
+    所有前向计算都在批处理线程中执行。提交方拿到Future，在等待窗口
+    (max_wait_ms) 内到达的同形状输入会被拼接为一个批次，批大小不超过
+    max_batch_size。增大等待时间可以用少量延迟换取更高的吞吐。
+    """
+
+    def __init__(self, forward: Callable[[torch.Tensor], torch.Tensor],
+                 max_batch_size: int, max_wait_ms: float):
+        self._forward = forward
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        # 统计信息
+        self._batches = 0
+        self._items = 0
+
+    @property
+    def is_running(self) -> bool:
+        """检查批处理线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动批处理线程"""
+        if self.is_running:
+            return
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"微批处理已启动，最大批大小: {self.max_batch_size}，"
+            f"最长等待: {self.max_wait * 1000:.1f}ms"
+        )
+
+    def stop(self):
+        """停止批处理线程"""
+        if not self.is_running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, tensor: torch.Tensor) -> Future:
+        """提交单个输入 (1, C, H, W)，返回输出张量的Future"""
+        future: Future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def get_stats(self) -> dict:
+        """获取批处理统计信息"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+        }
+
+    def _collect(self, first) -> Tuple[List, bool]:
+        """在等待窗口内收集一批输入"""
+        items = [first]
+        stop = False
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            items.append(item)
+        return items, stop
+
+    def _run(self):
+        """批处理线程主循环"""
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+
+            items, stop = self._collect(first)
+
+            # 按形状和类型分组，每组一次前向计算
+            groups: Dict[tuple, List] = {}
+            for tensor, future in items:
+                if future.set_running_or_notify_cancel():
+                    groups.setdefault((tuple(tensor.shape), tensor.dtype), []).append((tensor, future))
+
+            for group in groups.values():
+                self._run_group(group)
+
+            if stop:
+                break
+
+    def _run_group(self, group: List):
+        """对同形状的一组输入执行一次前向计算并分发结果"""
+        try:
+            batch = torch.cat([tensor for tensor, _ in group], dim=0)
+            with torch.no_grad():
+                output = self._forward(batch)
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+
+        self._batches += 1
+        self._items += len(group)
+        for i, (_, future) in enumerate(group):
+            future.set_result(output[i:i + 1])
@@ -0,0 +1,143 @@
+"""
+CPU推理优化
+线程划分、channels_last内存格式，以及按输入形状缓存的模型编译
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Set, Tuple
+
+import cv2
+import torch
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_threads_configured = False
+
+
+def intra_op_threads() -> int:
+    """单次前向计算使用的线程数"""
+    if settings.cpu_threads > 0:
+        return settings.cpu_threads
+    # 多个uvicorn工作进程均分核心
+    cores = max(1, (os.cpu_count() or 1) // max(1, settings.server_workers))
+    # 进程模式下各推理进程均分核心；线程模式下开启合批时前向计算
+    # 由合批线程串行执行，可以使用全部核心，否则由各工作线程并发执行
+    if settings.use_worker_processes or settings.batch_max_size <= 1:
+        return max(1, cores // settings.worker_count)
+    return cores
+
+
+def configure_threads():
+    """设置torch和OpenCV的线程数，避免推理、解码和编码线程争抢核心（只执行一次）"""
+    global _threads_configured
+    if _threads_configured:
+        return
+    _threads_configured = True
+
+    threads = intra_op_threads()
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(max(1, settings.cpu_interop_threads))
+    except RuntimeError:
+        # 已执行过并行计算后不能再修改
+        logger.debug("inter-op线程数已固定，跳过设置")
+    cv2.setNumThreads(max(0, settings.opencv_threads))
+    logger.info(
+        f"CPU线程划分: intra-op {threads}，inter-op {torch.get_num_interop_threads()}，"
+        f"OpenCV {cv2.getNumThreads()}"
+    )
+
+
+class CompiledModel(torch.nn.Module):
+    """CPU推理的模型包装
+
+    输入转换为channels_last格式；开启编译时按输入形状缓存编译结果。
+    同一形状第二次出现时才编译，整图推理中只出现一次的尺寸不付出
+    编译开销；缓存超出上限时淘汰最久未使用的形状。
+    """
+
+    def __init__(self, model: torch.nn.Module, mode: str = "none", max_shapes: int = 8):
+        super().__init__()
+        self.model = model
+        self.mode = mode
+        self.max_shapes = max(1, max_shapes)
+        self._compiled: "OrderedDict[Tuple, Callable]" = OrderedDict()
+        self._seen: Dict[Tuple, int] = {}
+        self._building: Set[Tuple] = set()
+        self._failed: Set[Tuple] = set()
+        self._lock = threading.Lock()
+        self.compile_seconds = 0.0
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.contiguous(memory_format=torch.channels_last)
+        return self._lookup(x)(x).contiguous()
+
+    def _lookup(self, x: torch.Tensor) -> Callable:
+        """获取输入形状对应的编译结果，尚未编译时返回原模型"""
+        if self.mode == "none":
+            return self.model
+
+        key = (tuple(x.shape), x.dtype)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                return compiled
+            self._seen[key] = self._seen.get(key, 0) + 1
+            if self._seen[key] < 2 or key in self._building or key in self._failed:
+                return self.model
+            self._building.add(key)
+
+        try:
+            compiled = self._compile(x)
+        except Exception as e:
+            logger.warning(f"模型编译失败，形状 {key[0]} 使用未编译模型: {e}")
+            with self._lock:
+                self._building.discard(key)
+                self._failed.add(key)
+            return self.model
+
+        with self._lock:
+            self._building.discard(key)
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.max_shapes:
+                evicted, _ = self._compiled.popitem(last=False)
+                self._seen.pop(evicted, None)
+        return compiled
+
+    def _compile(self, x: torch.Tensor) -> Callable:
+        """按当前输入形状编译模型"""
+        started = time.perf_counter()
+        with torch.no_grad():
+            if self.mode == "jit":
+                # 不冻结，追踪结果与原模型共享权重
+                compiled = torch.jit.trace(self.model, x, check_trace=False)
+            else:
+                compiled = torch.compile(self.model, dynamic=False)
+            # 编译在第一次调用时完成，预先执行一次计入编译耗时
+            compiled(x)
+        elapsed = time.perf_counter() - started
+        self.compile_seconds += elapsed
+        logger.info(f"模型已编译({self.mode})，输入形状: {tuple(x.shape)}，耗时: {elapsed:.2f}秒")
+        return compiled
+
+    def get_stats(self) -> dict:
+        """获取编译缓存状态"""
+        return {
+            "mode": self.mode,
+            "compiled_shapes": [list(shape) for shape, _ in self._compiled],
+            "failed_shapes": len(self._failed),
+            "compile_seconds": round(self.compile_seconds, 3),
+        }
+
+
+def optimize_model(model: torch.nn.Module) -> CompiledModel:
+    """转换为channels_last格式并按配置包装编译"""
+    model = model.eval().to(memory_format=torch.channels_last)
+    return CompiledModel(model, settings.model_compile, settings.compile_cache_size)
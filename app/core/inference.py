@@ -0,0 +1,256 @@
+"""
+分块推理引擎
+按RealESRGANer.enhance的流程实现预处理、分块推理和后处理。
+中间状态保存在局部变量中，同一个upsampler可被多个线程复用，
+并且前向计算可以交给微批处理器跨请求合批。
+"""
+
+import math
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+from .batcher import MicroBatcher
+
+# 进度回调：(已完成瓦片数, 瓦片总数)
+ProgressCallback = Callable[[int, int], None]
+
+# 中止检查：每个瓦片提交前调用，抛出异常即中止推理（取消、超时）
+AbortCheck = Callable[[], None]
+
+
+class _Progress:
+    """瓦片级进度统计（RGBA图片的alpha通道单独计一遍）"""
+
+    def __init__(self, callback: Optional[ProgressCallback], passes: int,
+                 check: Optional[AbortCheck] = None):
+        self.callback = callback
+        self.passes = passes
+        self.check = check
+        self.done = 0
+        self.total = 0
+
+    def begin(self, tiles: int):
+        """开始一遍推理，登记本遍的瓦片数"""
+        self.total = tiles * self.passes
+
+    def checkpoint(self):
+        """瓦片之间的中止检查点"""
+        if self.check is not None:
+            self.check()
+
+    def step(self):
+        """完成一个瓦片"""
+        self.done += 1
+        if self.callback is not None:
+            self.callback(self.done, max(self.total, self.done))
+
+
+class _Forward:
+    """前向计算适配器：直接调用模型，或通过微批处理器合批
+
+    输入不做任何填充，只与形状相同的输入合批（填充区域会经感受野
+    影响有效区域的输出），因此合批与否输出完全一致。
+    """
+
+    def __init__(self, model: torch.nn.Module, scale: int,
+                 batcher: Optional[MicroBatcher] = None):
+        self.model = model
+        self.scale = scale
+        self.batcher = batcher
+
+    @property
+    def window(self) -> int:
+        """同一请求可同时提交的瓦片数"""
+        return self.batcher.max_batch_size if self.batcher else 1
+
+    def submit(self, tensor: torch.Tensor):
+        """提交输入，合批时返回输出的Future"""
+        if self.batcher is None:
+            with torch.no_grad():
+                return self.model(tensor)
+        return self.batcher.submit(tensor)
+
+    def result(self, handle) -> torch.Tensor:
+        """获取输出"""
+        return handle if self.batcher is None else handle.result()
+
+
+def _pre_process(img: np.ndarray, device: torch.device, half: bool,
+                 scale: int, pre_pad: int) -> Tuple[torch.Tensor, int, int]:
+    """预处理：转换为张量，进行预填充和整除填充"""
+    tensor = torch.from_numpy(np.transpose(img, (2, 0, 1))).float()
+    tensor = tensor.unsqueeze(0).to(device)
+    if half:
+        tensor = tensor.half()
+
+    if pre_pad != 0:
+        tensor = F.pad(tensor, (0, pre_pad, 0, pre_pad), "reflect")
+
+    mod_scale = {2: 2, 1: 4}.get(scale)
+    mod_pad_h, mod_pad_w = 0, 0
+    if mod_scale is not None:
+        _, _, h, w = tensor.size()
+        if h % mod_scale != 0:
+            mod_pad_h = mod_scale - h % mod_scale
+        if w % mod_scale != 0:
+            mod_pad_w = mod_scale - w % mod_scale
+        tensor = F.pad(tensor, (0, mod_pad_w, 0, mod_pad_h), "reflect")
+    return tensor, mod_pad_h, mod_pad_w
+
+
+def _whole_process(tensor: torch.Tensor, forward: _Forward, progress: _Progress) -> torch.Tensor:
+    """整图推理（与其他请求中尺寸相同的图片合批）"""
+    progress.begin(1)
+    progress.checkpoint()
+    output = forward.result(forward.submit(tensor))
+    progress.step()
+    return output
+
+
+def _tile_process(tensor: torch.Tensor, forward: _Forward, progress: _Progress,
+                  tile_size: int, tile_pad: int) -> torch.Tensor:
+    """分块推理：切分瓦片，逐块(或按窗口合批)推理后拼接"""
+    batch, channel, height, width = tensor.shape
+    scale = forward.scale
+    output = tensor.new_zeros((batch, channel, height * scale, width * scale))
+    tiles_x = math.ceil(width / tile_size)
+    tiles_y = math.ceil(height / tile_size)
+    progress.begin(tiles_x * tiles_y)
+
+    def place(spec, tile_output):
+        (in_x0, in_x1, in_y0, in_y1, pad_x0, pad_y0) = spec
+        out_x0 = (in_x0 - pad_x0) * scale
+        out_y0 = (in_y0 - pad_y0) * scale
+        output[:, :, in_y0 * scale:in_y1 * scale, in_x0 * scale:in_x1 * scale] = tile_output[
+            :, :, out_y0:out_y0 + (in_y1 - in_y0) * scale, out_x0:out_x0 + (in_x1 - in_x0) * scale
+        ]
+        progress.step()
+
+    pending = deque()
+    try:
+        for y in range(tiles_y):
+            for x in range(tiles_x):
+                progress.checkpoint()
+
+                # 瓦片在原图上的区域
+                in_x0 = x * tile_size
+                in_x1 = min(in_x0 + tile_size, width)
+                in_y0 = y * tile_size
+                in_y1 = min(in_y0 + tile_size, height)
+
+                # 带填充的区域
+                pad_x0 = max(in_x0 - tile_pad, 0)
+                pad_x1 = min(in_x1 + tile_pad, width)
+                pad_y0 = max(in_y0 - tile_pad, 0)
+                pad_y1 = min(in_y1 + tile_pad, height)
+
+                # 内部瓦片形状相同，可以合批；边缘瓦片与同形状的瓦片合批
+                handle = forward.submit(tensor[:, :, pad_y0:pad_y1, pad_x0:pad_x1])
+                pending.append(((in_x0, in_x1, in_y0, in_y1, pad_x0, pad_y0), handle))
+
+                while len(pending) >= forward.window:
+                    spec, handle = pending.popleft()
+                    place(spec, forward.result(handle))
+
+        while pending:
+            spec, handle = pending.popleft()
+            place(spec, forward.result(handle))
+    except BaseException:
+        # 中止时撤回尚未执行的合批请求
+        for _, handle in pending:
+            if isinstance(handle, Future):
+                handle.cancel()
+        raise
+
+    return output
+
+
+def _run_channels(img: np.ndarray, upsampler, forward: _Forward,
+                  progress: _Progress, tile_size: int) -> np.ndarray:
+    """对三通道浮点图片执行完整的推理流程，返回BGR浮点图片"""
+    scale = upsampler.scale
+    tensor, mod_pad_h, mod_pad_w = _pre_process(
+        img, upsampler.device, upsampler.half, scale, upsampler.pre_pad
+    )
+
+    if tile_size > 0:
+        output = _tile_process(tensor, forward, progress, tile_size, upsampler.tile_pad)
+    else:
+        output = _whole_process(tensor, forward, progress)
+
+    # 去除整除填充和预填充
+    _, _, h, w = output.size()
+    output = output[:, :, 0:h - mod_pad_h * scale, 0:w - mod_pad_w * scale]
+    if upsampler.pre_pad != 0:
+        _, _, h, w = output.size()
+        output = output[:, :, 0:h - upsampler.pre_pad * scale, 0:w - upsampler.pre_pad * scale]
+
+    output = output.data.squeeze().float().cpu().clamp_(0, 1).numpy()
+    return np.transpose(output[[2, 1, 0], :, :], (1, 2, 0))
+
+
+@torch.no_grad()
+def enhance(upsampler, img: np.ndarray, outscale: Optional[float] = None,
+            batcher: Optional[MicroBatcher] = None, tile_size: Optional[int] = None,
+            on_progress: Optional[ProgressCallback] = None,
+            check: Optional[AbortCheck] = None) -> Tuple[np.ndarray, str]:
+    """放大单张图片，行为与RealESRGANer.enhance一致
+
+    Args:
+        upsampler: 提供模型、设备和填充参数的RealESRGANer实例（不会被修改）
+        img: OpenCV格式(BGR/BGRA/灰度)的图片
+        outscale: 最终输出倍数，与模型倍数不同时使用Lanczos缩放
+        batcher: 微批处理器，为None时直接调用模型（合批不改变输出）
+        tile_size: 瓦片大小，为None时使用upsampler的设置
+        on_progress: 每完成一个瓦片调用一次，参数为(已完成数, 总数)
+        check: 每个瓦片提交前调用，抛出异常即中止推理
+    """
+    scale = upsampler.scale
+    tile_size = upsampler.tile_size if tile_size is None else tile_size
+    forward = _Forward(upsampler.model, scale, batcher)
+
+    h_input, w_input = img.shape[0:2]
+    img = img.astype(np.float32)
+    max_range = 65535 if np.max(img) > 256 else 255
+    img = img / max_range
+
+    if len(img.shape) == 2:
+        img_mode = "L"
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+    elif img.shape[2] == 4:
+        img_mode = "RGBA"
+        alpha = cv2.cvtColor(img[:, :, 3], cv2.COLOR_GRAY2RGB)
+        img = cv2.cvtColor(img[:, :, 0:3], cv2.COLOR_BGR2RGB)
+    else:
+        img_mode = "RGB"
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    progress = _Progress(on_progress, passes=2 if img_mode == "RGBA" else 1, check=check)
+    output_img = _run_channels(img, upsampler, forward, progress, tile_size)
+    if img_mode == "L":
+        output_img = cv2.cvtColor(output_img, cv2.COLOR_BGR2GRAY)
+
+    if img_mode == "RGBA":
+        output_alpha = _run_channels(alpha, upsampler, forward, progress, tile_size)
+        output_alpha = cv2.cvtColor(output_alpha, cv2.COLOR_BGR2GRAY)
+        output_img = cv2.cvtColor(output_img, cv2.COLOR_BGR2BGRA)
+        output_img[:, :, 3] = output_alpha
+
+    if max_range == 65535:
+        output = (output_img * 65535.0).round().astype(np.uint16)
+    else:
+        output = (output_img * 255.0).round().astype(np.uint8)
+
+    if outscale is not None and outscale != float(scale):
+        output = cv2.resize(
+            output, (int(w_input * outscale), int(h_input * outscale)),
+            interpolation=cv2.INTER_LANCZOS4
+        )
+
+    return output, img_mode
@@ -0,0 +1,253 @@
+"""
+结果文件清理器
+后台定期清理上传目录和输出目录，按保留时间和容量上限淘汰文件
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from .artifact_index import artifact_index
+from .result_cache import result_cache
+from .task_manager import task_manager
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryCursor:
+    """跨多轮清理续扫的目录游标
+
+    每次最多读取limit个目录项，下次从停下的位置继续，读完一遍后从头开始，
+    目录中有海量文件时每轮清理的扫描量也有上限。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries = None
+        self._seen: Set[str] = set()
+
+    def scan(self, limit: int) -> Tuple[List[Tuple[str, os.stat_result]], Optional[Set[str]]]:
+        """读取下一批文件
+
+        Returns:
+            (文件名, stat)列表；读完一遍时同时返回这一遍读到的全部文件名，否则为None
+        """
+        if self._entries is None:
+            if not self.path.exists():
+                return [], None
+            self._entries = os.scandir(self.path)
+            self._seen = set()
+
+        files = []
+        for _ in range(max(1, limit)):
+            entry = next(self._entries, None)
+            if entry is None:
+                self.close()
+                seen, self._seen = self._seen, set()
+                return files, seen
+            try:
+                if entry.is_file():
+                    files.append((entry.name, entry.stat()))
+                    self._seen.add(entry.name)
+            except FileNotFoundError:
+                pass
+        return files, None
+
+    def close(self):
+        """关闭未读完的扫描"""
+        if self._entries is not None:
+            self._entries.close()
+            self._entries = None
+
+
+class ArtifactJanitor:
+    """后台清理器
+
+    输出目录基于内存索引清理，按最近下载时间淘汰；上传目录按游标增量扫描，
+    扫描结果记在内存中，按修改时间淘汰。每轮最多读取cleanup_scan_limit个目录项，
+    所有文件操作都在线程池中分批执行，批次之间让出CPU，目录中有海量文件时
+    也不会阻塞服务。
+
+    多个服务进程（server_workers>1）共用输出和缓存目录，其他进程写入和删除的
+    文件同样按游标增量扫描同步到索引，容量上限按全部文件计算。
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._last_run: Optional[float] = None
+        self._last_result: dict = {}
+        self._outputs = DirectoryCursor(settings.output_dir)
+        self._cache = DirectoryCursor(settings.cache_dir)
+        self._upload_cursor = DirectoryCursor(settings.upload_dir)
+        # 上传目录中已扫描到的文件：文件名 -> (修改时间, 大小)
+        self._uploads: Dict[str, Tuple[float, int]] = {}
+
+    @property
+    def is_running(self) -> bool:
+        """检查清理任务是否在运行"""
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """启动后台清理任务"""
+        if self.is_running:
+            return
+        self._task = asyncio.create_task(self._run(), name="artifact-janitor")
+        logger.info(f"文件清理器已启动，清理间隔: {settings.cleanup_interval}秒")
+
+    async def stop(self):
+        """停止后台清理任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for cursor in (self._outputs, self._cache, self._upload_cursor):
+            cursor.close()
+
+    def get_stats(self) -> dict:
+        """获取清理器状态"""
+        return {
+            "running": self.is_running,
+            "last_run": self._last_run,
+            "last_result": self._last_result,
+            "output_bytes": artifact_index.total_bytes,
+            "output_files": len(artifact_index),
+            "output_quota": settings.output_quota,
+            "upload_quota": settings.upload_quota,
+            "artifact_ttl": settings.artifact_ttl,
+        }
+
+    async def _run(self):
+        """按清理间隔循环执行"""
+        while True:
+            await asyncio.sleep(settings.cleanup_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"文件清理失败: {e}", exc_info=True)
+
+    async def sweep(self) -> dict:
+        """执行一轮清理"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        if settings.server_workers > 1:
+            await loop.run_in_executor(None, self._sync_shared)
+
+        outputs = await loop.run_in_executor(None, self._sweep_outputs)
+        uploads = await loop.run_in_executor(None, self._sweep_uploads)
+        tasks = task_manager.prune(settings.artifact_ttl) if settings.artifact_ttl else 0
+
+        self._last_run = time.time()
+        self._last_result = {
+            "outputs_removed": outputs[0],
+            "outputs_freed_mb": round(outputs[1] / (1024 * 1024), 2),
+            "uploads_removed": uploads[0],
+            "uploads_freed_mb": round(uploads[1] / (1024 * 1024), 2),
+            "tasks_pruned": tasks,
+            "duration": round(time.perf_counter() - started, 3),
+        }
+        if outputs[0] or uploads[0] or tasks:
+            logger.info(f"文件清理完成: {self._last_result}")
+        return self._last_result
+
+    @staticmethod
+    def _yield_cpu(count: int):
+        """每处理一批文件让出一次CPU"""
+        if count % settings.cleanup_batch_size == 0:
+            time.sleep(0.001)
+
+    def _sync_shared(self):
+        """增量同步其他服务进程写入和删除的输出文件、缓存文件"""
+        files, seen = self._outputs.scan(settings.cleanup_scan_limit)
+        artifact_index.observe(files)
+        if seen is not None:
+            artifact_index.prune(seen)
+
+        if settings.cache_enabled:
+            files, seen = self._cache.scan(settings.cleanup_scan_limit)
+            result_cache.observe(files)
+            if seen is not None:
+                result_cache.prune(seen)
+
+    def _sweep_outputs(self) -> Tuple[int, int]:
+        """清理输出目录：先淘汰过期文件，再按最近下载时间淘汰超出容量的文件"""
+        now = time.time()
+        removed, freed = 0, 0
+        entries = artifact_index.snapshot()
+
+        if settings.artifact_ttl:
+            cutoff = now - settings.artifact_ttl
+            for i, info in enumerate(entries, 1):
+                if info.accessed_at < cutoff and artifact_index.remove(info.task_id) is not None:
+                    removed += 1
+                    freed += info.size
+                self._yield_cpu(i)
+
+        excess = artifact_index.total_bytes - settings.output_quota
+        if excess > 0:
+            # 按最近下载时间排序，最久未下载的先淘汰
+            candidates = sorted(
+                (info for info in entries if artifact_index.get(info.task_id) is info),
+                key=lambda a: a.accessed_at,
+            )
+            for i, info in enumerate(candidates, 1):
+                if artifact_index.total_bytes <= settings.output_quota:
+                    break
+                if artifact_index.remove(info.task_id) is not None:
+                    removed += 1
+                    freed += info.size
+                self._yield_cpu(i)
+
+        return removed, freed
+
+    def _sweep_uploads(self) -> Tuple[int, int]:
+        """按游标增量扫描上传目录：删除过期文件，超出容量时删除最旧的文件"""
+        now = time.time()
+        removed, freed = 0, 0
+        upload_dir: Path = settings.upload_dir
+
+        files, seen = self._upload_cursor.scan(settings.cleanup_scan_limit)
+        for name, stat in files:
+            self._uploads[name] = (stat.st_mtime, stat.st_size)
+        if seen is not None:
+            # 一遍扫描结束，移除已不存在的文件
+            for name in [name for name in self._uploads if name not in seen]:
+                if not (upload_dir / name).exists():
+                    del self._uploads[name]
+
+        def delete(name: str) -> int:
+            nonlocal removed, freed
+            _, size = self._uploads.pop(name)
+            try:
+                os.unlink(upload_dir / name)
+                removed += 1
+                freed += size
+            except FileNotFoundError:
+                pass
+            return size
+
+        if settings.artifact_ttl:
+            cutoff = now - settings.artifact_ttl
+            expired = [name for name, (mtime, _) in self._uploads.items() if mtime < cutoff]
+            for i, name in enumerate(expired, 1):
+                delete(name)
+                self._yield_cpu(i)
+
+        total = sum(size for _, size in self._uploads.values())
+        if total > settings.upload_quota:
+            oldest = sorted(self._uploads, key=lambda name: self._uploads[name])
+            for i, name in enumerate(oldest, 1):
+                if total <= settings.upload_quota:
+                    break
+                total -= delete(name)
+                self._yield_cpu(i)
+
+        return removed, freed
+
+
+# 全局清理器实例
+artifact_janitor = ArtifactJanitor()
@@ -3,110 +3,966 @@ AI模型管理器
 负责Real-ESRGAN模型的加载、初始化和管理
 """
 
+import copy
+import ctypes
+import ctypes.util
+import gc
+import queue
 import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
 import logging
 
 from ..config import settings
-from ..utils.exceptions import ModelLoadError
+from ..utils.exceptions import ImageProcessingError, ModelLoadError, ValidationError
+from .scale_planner import ModelCost, ScalePlan, choose_plan
+from .tiling import measure_activation_bytes, memory_budget, select_tile_size
 
-# 添加Real-ESRGAN路径
-sys.path.append(str(settings.project_root / "Real-ESRGAN"))
-
-try:
-    from basicsr.archs.rrdbnet_arch import RRDBNet
+if TYPE_CHECKING:
+    import torch
     from realesrgan import RealESRGANer
-except ImportError as e:
-    raise ImportError(f"无法导入Real-ESRGAN模块: {e}")
+
+    from .batcher import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
+# 加载时探测推理速度使用的输入边长
+_SPEED_PROBE_SIZE = 64
+
+# 推理速度的平滑系数
+_SPEED_SMOOTHING = 0.2
+
+# 驻留记录中保留的最近加载耗时数
+_LOAD_HISTORY = 10
+
+# 各架构在meta设备上的网络结构，加载预序列化模型时复制使用（构建结构本身耗时数百毫秒）
+_skeletons: Dict["ModelSpec", "torch.nn.Module"] = {}
+_skeletons_lock = threading.Lock()
+
+
+def _import_backend():
+    """导入PyTorch和Real-ESRGAN
+
+    这些库导入耗时数秒，推迟到首次加载模型时（后台任务中）导入，
+    服务启动时不必等待。
+    """
+    # 添加Real-ESRGAN路径
+    realesrgan_dir = str(settings.project_root / "Real-ESRGAN")
+    if realesrgan_dir not in sys.path:
+        sys.path.append(realesrgan_dir)
+
+    try:
+        import torch
+        from basicsr.archs.rrdbnet_arch import RRDBNet
+        from realesrgan import RealESRGANer
+    except ImportError as e:
+        raise ModelLoadError(f"无法导入Real-ESRGAN模块: {e}")
+    return torch, RRDBNet, RealESRGANer
+
+
+def _malloc_trim():
+    """将空闲的堆内存归还操作系统（仅glibc）
+
+    构建模型等一次性的大量分配释放后仍留在分配器中，会一直计入进程内存。
+    """
+    try:
+        ctypes.CDLL(ctypes.util.find_library("c")).malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+
+def _select_device(torch) -> "torch.device":
+    """推理设备，与RealESRGANer的选择规则一致"""
+    if not torch.cuda.is_available():
+        return torch.device("cpu")
+    return torch.device(f"cuda:{settings.gpu_id}" if settings.gpu_id else "cuda")
+
+
+def _make_upsampler(RealESRGANer, scale: int, model, device, half: bool) -> "RealESRGANer":
+    """用已加载的网络创建upsampler
+
+    RealESRGANer的构造函数总是重新读取.pth权重，这里只设置推理所需的属性，
+    使其直接使用预序列化或内存映射加载的网络。
+    """
+    upsampler = RealESRGANer.__new__(RealESRGANer)
+    upsampler.scale = scale
+    upsampler.tile_size = settings.fixed_tile_size
+    upsampler.tile_pad = settings.tile_pad
+    upsampler.pre_pad = settings.pre_pad
+    upsampler.mod_scale = None
+    upsampler.half = half
+    upsampler.device = device
+    upsampler.model = model
+    return upsampler
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """模型架构描述（RRDBNet）"""
+
+    name: str
+    scale: int
+    num_block: int
+    num_feat: int = 64
+    num_grow_ch: int = 32
+
+    @property
+    def filename(self) -> str:
+        """权重文件名"""
+        return f"{self.name}.pth"
+
+
+# 已知模型的架构，权重文件为 model_dir/{name}.pth
+MODEL_SPECS: Dict[str, ModelSpec] = {
+    spec.name: spec for spec in (
+        ModelSpec("RealESRGAN_x4plus_anime_6B", scale=4, num_block=6),
+        ModelSpec("RealESRGAN_x4plus", scale=4, num_block=23),
+        ModelSpec("RealESRGAN_x2plus", scale=2, num_block=23),
+    )
+}
+
+
+class LoadedModel:
+    """已加载的模型：upsampler实例池、微批处理器和激活内存模型"""
+
+    def __init__(self, spec: ModelSpec, path: Path, engine: str = "torch"):
+        self.spec = spec
+        self.path = path
+        self.engine = engine
+        self.upsampler: Optional["RealESRGANer"] = None
+        self.batcher: Optional["MicroBatcher"] = None
+        self.pool: "queue.Queue[RealESRGANer]" = queue.Queue()
+        self.pool_size = 0
+        # 每个输入像素的峰值激活内存（字节），加载时校准
+        self.activation_bytes = 0.0
+        # 权重占用内存（字节）
+        self.weight_bytes = 0
+        # 每个输入像素的推理耗时（秒），加载时探测，之后按实际推理平滑更新
+        self.seconds_per_pixel = 0.0
+        # CPU引擎的推理精度及其相对fp32的画质（PSNR/SSIM）
+        self.precision = "fp32"
+        self.quality: Optional[dict] = None
+        # 使用的预序列化模型文件，未启用或保存失败时为None
+        self.artifact: Optional[Path] = None
+        # 权重是否以内存映射方式与其他进程共享
+        self.shared_weights = False
+        self.load_time = 0.0
+        # 从开始加载到首次前向计算完成的耗时，以及预热耗时
+        self.first_inference_time = 0.0
+        self.warmup_time = 0.0
+        self.last_used = time.monotonic()
+        # 正在使用该模型的请求数，大于0时不会被淘汰
+        self.users = 0
+        # 已被重新加载的模型替换，最后一个请求结束后释放
+        self.retired = False
+
+    @property
+    def name(self) -> str:
+        return self.spec.name
+
+    @property
+    def scale(self) -> int:
+        return self.spec.scale
+
+    def load(self, seconds_per_pixel: float = 0.0):
+        """构建（或从预序列化模型加载）网络，预热后准备实例池
+
+        Args:
+            seconds_per_pixel: 空闲卸载前测得的推理速度；给定时跳过预热和速度探测，
+                由等待中的请求完成首次前向计算，使重新加载尽快完成
+        """
+        started = time.perf_counter()
+        torch, _, RealESRGANer = _import_backend()
+        from .batcher import MicroBatcher
+        from .cpu_engine import optimize_model
+        from .onnx_engine import load_onnx_model
+
+        # 半精度在CPU上没有加速
+        half = settings.use_half_precision and self.engine == "torch"
+        device = _select_device(torch)
+        net = self._load_network(device, half)
+        self.upsampler = _make_upsampler(RealESRGANer, self.spec.scale, net, device, half)
+
+        # CPU引擎：channels_last格式，按配置编译；
+        # ONNX引擎：导出后由onnxruntime推理，释放PyTorch模型
+        if self.engine == "cpu":
+            net = self.upsampler.model = optimize_model(net)
+        elif self.engine == "onnx":
+            net = self.upsampler.model = load_onnx_model(net, self.path)
+
+        # 为每个推理工作准备独立的upsampler实例（共享模型权重）
+        self.pool_size = settings.worker_count
+        self.pool.put(self.upsampler)
+        for _ in range(self.pool_size - 1):
+            self.pool.put(copy.copy(self.upsampler))
+
+        if seconds_per_pixel:
+            self.seconds_per_pixel = seconds_per_pixel
+        else:
+            self._warmup(net, started)
+            self.seconds_per_pixel = self._measure_speed(net)
+            if not self.first_inference_time:
+                self.first_inference_time = time.perf_counter() - started
+
+        # 跨请求微批处理：所有前向计算由批处理线程统一执行
+        if settings.batch_max_size > 1:
+            self.batcher = MicroBatcher(
+                net,
+                max_batch_size=settings.batch_max_size,
+                max_wait_ms=settings.batch_max_wait_ms
+            )
+            self.batcher.start()
+
+        self.load_time = time.perf_counter() - started
+
+    def _build_network(self) -> "torch.nn.Module":
+        """构建未加载权重的网络"""
+        _, RRDBNet, _ = _import_backend()
+        return RRDBNet(
+            num_in_ch=3,
+            num_out_ch=3,
+            num_feat=self.spec.num_feat,
+            num_block=self.spec.num_block,
+            num_grow_ch=self.spec.num_grow_ch,
+            scale=self.spec.scale
+        )
+
+    def _copy_skeleton(self) -> "torch.nn.Module":
+        """复制缓存的meta设备网络结构，供加载预序列化权重使用"""
+        import torch
+
+        with _skeletons_lock:
+            skeleton = _skeletons.get(self.spec)
+            if skeleton is None:
+                with torch.device("meta"):
+                    skeleton = _skeletons[self.spec] = self._build_network()
+        return copy.deepcopy(skeleton)
+
+    def _load_network(self, device: "torch.device", half: bool) -> "torch.nn.Module":
+        """加载可直接推理的网络，并获取权重大小、激活内存和低精度画质
+
+        优先使用预序列化模型；否则从.pth构建、校准并转换精度后保存，
+        供下次加载（包括其他进程）直接使用。多个进程同时加载时只由一个
+        进程构建，所有进程最终都以内存映射方式共享同一份权重文件。
+        """
+        import torch
+
+        from . import model_store
+
+        precision = settings.cpu_precision if self.engine == "cpu" else "fp32"
+        if not settings.serialize_models:
+            return self._build_from_weights(device, half, precision)[1]
+
+        # INT8量化模型无法从权重重建，保存为TorchScript
+        torchscript = precision == "int8"
+        options = {
+            "spec": [self.spec.num_feat, self.spec.num_block, self.spec.num_grow_ch, self.spec.scale],
+            "engine": self.engine,
+            "precision": precision,
+            "half": half,
+            "device": device.type,
+        }
+        path = model_store.artifact_path(self.name, self.path, options, torchscript)
+        with model_store.build_lock():
+            net = self._load_artifact(path, device)
+            if net is not None:
+                return net
+
+            net, reduced = self._build_from_weights(device, half, precision)
+            metadata = {
+                "weight_bytes": self.weight_bytes,
+                "activation_bytes": self.activation_bytes,
+                "precision": self.precision,
+                "quality": self.quality,
+            }
+            # bf16在加载时重新包装，只需保存fp32网络
+            saved = reduced if torchscript else net
+            example = torch.zeros(1, 3, _SPEED_PROBE_SIZE, _SPEED_PROBE_SIZE) if torchscript else None
+            try:
+                model_store.save_artifact(path, saved, metadata, example)
+            except Exception as e:
+                logger.warning(f"预序列化模型保存失败: {e}")
+                return reduced
+
+        self.artifact = path
+        if torchscript:
+            return reduced
+        # 改用保存的文件，本进程也与其他进程共享映射的权重，释放构建时的副本
+        shared = self._load_artifact(path, device)
+        if shared is None:
+            return reduced
+        del net, reduced, saved
+        ModelManager.release_memory()
+        return shared
+
+    def _load_artifact(self, path: Path, device: "torch.device") -> Optional["torch.nn.Module"]:
+        """加载预序列化模型及其校准结果，不存在时返回None"""
+        import torch
+
+        from . import model_store
+        from .precision import Bfloat16Model
+
+        loaded = model_store.load_artifact(path, self._copy_skeleton, device)
+        if loaded is None:
+            return None
+        net, metadata = loaded
+        self.artifact = path
+        self.weight_bytes = metadata["weight_bytes"]
+        self.activation_bytes = metadata["activation_bytes"]
+        self.precision = metadata["precision"]
+        self.quality = metadata["quality"]
+        # 状态字典格式的权重在CPU上保持内存映射，由各进程共享
+        self.shared_weights = not isinstance(net, torch.jit.ScriptModule) and device.type == "cpu"
+        logger.info(f"已加载预序列化模型: {path.name}")
+        return Bfloat16Model(net) if self.precision == "bf16" else net
+
+    def _build_from_weights(self, device: "torch.device", half: bool, precision: str):
+        """从.pth构建网络并校准，返回(fp32网络, 按精度转换后的网络)"""
+        import torch
+
+        net = self._build_network()
+        state = torch.load(self.path, map_location="cpu", weights_only=True)
+        net.load_state_dict(state.get("params_ema", state.get("params", state)), strict=True)
+        net = net.eval().to(device)
+        if half:
+            net = net.half()
+        if self.engine == "cpu":
+            # 预先转换为channels_last，保存后加载的权重无需再转换
+            net = net.to(memory_format=torch.channels_last)
+
+        self.weight_bytes = sum(
+            t.numel() * t.element_size()
+            for t in list(net.parameters()) + list(net.buffers())
+        )
+        # 校准瓦片大小规划所用的激活内存模型
+        self.activation_bytes = measure_activation_bytes(net, device, half)
+        return net, self._reduce_precision(net, precision)
+
+    def _reduce_precision(self, net: "torch.nn.Module", precision: str) -> "torch.nn.Module":
+        """按精度转换为低精度模型，并在评估图片上记录相对fp32的画质"""
+        from .precision import apply_precision, evaluate
+
+        reduced = apply_precision(net, precision)
+        if reduced is net:
+            return net
+        self.precision = precision
+        self.quality = evaluate(net, reduced)
+        logger.info(
+            f"模型 {self.name} 使用{self.precision}推理，相对fp32: "
+            f"PSNR {self.quality['psnr']:.2f}dB，SSIM {self.quality['ssim']:.4f}"
+        )
+        return reduced
+
+    def _warmup(self, net, started: float):
+        """按配置的尺寸预热推理，完成首次前向的惰性初始化、内存分配器扩容和按形状编译
+
+        默认尺寸为速度探测尺寸和固定瓦片（含填充）尺寸；自动瓦片的尺寸随请求变化，
+        可通过warmup_sizes指定常见尺寸。
+        """
+        import torch
+
+        sizes = list(settings.warmup_sizes)
+        if not sizes:
+            sizes = [_SPEED_PROBE_SIZE]
+            if settings.fixed_tile_size:
+                sizes.append(settings.fixed_tile_size + 2 * settings.tile_pad)
+
+        warmup_started = time.perf_counter()
+        with torch.no_grad():
+            for size in sizes:
+                probe = self._probe(size)
+                for _ in range(settings.warmup_runs):
+                    net(probe)
+                    if not self.first_inference_time:
+                        self.first_inference_time = time.perf_counter() - started
+        self.warmup_time = time.perf_counter() - warmup_started
+        if settings.warmup_runs > 0:
+            logger.info(f"模型 {self.name} 预热完成，尺寸: {sizes}，耗时: {self.warmup_time:.2f}秒")
+
+    def _probe(self, size: int) -> "torch.Tensor":
+        """构造指定边长的探测输入"""
+        import torch
+
+        probe = torch.zeros(1, 3, size, size, device=self.upsampler.device)
+        return probe.half() if self.upsampler.half else probe
+
+    def _measure_speed(self, net) -> float:
+        """探测每个输入像素的推理耗时（在预热之后执行，未预热时结果偏大，由实际推理平滑修正）"""
+        import torch
+
+        probe = self._probe(_SPEED_PROBE_SIZE)
+        with torch.no_grad():
+            started = time.perf_counter()
+            net(probe)
+        return (time.perf_counter() - started) / (_SPEED_PROBE_SIZE * _SPEED_PROBE_SIZE)
+
+    def record_speed(self, pixels: int, seconds: float):
+        """用实际推理耗时更新单像素耗时（指数平滑）"""
+        if pixels <= 0:
+            return
+        measured = seconds / pixels
+        if self.seconds_per_pixel:
+            measured = (1 - _SPEED_SMOOTHING) * self.seconds_per_pixel + _SPEED_SMOOTHING * measured
+        self.seconds_per_pixel = measured
+
+    def cost(self) -> ModelCost:
+        """规划输出倍数时使用的代价描述"""
+        return ModelCost(self.name, self.scale, self.seconds_per_pixel)
+
+    def close(self):
+        """停止微批处理器并释放实例"""
+        if self.batcher:
+            self.batcher.stop()
+            self.batcher = None
+        self.pool = queue.Queue()
+        self.upsampler = None
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator["RealESRGANer"]:
+        """租用一个upsampler实例，使用完毕后自动归还
+
+        RealESRGANer在实例属性上保存中间张量，不能被多个线程同时使用；
+        池中每个实例共享同一份只读模型权重，仅推理状态相互独立。
+        """
+        pool = self.pool
+        try:
+            upsampler = pool.get(timeout=timeout)
+        except queue.Empty:
+            raise ImageProcessingError("等待可用模型实例超时")
+
+        try:
+            yield upsampler
+        finally:
+            pool.put(upsampler)
+
+    def plan_tile_size(self, height: int, width: int) -> int:
+        """按可用内存和校准的激活内存模型选择预算内最大的瓦片，0表示整图推理"""
+        if not self.activation_bytes:
+            return 0
+
+        workers = settings.worker_count
+        budget = memory_budget(self.upsampler.device, settings.memory_threshold, workers)
+        if budget is None:
+            return settings.min_tile_size
+
+        # 合批时同一次前向计算包含多个瓦片，按各工作平摊
+        parallel = -(-self.batcher.max_batch_size // workers) if self.batcher else 1
+        return select_tile_size(
+            height, width,
+            scale=self.scale,
+            activation_bytes=self.activation_bytes,
+            budget=budget,
+            tile_pad=settings.tile_pad,
+            pre_pad=settings.pre_pad,
+            parallel=parallel,
+            min_tile=settings.min_tile_size,
+        )
+
+    def get_info(self) -> dict:
+        """获取模型信息"""
+        from .cpu_engine import CompiledModel
+        from .onnx_engine import OnnxModel
+
+        net = self.upsampler.model if self.upsampler else None
+        return {
+            "name": self.name,
+            "scale": self.scale,
+            "num_block": self.spec.num_block,
+            "engine": self.engine,
+            "precision": self.precision,
+            "quality": self.quality,
+            "weight_mb": round(self.weight_bytes / (1024 * 1024), 2),
+            "instances": self.pool_size,
+            "in_use": self.users,
+            "load_time": round(self.load_time, 3),
+            "first_inference_time": round(self.first_inference_time, 3),
+            "warmup_time": round(self.warmup_time, 3),
+            "artifact": self.artifact.name if self.artifact else None,
+            "shared_weights": self.shared_weights,
+            "activation_kb_per_pixel": round(self.activation_bytes / 1024, 2),
+            "us_per_pixel": round(self.seconds_per_pixel * 1e6, 3),
+            "batching": self.batcher.get_stats() if self.batcher else None,
+            "compile": net.get_stats() if isinstance(net, CompiledModel) else None,
+            "onnx": net.get_stats() if isinstance(net, OnnxModel) else None,
+        }
+
+
+@dataclass
+class ModelResidency:
+    """模型的驻留状态和加载记录，模型卸载后保留"""
+
+    # resident（驻留）、loading（加载中）或unloaded（已卸载）
+    state: str = "loading"
+    # 最近一次卸载的原因：idle（空闲超时）、evicted（容量淘汰）或unloaded（手动卸载）
+    unload_reason: Optional[str] = None
+    unloaded_at: Optional[float] = None
+    loads: int = 0
+    idle_unloads: int = 0
+    # 卸载前的推理速度，空闲卸载后重新加载时沿用
+    seconds_per_pixel: float = 0.0
+    # 最近几次加载的耗时（秒），首次之后的为重新加载
+    load_times: "deque[float]" = field(default_factory=lambda: deque(maxlen=_LOAD_HISTORY))
+
+    def unloaded(self, model: LoadedModel, reason: str):
+        """记录模型被卸载"""
+        self.state = "unloaded"
+        self.unload_reason = reason
+        self.unloaded_at = time.time()
+        self.seconds_per_pixel = model.seconds_per_pixel
+        if reason == "idle":
+            self.idle_unloads += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "unload_reason": self.unload_reason,
+            "unloaded_at": datetime.fromtimestamp(self.unloaded_at).isoformat() if self.unloaded_at else None,
+            "loads": self.loads,
+            "idle_unloads": self.idle_unloads,
+            "load_times": list(self.load_times),
+        }
+
 
 class ModelManager:
-    """AI模型管理器"""
-    
+    """AI模型管理器
+
+    模型注册表：按需加载请求指定的模型，最多同时驻留max_loaded_models个，
+    且权重总大小不超过model_memory_budget；超出时淘汰最久未使用且
+    当前没有请求在使用的模型。配置model_idle_timeout时，空闲超时的模型被卸载，
+    下次请求时从内存映射的预序列化模型重新加载。
+    """
+
     def __init__(self):
-        self._upsampler: Optional[RealESRGANer] = None
-        self._model_loaded = False
-        self._model_path = settings.model_path
-    
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._evictions = 0
+        # 默认模型最近一次加载失败的原因，加载成功后清除
+        self._load_error: Optional[str] = None
+        # 重新加载互斥；已被替换、仍有请求在使用的旧模型
+        self._reload_lock = threading.Lock()
+        self._retired: List[LoadedModel] = []
+        # 各模型的驻留记录；空闲卸载监控线程
+        self._residency: Dict[str, ModelResidency] = {}
+        self._idle_monitor: Optional[threading.Thread] = None
+        # 加载模型时确定的推理引擎
+        self._engine: Optional[str] = None
+
+    @property
+    def default_model(self) -> str:
+        """默认模型名称"""
+        return Path(settings.model_name).stem
+
+    @property
+    def engine(self) -> str:
+        """实际使用的推理引擎：auto在没有GPU时使用cpu"""
+        if settings.engine == "auto" and self._engine is None:
+            torch, _, _ = _import_backend()
+            self._engine = "torch" if torch.cuda.is_available() else "cpu"
+        return self._engine or settings.engine
+
+    @property
+    def engine_status(self) -> str:
+        """用于显示的推理引擎：auto在首次加载模型确定引擎之前显示为pending
+
+        状态接口在事件循环中调用，不能为此导入PyTorch。
+        """
+        if settings.engine != "auto":
+            return settings.engine
+        return self._engine or "pending"
+
     @property
     def is_loaded(self) -> bool:
-        """检查模型是否已加载"""
-        return self._model_loaded and self._upsampler is not None
-    
+        """检查是否有模型已加载"""
+        return bool(self._models)
+
     @property
-    def upsampler(self) -> Optional[RealESRGANer]:
-        """获取upsampler实例"""
-        return self._upsampler
-    
-    def load_model(self) -> bool:
-        """加载AI模型"""
+    def is_available(self) -> bool:
+        """是否可以处理请求：有模型驻留，或模型因空闲被卸载、请求到达时重新加载"""
+        return self.is_loaded or any(
+            record.unload_reason == "idle" for record in self._residency.values()
+        )
+
+    @property
+    def is_loading(self) -> bool:
+        """是否有模型正在加载"""
+        return bool(self._loading)
+
+    @property
+    def load_error(self) -> Optional[str]:
+        """默认模型加载失败的原因，未失败时为None"""
+        return self._load_error
+
+    @property
+    def loaded_models(self) -> List[str]:
+        """当前驻留的模型名称（最近使用的在后）"""
+        return list(self._models)
+
+    def get_spec(self, name: str) -> ModelSpec:
+        """获取模型架构，未登记的默认模型按6块RRDBNet和配置的倍数处理"""
+        spec = MODEL_SPECS.get(name)
+        if spec is None:
+            spec = ModelSpec(name, scale=settings.model_scale, num_block=6)
+        return spec
+
+    def resolve(self, name: Optional[str] = None) -> str:
+        """校验请求的模型名称，返回实际使用的模型名"""
+        name = name or self.default_model
+        if name not in MODEL_SPECS and name != self.default_model:
+            raise ValidationError(f"不支持的模型: {name}，可选: {list(MODEL_SPECS)}")
+        if name not in self._models and not (settings.model_dir / self.get_spec(name).filename).exists():
+            raise ValidationError(f"模型文件不存在: {name}")
+        return name
+
+    def get_model(self, name: Optional[str] = None) -> LoadedModel:
+        """获取模型，未加载时按需加载（同一模型只加载一次）"""
+        name = name or self.default_model
+        while True:
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:
+                    self._models.move_to_end(name)
+                    model.last_used = time.monotonic()
+                    return model
+                event = self._loading.get(name)
+                if event is None:
+                    event = self._loading[name] = threading.Event()
+                    self._residency.setdefault(name, ModelResidency()).state = "loading"
+                    break
+            # 其他线程正在加载同一模型，等待完成后重新查找
+            event.wait()
+
         try:
-            logger.info("正在初始化Real-ESRGAN模型...")
-            
+            return self._load(name)
+        finally:
+            with self._lock:
+                self._loading.pop(name, None)
+                record = self._residency[name]
+                if record.state == "loading":
+                    # 加载失败
+                    record.state = "resident" if name in self._models else "unloaded"
+            event.set()
+
+    @contextmanager
+    def acquire(self, name: Optional[str] = None) -> Iterator[LoadedModel]:
+        """使用模型期间持有引用，防止被淘汰"""
+        while True:
+            model = self.get_model(name)
+            with self._lock:
+                # 获取后到登记使用前可能已被其他线程淘汰
+                if self._models.get(model.name) is model:
+                    model.users += 1
+                    break
+
+        try:
+            yield model
+        finally:
+            with self._lock:
+                model.users -= 1
+                model.last_used = time.monotonic()
+                release = model.retired and model.users == 0
+                if release:
+                    self._retired.remove(model)
+            if release:
+                self._release_retired(model)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None,
+              name: Optional[str] = None) -> Iterator["RealESRGANer"]:
+        """租用指定模型（默认为默认模型）的一个upsampler实例"""
+        if not self.is_available:
+            raise ImageProcessingError("AI模型未初始化")
+        with self.acquire(name) as model, model.lease(timeout) as upsampler:
+            yield upsampler
+
+    def load_model(self, name: Optional[str] = None) -> bool:
+        """加载AI模型（默认为默认模型）"""
+        self.get_model(name)
+        return True
+
+    def _create(self, name: str) -> LoadedModel:
+        """加载并预热模型，尚未登记到注册表
+
+        空闲卸载后的重新加载沿用卸载前的推理速度，不再预热。
+        """
+        spec = self.get_spec(name)
+        record = self._residency.get(name)
+        rehydrate = (name not in self._models and record is not None
+                     and record.unload_reason == "idle")
+        path = settings.model_dir / spec.filename
+        try:
+            logger.info(f"正在初始化Real-ESRGAN模型: {name}...")
+
             # 检查模型文件是否存在
-            if not self._model_path.exists():
-                raise ModelLoadError(f"模型文件不存在: {self._model_path}")
-            
-            # 创建模型架构
-            model = RRDBNet(
-                num_in_ch=3,
-                num_out_ch=3,
-                num_feat=64,
-                num_block=6,
-                num_grow_ch=32,
-                scale=settings.model_scale
-            )
-            
-            # 初始化upsampler
-            self._upsampler = RealESRGANer(
-                scale=settings.model_scale,
-                model_path=str(self._model_path),
-                model=model,
-                tile=settings.tile_size,
-                tile_pad=settings.tile_pad,
-                pre_pad=settings.pre_pad,
-                half=settings.use_half_precision,
-                gpu_id=settings.gpu_id
-            )
-            
-            self._model_loaded = True
-            logger.info("Real-ESRGAN模型初始化完成")
-            return True
-            
+            if not path.exists():
+                raise ModelLoadError(f"模型文件不存在: {path}")
+
+            engine = self.engine
+            if engine in ("cpu", "onnx"):
+                from .cpu_engine import configure_threads
+                configure_threads()
+            model = LoadedModel(spec, path, engine)
+            model.load(record.seconds_per_pixel if rehydrate else 0.0)
         except Exception as e:
             logger.error(f"模型初始化失败: {str(e)}")
-            self._model_loaded = False
+            if name == self.default_model:
+                self._load_error = str(e)
             raise ModelLoadError(f"模型加载失败: {str(e)}")
-    
-    def unload_model(self):
-        """卸载模型"""
-        if self._upsampler:
-            del self._upsampler
-            self._upsampler = None
-        self._model_loaded = False
-        logger.info("模型已卸载")
-    
+
+        if name == self.default_model:
+            self._load_error = None
+        if rehydrate:
+            logger.info(f"空闲卸载的模型已重新加载: {name}，耗时: {model.load_time:.3f}秒")
+            return model
+        logger.info(
+            f"Real-ESRGAN模型初始化完成: {name}，实例数: {model.pool_size}，"
+            f"耗时: {model.load_time:.2f}秒，首次推理: {model.first_inference_time:.2f}秒，"
+            f"激活内存: {model.activation_bytes / 1024:.1f}KB/像素"
+        )
+        return model
+
+    def _load(self, name: str) -> LoadedModel:
+        """加载模型并按容量淘汰其他模型"""
+        return self._install(self._create(name))
+
+    def _install(self, model: LoadedModel) -> LoadedModel:
+        """登记模型，替换同名的旧模型并按容量淘汰其他模型
+
+        旧模型仍有请求在使用时只从注册表移除，由最后一个请求结束时释放。
+        """
+        released = []
+        with self._lock:
+            old = self._models.pop(model.name, None)
+            self._models[model.name] = model
+            record = self._residency.setdefault(model.name, ModelResidency())
+            record.state = "resident"
+            record.unload_reason = None
+            record.loads += 1
+            record.load_times.append(round(model.load_time, 3))
+            if old is not None:
+                if old.users > 0:
+                    old.retired = True
+                    self._retired.append(old)
+                else:
+                    released.append(old)
+            evicted = self._evict(keep=model.name)
+
+        for old in released:
+            old.close()
+            logger.info(f"旧模型已释放: {old.name}")
+        for old in evicted:
+            old.close()
+            logger.info(f"模型已淘汰: {old.name}")
+        if released or evicted:
+            self.release_memory()
+        self._start_idle_monitor()
+        return model
+
+    def _release_retired(self, model: LoadedModel):
+        """释放已被替换且不再使用的旧模型"""
+        model.close()
+        self.release_memory()
+        logger.info(f"旧模型已释放: {model.name}（进行中的请求已完成）")
+
+    def _evict(self, keep: str) -> List[LoadedModel]:
+        """按LRU顺序淘汰超出数量或内存预算的空闲模型（调用方持有锁）"""
+        evicted = []
+
+        def over_capacity() -> bool:
+            total = sum(m.weight_bytes for m in self._models.values())
+            return (len(self._models) > max(1, settings.max_loaded_models)
+                    or 0 < settings.model_memory_budget < total)
+
+        for name in list(self._models):
+            if not over_capacity():
+                break
+            model = self._models[name]
+            if name == keep or model.users > 0:
+                continue
+            del self._models[name]
+            self._residency[name].unloaded(model, "evicted")
+            evicted.append(model)
+            self._evictions += 1
+
+        if over_capacity():
+            logger.warning("驻留模型超出容量，其余模型均在使用中，暂不淘汰")
+        return evicted
+
+    def unload_model(self, name: Optional[str] = None):
+        """卸载模型，不指定名称时卸载全部"""
+        with self._lock:
+            names = [name] if name else list(self._models)
+            models = [self._models.pop(n) for n in names if n in self._models]
+            for model in models:
+                self._residency[model.name].unloaded(model, "unloaded")
+        for model in models:
+            model.close()
+            logger.info(f"模型已卸载: {model.name}")
+        if models:
+            self.release_memory()
+
+    def unload_idle(self) -> List[str]:
+        """卸载空闲超过model_idle_timeout且没有请求在使用的模型，返回卸载的模型名"""
+        timeout = settings.model_idle_timeout
+        if timeout <= 0:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            models = [
+                model for model in self._models.values()
+                if model.users == 0 and now - model.last_used >= timeout
+            ]
+            for model in models:
+                del self._models[model.name]
+                self._residency[model.name].unloaded(model, "idle")
+        for model in models:
+            model.close()
+            logger.info(f"模型空闲超过{timeout}秒，已卸载: {model.name}")
+        if models:
+            self.release_memory()
+        return [model.name for model in models]
+
+    def _start_idle_monitor(self):
+        """首次加载模型后启动空闲卸载监控线程（未配置空闲超时时不启动）"""
+        if settings.model_idle_timeout <= 0:
+            return
+        with self._lock:
+            if self._idle_monitor is not None:
+                return
+            self._idle_monitor = threading.Thread(
+                target=self._monitor_idle, name="model-idle-monitor", daemon=True
+            )
+        self._idle_monitor.start()
+
+    def _monitor_idle(self):
+        """定期检查并卸载空闲模型，检查间隔为空闲超时的1/4（1到30秒）"""
+        interval = min(30.0, max(1.0, settings.model_idle_timeout / 4))
+        while True:
+            time.sleep(interval)
+            try:
+                self.unload_idle()
+            except Exception as e:
+                logger.error(f"空闲模型卸载失败: {e}")
+
+    def plan_tile_size(self, height: int, width: int, name: Optional[str] = None) -> int:
+        """为指定尺寸的输入选择瓦片大小
+
+        固定瓦片大小时直接返回配置值；自动模式下按可用内存、内存阈值和
+        校准的激活内存模型选择预算内最大的瓦片，0表示整图推理。
+        """
+        if not settings.auto_tile:
+            return settings.tile_size
+        return self.get_model(name).plan_tile_size(height, width)
+
+    def plan_scale(self, height: int, width: int, outscale: Optional[float] = None,
+                   name: Optional[str] = None, allow_substitute: bool = False) -> ScalePlan:
+        """为请求的输出倍数选择代价最小的执行计划，并为每次推理选择瓦片大小
+
+        Args:
+            outscale: 输出倍数，为None时使用模型自身倍数
+            name: 请求的模型，为None时使用默认模型
+            allow_substitute: 是否允许改用已驻留的其他模型（请求未指定模型时）
+        """
+        requested = self.get_model(name)
+        alternatives = []
+        if allow_substitute:
+            with self._lock:
+                alternatives = [m.cost() for m in self._models.values() if m is not requested]
+
+        plan = choose_plan(
+            height, width,
+            outscale=float(outscale or requested.scale),
+            requested=requested.cost(),
+            alternatives=alternatives,
+            chain_budget=settings.outscale_chain_max_seconds,
+        )
+
+        # 按每次推理的输入尺寸选择瓦片
+        factor = 1.0
+        for step in plan.passes:
+            factor *= step.input_scale
+            step.tile_size = self.plan_tile_size(
+                max(1, round(height * factor)), max(1, round(width * factor)), step.model_name
+            )
+            factor *= step.scale
+        return plan
+
+    @staticmethod
+    def release_memory():
+        """释放中止或失败任务遗留的中间张量和显存缓存"""
+        gc.collect()
+        # 尚未导入PyTorch时没有需要释放的显存
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        _malloc_trim()
+
     def reload_model(self) -> bool:
-        """重新加载模型"""
-        logger.info("正在重新加载模型...")
-        self.unload_model()
-        return self.load_model()
-    
+        """重新加载模型（双缓冲热替换）
+
+        新模型在旧模型旁加载并预热，完成后原子替换，之后的请求使用新模型；
+        进行中的请求在旧模型上完成，随后释放旧模型。新模型加载失败时
+        继续使用旧模型，服务不中断。
+        """
+        with self._reload_lock:
+            logger.info("正在重新加载模型...")
+            names = self.loaded_models or [self.default_model]
+            failed = []
+            for name in names:
+                try:
+                    model = self._create(name)
+                except ModelLoadError as e:
+                    failed.append(e.message)
+                    continue
+                self._install(model)
+                logger.info(f"模型已热替换: {name}")
+
+        if failed:
+            raise ModelLoadError(f"{'；'.join(failed)}，继续使用原模型")
+        return True
+
     def get_model_info(self) -> dict:
         """获取模型信息"""
+        model_path = settings.model_path
+        default = self._models.get(self.default_model)
         return {
-            "model_path": str(self._model_path),
-            "model_loaded": self._model_loaded,
-            "model_exists": self._model_path.exists(),
-            "model_size_mb": round(self._model_path.stat().st_size / (1024 * 1024), 2) if self._model_path.exists() else 0,
-            "scale": settings.model_scale,
+            "model_path": str(model_path),
+            "model_loaded": self.is_loaded,
+            "model_exists": model_path.exists(),
+            "model_size_mb": round(model_path.stat().st_size / (1024 * 1024), 2) if model_path.exists() else 0,
+            "default_model": self.default_model,
+            "scale": self.get_spec(self.default_model).scale,
+            "engine": self.engine_status,
             "use_half_precision": settings.use_half_precision,
-            "gpu_id": settings.gpu_id
+            "gpu_id": settings.gpu_id,
+            "tile_size": settings.tile_size,
+            "instances": default.pool_size if default else 0,
+            "batching": default.batcher.get_stats() if default and default.batcher else None,
+            "max_loaded_models": settings.max_loaded_models,
+            "model_memory_budget_mb": round(settings.model_memory_budget / (1024 * 1024), 2),
+            "evictions": self._evictions,
+            "model_idle_timeout": settings.model_idle_timeout,
+            "residency": {name: record.to_dict() for name, record in self._residency.items()},
+            "retired_in_use": [model.name for model in self._retired],
+            "loaded_models": [model.get_info() for model in reversed(self._models.values())],
+            "available_models": [
+                {
+                    "name": spec.name,
+                    "scale": spec.scale,
+                    "num_block": spec.num_block,
+                    "exists": (settings.model_dir / spec.filename).exists(),
+                    "loaded": spec.name in self._models,
+                }
+                for spec in MODEL_SPECS.values()
+            ],
         }
 
 
 # 全局模型管理器实例
-model_manager = ModelManager() 
\ No newline at end of file
+model_manager = ModelManager()
@@ -0,0 +1,150 @@
+"""
+预序列化模型存储
+保存可直接运行的模型及其校准结果，按权重哈希和影响模型的配置区分，再次加载时跳过
+权重解析、低精度转换和校准；权重以内存映射方式读取
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import torch
+
+from ..config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 存储格式版本，格式变化时递增使旧文件失效
+STORE_VERSION = 1
+
+# 各格式的文件后缀：状态字典的权重以内存映射方式加载到新建的网络中；
+# TorchScript用于无法从权重重建的模型（INT8量化）
+_SUFFIXES = {"state_dict": ".pt", "torchscript": ".jit"}
+
+_METADATA_FILE = "metadata.json"
+
+# 同一进程内避免同时写入模型文件
+_write_lock = threading.Lock()
+
+# 权重文件摘要，按路径和文件状态缓存，重新加载模型时不必再读取整个文件；
+# 保留修改时间的复制（cp -p、rsync -a）仍会改变inode或ctime
+_digests: Dict[Tuple[str, int, int, int, int], str] = {}
+
+
+def weights_digest(weights_path: Path) -> str:
+    """权重文件内容的SHA-256摘要"""
+    stat = weights_path.stat()
+    key = (str(weights_path), stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+    cached = _digests.get(key)
+    if cached is not None:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(weights_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+def artifact_path(name: str, weights_path: Path, options: dict,
+                  torchscript: bool = False) -> Path:
+    """模型在存储目录中的路径：模型名-权重摘要-配置摘要，后缀区分格式"""
+    options = dict(options, version=STORE_VERSION, torch=torch.__version__)
+    config = hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()
+    suffix = _SUFFIXES["torchscript" if torchscript else "state_dict"]
+    return settings.serialized_model_dir / f"{name}-{weights_digest(weights_path)[:16]}-{config[:8]}{suffix}"
+
+
+@contextmanager
+def atomic_write(path: Path) -> Iterator[Path]:
+    """返回临时文件路径供写入，成功后原子替换目标文件，失败时删除临时文件
+
+    多个推理进程同时写入同一文件时不会读到不完整的内容。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with _write_lock:
+        try:
+            yield tmp
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+@contextmanager
+def build_lock() -> Iterator[None]:
+    """跨进程互斥：多个进程同时加载时只由一个进程构建模型，其余等待后直接读取
+
+    不支持fcntl的平台上不加锁，各进程可能重复构建，结果相同。
+    """
+    directory = settings.serialized_model_dir
+    directory.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(directory / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_artifact(path: Path, build: Callable[[], torch.nn.Module],
+                  device: torch.device) -> Optional[Tuple[torch.nn.Module, dict]]:
+    """加载已保存的模型，不存在或无法读取时返回None
+
+    Args:
+        build: 构建网络结构的函数，状态字典格式在meta设备上调用，不分配权重内存
+    """
+    if not path.exists():
+        return None
+    try:
+        if path.suffix == _SUFFIXES["torchscript"]:
+            files = {_METADATA_FILE: ""}
+            module = torch.jit.load(str(path), map_location=device, _extra_files=files)
+            return module, json.loads(files[_METADATA_FILE])
+
+        # 权重以内存映射方式读取，assign使网络直接使用映射的张量而不复制；
+        # 只读的映射页面在页缓存中由所有加载同一文件的进程共享
+        saved = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        with torch.device("meta"):
+            module = build()
+        module.load_state_dict(saved["state_dict"], assign=True)
+        return module.eval().to(device), saved["metadata"]
+    except Exception as e:
+        logger.warning(f"预序列化模型无法加载，重新构建: {path.name}: {e}")
+        return None
+
+
+def save_artifact(path: Path, module: torch.nn.Module, metadata: dict,
+                  example: Optional[torch.Tensor] = None):
+    """保存模型及其元数据，TorchScript格式用示例输入追踪
+
+    原子写入（见atomic_write），同时删除同一模型由旧权重生成的文件。
+    """
+    with atomic_write(path) as tmp:
+        if path.suffix == _SUFFIXES["torchscript"]:
+            with torch.no_grad():
+                traced = torch.jit.trace(module, example, check_trace=False)
+            torch.jit.save(traced, str(tmp), _extra_files={_METADATA_FILE: json.dumps(metadata)})
+        else:
+            torch.save({"metadata": metadata, "state_dict": module.state_dict()}, tmp)
+
+    name, digest, _ = path.stem.rsplit("-", 2)
+    for stale in path.parent.glob(f"{name}-*"):
+        parts = stale.stem.rsplit("-", 2)
+        if stale.suffix in _SUFFIXES.values() and len(parts) == 3 and parts[0] == name and parts[1] != digest:
+            stale.unlink(missing_ok=True)
+    logger.info(f"已保存预序列化模型: {path.name}")
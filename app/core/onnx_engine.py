@@ -0,0 +1,101 @@
+"""
+ONNX Runtime推理引擎
+将RRDBNet导出为ONNX并缓存在权重文件旁，通过onnxruntime的CPU执行器推理
+"""
+
+import logging
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from ..config import settings
+from ..utils.exceptions import ModelLoadError
+from .cpu_engine import intra_op_threads
+from .model_store import atomic_write, weights_digest
+
+logger = logging.getLogger(__name__)
+
+# 导出使用的ONNX算子集版本
+OPSET_VERSION = 17
+
+# 导出时使用的示例输入边长（批大小、高、宽均为动态维度）
+_EXPORT_SIZE = 64
+
+
+def onnx_path(weights_path: Path) -> Path:
+    """模型权重对应的ONNX文件路径（与.pth位于同一目录，文件名包含权重摘要）"""
+    return weights_path.with_name(f"{weights_path.stem}-{weights_digest(weights_path)[:16]}.onnx")
+
+
+def export_onnx(model: torch.nn.Module, weights_path: Path) -> Path:
+    """将模型导出为ONNX，同一权重已导出时直接复用
+
+    按权重内容区分导出文件，权重更新（包括保留修改时间的复制）后重新导出，
+    并删除旧权重导出的文件。ONNX Runtime只使用CPU执行器，模型在导出前
+    转换为CPU上的fp32，与示例输入位于同一设备。
+    """
+    path = onnx_path(weights_path)
+    if path.exists():
+        return path
+
+    logger.info(f"正在导出ONNX模型: {path.name}")
+    probe = torch.zeros(1, 3, _EXPORT_SIZE, _EXPORT_SIZE)
+    dynamic = {0: "batch", 2: "height", 3: "width"}
+    model = model.float().cpu().eval()
+    with atomic_write(path) as tmp, torch.no_grad():
+        torch.onnx.export(
+            model, (probe,), str(tmp),
+            input_names=["input"],
+            output_names=["output"],
+            dynamic_axes={"input": dynamic, "output": dynamic},
+            opset_version=OPSET_VERSION,
+            dynamo=False,
+        )
+
+    for stale in weights_path.parent.glob(f"{weights_path.stem}*.onnx"):
+        if stale != path and weights_path.stem in (stale.stem, stale.stem.rpartition("-")[0]):
+            stale.unlink(missing_ok=True)
+    return path
+
+
+class OnnxModel:
+    """以torch张量为输入输出的ONNX Runtime会话，可替代upsampler.model
+
+    InferenceSession.run是线程安全的，实例池中的各upsampler共享同一会话。
+    """
+
+    def __init__(self, path: Path):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ModelLoadError("ENGINE=onnx需要安装onnxruntime")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = settings.onnx_threads or intra_op_threads()
+        options.inter_op_num_threads = 1
+        self.path = path
+        self.session = ort.InferenceSession(
+            str(path), options, providers=["CPUExecutionProvider"]
+        )
+        self.threads = options.intra_op_num_threads
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        inputs = np.ascontiguousarray(x.detach().cpu().float().numpy())
+        output = self.session.run(None, {"input": inputs})[0]
+        return torch.from_numpy(output)
+
+    def get_stats(self) -> dict:
+        """获取会话信息"""
+        return {
+            "path": str(self.path),
+            "size_mb": round(self.path.stat().st_size / (1024 * 1024), 2),
+            "threads": self.threads,
+            "providers": self.session.get_providers(),
+        }
+
+
+def load_onnx_model(model: torch.nn.Module, weights_path: Path) -> OnnxModel:
+    """导出（或复用已导出的）ONNX模型并创建推理会话"""
+    return OnnxModel(export_onnx(model, weights_path))
@@ -0,0 +1,143 @@
+"""
+CPU低精度推理
+bfloat16自动混合精度和INT8训练后量化，以及相对fp32的画质评估（PSNR/SSIM）
+"""
+
+import copy
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 随包分发的校准图片：calib_*用于INT8量化校准，eval_*用于画质评估
+CALIBRATION_DIR = Path(__file__).resolve().parent.parent / "assets" / "calibration"
+
+# 输出完全一致时记录的PSNR（dB）
+MAX_PSNR = 100.0
+
+
+def load_images(prefix: str) -> List[np.ndarray]:
+    """读取校准目录中指定前缀的图片（BGR uint8）"""
+    images = []
+    for path in sorted(CALIBRATION_DIR.glob(f"{prefix}_*.png")):
+        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if img is not None:
+            images.append(img)
+    return images
+
+
+def to_tensor(img: np.ndarray) -> torch.Tensor:
+    """BGR uint8图片转换为模型输入（1x3xHxW，RGB，0-1）"""
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+    return torch.from_numpy(np.transpose(rgb, (2, 0, 1)).copy()).unsqueeze(0)
+
+
+def to_image(tensor: torch.Tensor) -> np.ndarray:
+    """模型输出转换为uint8图片（与推理后处理相同的截断和量化）"""
+    output = tensor.detach().squeeze(0).float().clamp(0, 1).numpy()
+    return (np.transpose(output, (1, 2, 0)) * 255.0).round().astype(np.uint8)
+
+
+def bf16_supported() -> bool:
+    """CPU是否支持bfloat16加速（oneDNN）"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+class Bfloat16Model(torch.nn.Module):
+    """在bfloat16自动混合精度下执行前向计算，输出转换回float32"""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return self.model(x).float()
+
+
+def quantize_int8(model: torch.nn.Module, images: List[np.ndarray]) -> torch.nn.Module:
+    """INT8静态训练后量化（FX图模式），用校准图片统计激活范围
+
+    RRDBNet以卷积为主，动态量化只覆盖Linear层，因此采用静态量化。
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_fx
+
+    if not images:
+        raise ValueError(f"校准图片不存在: {CALIBRATION_DIR}")
+
+    torch.backends.quantized.engine = "x86"
+    model = copy.deepcopy(model).float().eval()
+    # 量化后的leaky_relu不支持原地计算
+    for module in model.modules():
+        if isinstance(module, torch.nn.LeakyReLU):
+            module.inplace = False
+
+    inputs = [to_tensor(img) for img in images]
+    with torch.no_grad():
+        prepared = quantize_fx.prepare_fx(model, get_default_qconfig_mapping("x86"), (inputs[0],))
+        for tensor in inputs:
+            prepared(tensor)
+        return quantize_fx.convert_fx(prepared)
+
+
+def apply_precision(model: torch.nn.Module, precision: str) -> torch.nn.Module:
+    """按精度转换模型，不支持时退回fp32"""
+    if precision == "bf16":
+        if not bf16_supported():
+            logger.warning("CPU不支持bfloat16加速，使用fp32推理")
+            return model
+        return Bfloat16Model(model)
+    if precision == "int8":
+        return quantize_int8(model, load_images("calib"))
+    return model
+
+
+def psnr(reference: np.ndarray, image: np.ndarray) -> float:
+    """峰值信噪比（dB，uint8数据范围），完全一致时返回MAX_PSNR"""
+    mse = np.mean((reference.astype(np.float64) - image.astype(np.float64)) ** 2)
+    if mse == 0:
+        return MAX_PSNR
+    return min(MAX_PSNR, float(10 * np.log10(255.0 ** 2 / mse)))
+
+
+def ssim(reference: np.ndarray, image: np.ndarray) -> float:
+    """结构相似度（11x11高斯窗口，σ=1.5，各通道平均）"""
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    a = reference.astype(np.float64)
+    b = image.astype(np.float64)
+
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a ** 2
+    var_b = blur(b * b) - mu_b ** 2
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / (
+        (mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2)
+    )
+    return float(ssim_map.mean())
+
+
+def evaluate(reference: torch.nn.Module, model: torch.nn.Module,
+             images: Optional[List[np.ndarray]] = None) -> Dict[str, float]:
+    """在评估图片上比较模型与fp32参考模型的输出，返回平均PSNR和SSIM"""
+    images = load_images("eval") if images is None else images
+    scores = {"psnr": [], "ssim": []}
+    with torch.no_grad():
+        for img in images:
+            tensor = to_tensor(img)
+            expected = to_image(reference(tensor))
+            actual = to_image(model(tensor))
+            scores["psnr"].append(psnr(expected, actual))
+            scores["ssim"].append(ssim(expected, actual))
+    return {name: round(float(np.mean(values)), 4) for name, values in scores.items()}
@@ -0,0 +1,188 @@
+"""
+结果缓存
+以输入内容哈希和处理参数为键缓存放大结果，按总大小进行LRU淘汰
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def link_or_copy(src: Path, dst: Path):
+    """优先使用硬链接，不支持时退回复制"""
+    try:
+        if dst.exists():
+            dst.unlink()
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ResultCache:
+    """内容寻址的结果缓存
+
+    缓存文件保存在cache_dir下，文件名为缓存键加输出扩展名；命中时更新
+    文件修改时间，重启后按修改时间重建LRU顺序。
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Path]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content: bytes, params: Dict[str, Any]) -> str:
+        """根据输入内容和处理参数生成缓存键"""
+        digest = hashlib.sha256(content).hexdigest()
+        param_str = "&".join(f"{k}={params[k]}" for k in sorted(params))
+        return hashlib.sha256(f"{digest}|{param_str}".encode()).hexdigest()
+
+    def load_index(self):
+        """扫描缓存目录重建索引"""
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self._cache_dir.iterdir():
+            if not path.is_file() or path.suffix == ".tmp":
+                continue
+            stat = path.stat()
+            found.append((stat.st_mtime, path.stem, path, stat.st_size))
+
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+            for _, key, path, size in sorted(found):
+                self._entries[key] = path
+                self._sizes[key] = size
+                self._total_bytes += size
+            self._evict()
+
+        logger.info(
+            f"结果缓存索引已重建: {len(self._entries)} 项, "
+            f"{self._total_bytes / (1024 * 1024):.1f}MB"
+        )
+
+    def observe(self, files: Iterable[Tuple[str, os.stat_result]]):
+        """登记增量扫描读到的、索引外的缓存文件（其他服务进程写入）
+
+        本进程未使用过这些缓存项，视为最久未使用，超出容量时先被淘汰。
+        """
+        with self._lock:
+            for name, stat in files:
+                path = self._cache_dir / name
+                if path.suffix == ".tmp" or path.stem in self._entries:
+                    continue
+                self._entries[path.stem] = path
+                self._entries.move_to_end(path.stem, last=False)
+                self._sizes[path.stem] = stat.st_size
+                self._total_bytes += stat.st_size
+            self._evict()
+
+    def prune(self, seen: Set[str]):
+        """一遍增量扫描结束后，移除文件已被删除的缓存项
+
+        Args:
+            seen: 这一遍扫描读到的文件名
+        """
+        with self._lock:
+            unseen = [(key, path) for key, path in self._entries.items() if path.name not in seen]
+        for key, path in unseen:
+            if not path.exists():
+                self._remove(key)
+
+    def get(self, key: str, suffix: Optional[str] = None) -> Optional[Path]:
+        """查询缓存，命中时返回缓存文件路径
+
+        Args:
+            suffix: 输出扩展名；给定时索引未命中也检查缓存目录（其他服务进程写入的结果）
+        """
+        with self._lock:
+            path = self._entries.get(key)
+            if path is None and suffix is not None:
+                path = self._discover(key, suffix)
+            if path is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+        try:
+            os.utime(path)
+        except OSError:
+            # 文件已被外部删除
+            self._remove(key)
+            return None
+        return path
+
+    def put(self, key: str, src: Path) -> Path:
+        """将处理结果加入缓存"""
+        path = self._cache_dir / f"{key}{src.suffix}"
+        link_or_copy(src, path)
+        size = path.stat().st_size
+
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._sizes[key]
+            self._entries[key] = path
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._evict()
+        return path
+
+    def _discover(self, key: str, suffix: str) -> Optional[Path]:
+        """登记缓存目录中索引外的缓存文件（调用方持有锁）"""
+        path = self._cache_dir / f"{key}{suffix}"
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return None
+        self._entries[key] = path
+        self._sizes[key] = size
+        self._total_bytes += size
+        return path
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        return {
+            "entries": len(self._entries),
+            "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+            "max_size_mb": round(self._max_bytes / (1024 * 1024), 2),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+    def _remove(self, key: str):
+        """移除缓存项"""
+        with self._lock:
+            path = self._entries.pop(key, None)
+            if path is not None:
+                self._total_bytes -= self._sizes.pop(key, 0)
+
+    def _evict(self):
+        """淘汰最久未使用的缓存项直到不超过容量上限（调用方持有锁）"""
+        while self._total_bytes > self._max_bytes and self._entries:
+            key, path = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(key, 0)
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+# 全局结果缓存实例
+result_cache = ResultCache(settings.cache_dir, settings.cache_max_size)
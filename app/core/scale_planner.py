@@ -0,0 +1,137 @@
+"""
+输出倍数规划
+为请求的输出倍数选择推理代价最小的路线
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# 倍数比较容差
+_EPSILON = 1e-6
+
+
+@dataclass
+class ModelCost:
+    """参与规划的模型及其实测推理代价"""
+
+    name: str
+    scale: int
+    # 每个输入像素的推理耗时（秒）
+    seconds_per_pixel: float
+
+
+@dataclass
+class PlanPass:
+    """一次模型推理"""
+
+    model_name: str
+    scale: int
+    # 推理前对当前图片的缩放比例（小于1为预先缩小）
+    input_scale: float = 1.0
+    tile_size: int = 0
+
+
+@dataclass
+class ScalePlan:
+    """输出倍数的执行计划
+
+    route取值：
+        direct         请求的模型倍数与输出倍数一致
+        native         使用已驻留的、倍数与输出倍数一致的其他模型
+        pre_downscale  先缩小输入，再用更高倍数的模型推理到目标尺寸
+        model_resize   模型推理后缩放到目标尺寸
+        chain          两次推理（第二次前按需缩小）后缩放到目标尺寸
+    """
+
+    route: str
+    outscale: float
+    passes: List[PlanPass] = field(default_factory=list)
+    estimated_seconds: float = 0.0
+
+    @property
+    def model_name(self) -> str:
+        """第一次推理使用的模型"""
+        return self.passes[0].model_name
+
+    def describe(self) -> dict:
+        """用于processing_params的计划描述"""
+        return {
+            "route": self.route,
+            "passes": [
+                {
+                    "model_name": step.model_name,
+                    "scale": step.scale,
+                    "input_scale": round(step.input_scale, 4),
+                    "tile_size": step.tile_size,
+                }
+                for step in self.passes
+            ],
+            "estimated_seconds": round(self.estimated_seconds, 3),
+        }
+
+
+def _same(a: float, b: float) -> bool:
+    return abs(a - b) < _EPSILON
+
+
+def _estimate(height: int, width: int, passes: List[PlanPass],
+              costs: dict) -> float:
+    """按各次推理的输入像素数和实测单像素耗时估算总耗时"""
+    total = 0.0
+    factor = 1.0
+    for step in passes:
+        factor *= step.input_scale
+        total += height * width * factor * factor * costs[step.model_name]
+        factor *= step.scale
+    return total
+
+
+def choose_plan(height: int, width: int, outscale: float, requested: ModelCost,
+                alternatives: Optional[List[ModelCost]] = None,
+                chain_budget: float = 0.0) -> ScalePlan:
+    """选择代价最小的执行计划
+
+    Args:
+        height, width: 输入图片尺寸
+        outscale: 目标输出倍数
+        requested: 请求使用的模型
+        alternatives: 可替代的已驻留模型（请求未指定模型时提供）
+        chain_budget: 输出倍数超过模型倍数时，两次推理的预估耗时上限（秒），
+            超出则退回单次推理后缩放
+    """
+    costs = {requested.name: requested.seconds_per_pixel}
+    candidates: List[ScalePlan] = []
+
+    def add(route: str, passes: List[PlanPass]):
+        plan = ScalePlan(route, outscale, passes)
+        plan.estimated_seconds = _estimate(height, width, passes, costs)
+        candidates.append(plan)
+        return plan
+
+    scale = requested.scale
+    if _same(outscale, scale):
+        add("direct", [PlanPass(requested.name, scale)])
+    elif outscale < scale:
+        add("pre_downscale", [PlanPass(requested.name, scale, outscale / scale)])
+    else:
+        single = add("model_resize", [PlanPass(requested.name, scale)])
+        chain = ScalePlan("chain", outscale, [
+            PlanPass(requested.name, scale),
+            PlanPass(requested.name, scale, min(1.0, outscale / (scale * scale))),
+        ])
+        chain.estimated_seconds = _estimate(height, width, chain.passes, costs)
+        # 两次推理质量更好，预估耗时在预算内时优先
+        if chain.estimated_seconds <= chain_budget:
+            return chain
+        return single
+
+    for model in alternatives or []:
+        if model.name == requested.name or model.scale < outscale - _EPSILON:
+            continue
+        costs[model.name] = model.seconds_per_pixel
+        if _same(outscale, model.scale):
+            add("native", [PlanPass(model.name, model.scale)])
+        else:
+            add("pre_downscale", [PlanPass(model.name, model.scale, outscale / model.scale)])
+
+    return min(candidates, key=lambda plan: plan.estimated_seconds)
@@ -0,0 +1,835 @@
+"""
+任务管理器
+负责图片处理任务的排队、调度和状态跟踪
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from ..config import settings
+from ..models.task import TaskState, TaskStatus
+from ..utils.exceptions import (
+    GPUMemoryError, ImageProcessingError, TaskCancelledError, TaskTimeoutError
+)
+from ..utils.image_io import decode_image, encode_image
+from .artifact_index import artifact_index
+from .model_manager import model_manager
+from .result_cache import link_or_copy, result_cache
+from .scale_planner import PlanPass, ScalePlan
+from .tiling import is_out_of_memory, shrink_tile_size
+from .worker_pool import worker_pool
+
+logger = logging.getLogger(__name__)
+
+# 各阶段结束时的进度百分比：解码 -> 推理 -> 编码
+_DECODE_PROGRESS = 5.0
+_INFER_PROGRESS = 95.0
+
+
+@dataclass
+class UpscaleJob:
+    """队列中的待处理任务"""
+
+    task_id: str
+    content: Optional[bytes]
+    file_ext: str
+    cache_key: Optional[str] = None
+    # 使用的模型，None为默认模型（不使用结果缓存时允许改用已驻留的其他模型）
+    model_name: Optional[str] = None
+    # 输出倍数，None为模型自身倍数
+    outscale: Optional[float] = None
+    # 同步内联模式：结果编码为字节后通过该Future直接返回给请求
+    future: Optional[asyncio.Future] = None
+    # 取消标记与超时截止时间（time.monotonic），在阶段之间和瓦片之间检查
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    cancel_reason: Optional[str] = None
+    deadline: Optional[float] = None
+
+    @property
+    def allow_substitute(self) -> bool:
+        """是否允许规划器改用已驻留的其他模型
+
+        仅限未指定模型且不写入结果缓存的任务：缓存键按默认模型计算，
+        改用其他模型的输出不能以同一个键缓存或被挂靠的任务共享。
+        """
+        return self.model_name is None and self.cache_key is None
+
+    def cancel(self, reason: str):
+        """标记任务取消，处理线程在下一个检查点中止"""
+        self.cancel_reason = reason
+        self.cancelled.set()
+
+    def check(self):
+        """检查点：任务已取消或超时时抛出异常"""
+        if self.cancelled.is_set():
+            raise TaskCancelledError(self.cancel_reason or "任务已取消")
+        if self.future is not None and self.future.cancelled():
+            raise TaskCancelledError("客户端已断开连接")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise TaskTimeoutError(f"任务处理超时（超过{settings.task_timeout}秒）")
+
+
+class TaskManager:
+    """任务管理器"""
+
+    def __init__(self):
+        self._tasks: Dict[str, TaskStatus] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._active = 0
+        # 排队中和处理中的任务：任务ID -> 任务，用于取消
+        self._jobs: Dict[str, UpscaleJob] = {}
+        # 处理中的相同输入：缓存键 -> 主任务ID，主任务ID -> 跟随任务ID列表
+        self._inflight: Dict[str, str] = {}
+        self._followers: Dict[str, List[str]] = {}
+        # 状态版本号与等待者，用于长轮询和SSE推送
+        self._versions: Dict[str, int] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        # 全局变更序号与各任务最近一次变更时的序号，用于批量查询增量返回
+        self._sequence = 0
+        self._changed_at: Dict[str, int] = {}
+
+    @property
+    def is_running(self) -> bool:
+        """检查工作池是否已启动"""
+        return bool(self._workers)
+
+    @property
+    def num_workers(self) -> int:
+        """工作协程数量"""
+        return len(self._workers)
+
+    @property
+    def active_tasks(self) -> int:
+        """正在处理的任务数"""
+        return self._active
+
+    @property
+    def model_ready(self) -> bool:
+        """是否可以处理任务：进程模式下有推理进程就绪，否则模型已加载（或空闲卸载后可重新加载）"""
+        if settings.use_worker_processes:
+            return worker_pool.is_ready
+        return model_manager.is_available
+
+    @property
+    def model_status(self) -> str:
+        """模型就绪状态：ready、loading（启动加载中）或failed（加载失败）
+
+        进程模式下推理进程加载失败会被自动重启，未就绪时均视为加载中。
+        """
+        if self.model_ready:
+            return "ready"
+        if (not settings.use_worker_processes and model_manager.load_error
+                and not model_manager.is_loading):
+            return "failed"
+        return "loading"
+
+    @property
+    def queue_length(self) -> int:
+        """排队中的任务数"""
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def is_full(self) -> bool:
+        """检查队列是否已满"""
+        return self._queue is not None and self._queue.full()
+
+    async def start(self):
+        """启动工作池"""
+        if self.is_running:
+            return
+
+        self._queue = asyncio.Queue(maxsize=settings.max_queue_size)
+        num_workers = settings.worker_count
+        # 有界线程池：解码、推理、编码均在此执行，不阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="upscale-worker"
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"upscale-worker-{i}")
+            for i in range(num_workers)
+        ]
+        # 进程模式：推理在独立进程中执行，线程池只负责解码和编码
+        if settings.use_worker_processes:
+            worker_pool.start(num_workers)
+        logger.info(f"任务工作池已启动，工作数: {num_workers}")
+
+    async def stop(self):
+        """停止工作池"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        worker_pool.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        logger.info("任务工作池已停止")
+
+    async def submit(self, task_id: str, content: bytes, file_ext: str,
+                     input_filename: Optional[str] = None,
+                     model_name: Optional[str] = None,
+                     outscale: Optional[float] = None) -> TaskStatus:
+        """提交任务
+
+        相同输入和参数的结果已缓存时直接返回已完成的任务；
+        相同输入正在处理时挂靠到处理中的任务，不重复推理。
+        """
+        if self._queue is None:
+            raise ImageProcessingError("任务队列未启动")
+
+        loop = asyncio.get_running_loop()
+        params = self._processing_params(file_ext, model_name, outscale)
+        task = TaskStatus(
+            task_id=task_id,
+            status=TaskState.PENDING,
+            message="任务已提交，等待处理",
+            created_at=datetime.now(),
+            input_filename=input_filename,
+            file_size=f"{len(content) / 1024:.1f}KB",
+            processing_params=params,
+        )
+
+        cache_key = None
+        if settings.cache_enabled:
+            cache_key = await loop.run_in_executor(None, result_cache.make_key, content, params)
+
+            cached = result_cache.get(cache_key, file_ext)
+            if cached is not None:
+                output_path = await loop.run_in_executor(None, self._link_output, task_id, cached)
+                now = datetime.now()
+                self._tasks[task_id] = task
+                self._update(
+                    task_id,
+                    status=TaskState.COMPLETED,
+                    progress=100.0,
+                    message="处理完成（缓存命中）",
+                    started_at=now,
+                    completed_at=now,
+                    processing_time=0.0,
+                    output_filename=output_path.name,
+                    download_url=f"/download/{task_id}",
+                )
+                return task
+
+            primary_id = self._inflight.get(cache_key)
+            if primary_id is not None:
+                primary = self._tasks[primary_id]
+                self._tasks[task_id] = task
+                self._update(
+                    task_id,
+                    status=primary.status,
+                    progress=primary.progress,
+                    message=primary.message,
+                    current_step=primary.current_step,
+                    started_at=primary.started_at,
+                )
+                self._followers.setdefault(primary_id, []).append(task_id)
+                return task
+
+        if self._queue.full():
+            raise ImageProcessingError("任务队列已满，请稍后重试")
+
+        # 先登记为处理中，提交期间到达的相同输入即可挂靠
+        job = UpscaleJob(task_id, content, file_ext, cache_key, model_name, outscale)
+        self._tasks[task_id] = task
+        self._jobs[task_id] = job
+        self._notify(task_id)
+        if cache_key is not None:
+            self._inflight[cache_key] = task_id
+
+        try:
+            # 上传内容直接在内存中解码，仅在开启审计时落盘
+            if settings.save_uploads:
+                input_path = settings.upload_dir / f"{task_id}_input{file_ext}"
+                await loop.run_in_executor(None, input_path.write_bytes, content)
+            self._queue.put_nowait(job)
+        except Exception as e:
+            message = "任务队列已满，请稍后重试" if isinstance(e, asyncio.QueueFull) else f"任务提交失败: {e}"
+            del self._tasks[task_id]
+            del self._jobs[task_id]
+            for follower_id in self._release(job):
+                self._update(follower_id, status=TaskState.FAILED, message=message,
+                             completed_at=datetime.now())
+            raise ImageProcessingError(message)
+        return task
+
+    async def run_inline(self, task_id: str, content: bytes, file_ext: str,
+                         model_name: Optional[str] = None,
+                         outscale: Optional[float] = None) -> bytes:
+        """同步内联处理：排队等待推理，结果在内存中编码后直接返回
+
+        不登记任务状态，不读写结果缓存；结果由store_inline在响应发送后保存。
+        """
+        if self._queue is None:
+            raise ImageProcessingError("任务队列未启动")
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(UpscaleJob(
+                task_id, content, file_ext, model_name=model_name, outscale=outscale, future=future
+            ))
+        except asyncio.QueueFull:
+            raise ImageProcessingError("任务队列已满，请稍后重试")
+        return await future
+
+    async def store_inline(self, task_id: str, data: bytes, file_ext: str):
+        """保存内联结果并登记到索引，之后可按任务ID下载
+
+        在响应发送后执行，写入已编码的数据，不再读回。
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._save_inline, task_id, data, file_ext)
+        except OSError as e:
+            logger.warning(f"内联任务 {task_id} 结果保存失败: {e}")
+
+    @staticmethod
+    def _save_inline(task_id: str, data: bytes, file_ext: str):
+        """写入内联结果文件"""
+        output_path = settings.output_dir / f"{task_id}_output{file_ext}"
+        output_path.write_bytes(data)
+        artifact_index.add(task_id, output_path)
+
+    def get_task(self, task_id: str) -> Optional[TaskStatus]:
+        """获取任务状态"""
+        return self._tasks.get(task_id)
+
+    def cancel(self, task_id: str, reason: str = "任务已被用户取消") -> Optional[TaskStatus]:
+        """取消排队中或处理中的任务
+
+        处理中的任务在下一个瓦片之间中止并释放内存。挂靠了跟随任务的
+        主任务只标记自身为已取消，推理继续为跟随任务完成。
+        """
+        task = self._tasks.get(task_id)
+        if task is None or task.is_finished:
+            return task
+
+        # 跟随任务：解除挂靠，主任务已无人等待时一并中止
+        for primary_id, followers in self._followers.items():
+            if task_id in followers:
+                followers.remove(task_id)
+                self._mark_cancelled(task_id, reason)
+                primary = self._tasks.get(primary_id)
+                if not followers and primary is not None and primary.status == TaskState.CANCELLED:
+                    self._abort(primary_id, reason)
+                return task
+
+        self._mark_cancelled(task_id, reason)
+        job = self._jobs.get(task_id)
+        if job is not None and job.cache_key is not None and self._inflight.get(job.cache_key) == task_id:
+            # 之后提交的相同输入不再挂靠到已取消的任务
+            del self._inflight[job.cache_key]
+        if not self._followers.get(task_id):
+            self._abort(task_id, reason)
+        return task
+
+    def remove(self, task_id: str) -> bool:
+        """删除已结束任务的记录和结果文件"""
+        task = self._tasks.get(task_id)
+        if task is not None and not task.is_finished:
+            return False
+        found = task is not None
+        if artifact_index.remove(task_id) is not None:
+            found = True
+        self._forget(task_id)
+        return found
+
+    def _mark_cancelled(self, task_id: str, reason: str):
+        """将任务记录标记为已取消（不同步给跟随任务）"""
+        task = self._tasks[task_id]
+        task.status = TaskState.CANCELLED
+        task.message = reason
+        task.current_step = None
+        task.estimated_remaining = None
+        task.completed_at = datetime.now()
+        if task.started_at is not None:
+            task.processing_time = (task.completed_at - task.started_at).total_seconds()
+        self._notify(task_id)
+
+    def _abort(self, task_id: str, reason: str):
+        """中止任务的处理，排队中的任务立即释放上传内容"""
+        job = self._jobs.get(task_id)
+        if job is None:
+            return
+        job.cancel(reason)
+        if job.deadline is None:
+            job.content = None
+
+    def prune(self, max_age: float) -> int:
+        """清理结束时间早于max_age秒之前的任务记录，返回清理数量"""
+        cutoff = datetime.now().timestamp() - max_age
+        expired = [
+            task_id for task_id, task in self._tasks.items()
+            if task.is_finished and task.completed_at is not None
+            and task.completed_at.timestamp() < cutoff
+            and task_id not in self._waiters
+        ]
+        for task_id in expired:
+            self._forget(task_id)
+        return len(expired)
+
+    def _forget(self, task_id: str):
+        """移除任务记录及其状态跟踪信息"""
+        self._tasks.pop(task_id, None)
+        self._versions.pop(task_id, None)
+        self._changed_at.pop(task_id, None)
+
+    def get_version(self, task_id: str) -> int:
+        """获取任务状态版本号，每次状态变化递增"""
+        return self._versions.get(task_id, 0)
+
+    @property
+    def sequence(self) -> int:
+        """当前全局变更序号"""
+        return self._sequence
+
+    def changed_since(self, task_id: str, cursor: int) -> bool:
+        """任务在游标之后是否发生过状态变化"""
+        return self._changed_at.get(task_id, 0) > cursor
+
+    async def wait_for_change(self, task_id: str, version: int, timeout: float) -> bool:
+        """等待任务状态版本号变化
+
+        Returns:
+            状态是否已变化（超时返回False）
+        """
+        if self.get_version(task_id) != version:
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(task_id, []).append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(task_id)
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[task_id]
+
+    async def wait_until_finished(self, task_id: str, timeout: float) -> Optional[TaskStatus]:
+        """长轮询：等待任务结束或超时，返回最新状态"""
+        deadline = time.monotonic() + timeout
+        while True:
+            task = self._tasks.get(task_id)
+            remaining = deadline - time.monotonic()
+            if task is None or task.is_finished or remaining <= 0:
+                return task
+            await self.wait_for_change(task_id, self.get_version(task_id), remaining)
+
+    def _update(self, task_id: str, **fields) -> Optional[TaskStatus]:
+        """更新任务状态字段（同步到挂靠的跟随任务）"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        # 已取消的任务状态不再变化，推理结果仍同步给跟随任务
+        if task.status != TaskState.CANCELLED:
+            for key, value in fields.items():
+                setattr(task, key, value)
+            self._notify(task_id)
+
+        shared = {k: v for k, v in fields.items() if k not in ("output_filename", "download_url")}
+        for follower_id in self._followers.get(task_id, ()):
+            follower = self._tasks.get(follower_id)
+            if follower is not None:
+                for key, value in shared.items():
+                    setattr(follower, key, value)
+                self._notify(follower_id)
+        return task
+
+    def _notify(self, task_id: str):
+        """递增版本号并唤醒等待该任务的协程"""
+        self._versions[task_id] = self._versions.get(task_id, 0) + 1
+        self._sequence += 1
+        self._changed_at[task_id] = self._sequence
+        for waiter in self._waiters.pop(task_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @staticmethod
+    def _processing_params(file_ext: str, model_name: Optional[str] = None,
+                           outscale: Optional[float] = None) -> Dict[str, Any]:
+        """影响输出结果的处理参数（同时作为缓存键的一部分）
+
+        引擎和精度取自配置而不是实际使用的引擎，避免为此导入PyTorch；
+        auto在有GPU时使用torch、否则使用cpu，两者的参数都计入。
+        """
+        spec = model_manager.get_spec(model_name or model_manager.default_model)
+        engine = settings.engine
+        return {
+            "model_name": spec.name,
+            "scale": spec.scale,
+            "outscale": float(outscale or spec.scale),
+            "tile_size": settings.tile_size,
+            "tile_pad": settings.tile_pad,
+            "pre_pad": settings.pre_pad,
+            "engine": engine,
+            # 半精度只用于torch引擎，低精度只用于cpu引擎
+            "half": settings.use_half_precision and engine in ("torch", "auto"),
+            "precision": settings.cpu_precision if engine in ("cpu", "auto") else "fp32",
+            "format": file_ext,
+        }
+
+    async def _worker(self, worker_id: int):
+        """工作协程：从队列中取出任务并处理"""
+        while True:
+            job = await self._queue.get()
+            self._active += 1
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                logger.error(f"工作协程 {worker_id} 处理任务异常: {e}", exc_info=True)
+            finally:
+                self._active -= 1
+                self._queue.task_done()
+
+    async def run_blocking(self, func: Callable[..., Any], *args) -> Any:
+        """在推理线程池中执行阻塞函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def _run_inline_job(self, job: UpscaleJob):
+        """执行同步内联任务，结果通过Future返回"""
+        # 客户端已断开，跳过处理
+        if job.future.done():
+            return
+
+        if settings.task_timeout > 0:
+            job.deadline = time.monotonic() + settings.task_timeout
+
+        try:
+            img = await self.run_blocking(self._decode, job)
+            job.check()
+            output = await self._execute(job, img)
+            del img
+            job.check()
+            data = await self.run_blocking(encode_image, output, job.file_ext)
+        except Exception as e:
+            logger.error(f"内联任务 {job.task_id} 处理失败: {e}")
+            # 丢弃异常栈帧引用的中间张量后再释放内存
+            e.__traceback__ = None
+            img = output = None
+            await self.run_blocking(model_manager.release_memory)
+            if not job.future.done():
+                if isinstance(e, (TaskCancelledError, TaskTimeoutError, GPUMemoryError)):
+                    job.future.set_exception(e)
+                else:
+                    job.future.set_exception(ImageProcessingError(f"图片处理失败: {str(e)}"))
+            return
+
+        if not job.future.done():
+            job.future.set_result(data)
+
+    async def _run_job(self, job: UpscaleJob):
+        """执行单个任务并更新状态"""
+        if job.future is not None:
+            await self._run_inline_job(job)
+            return
+
+        try:
+            await self._run_task_job(job)
+        finally:
+            self._jobs.pop(job.task_id, None)
+
+    async def _run_task_job(self, job: UpscaleJob):
+        """执行异步任务，超时和取消在阶段之间及瓦片之间检查"""
+        # 排队期间已被取消
+        if job.cancelled.is_set():
+            job.content = None
+            self._release(job)
+            return
+
+        if settings.task_timeout > 0:
+            job.deadline = time.monotonic() + settings.task_timeout
+        started = time.perf_counter()
+        self._update(
+            job.task_id,
+            status=TaskState.PROCESSING,
+            message="正在进行AI放大处理...",
+            current_step="读取图片",
+            started_at=datetime.now(),
+        )
+
+        try:
+            img = await self.run_blocking(self._decode, job)
+            height, width = img.shape[:2]
+            params = self._processing_params(job.file_ext, job.model_name, job.outscale)
+
+            def on_plan(plan: dict):
+                self._update(
+                    job.task_id,
+                    progress=_DECODE_PROGRESS,
+                    current_step="AI处理中",
+                    input_resolution=f"{width}x{height}",
+                    processing_params={
+                        **params,
+                        "tile_size": plan["passes"][0]["tile_size"],
+                        "plan": plan,
+                    },
+                )
+
+            job.check()
+            output = await self._execute(
+                job, img, on_plan,
+                self._progress_reporter(job.task_id),
+                self._downgrade_recorder(job.task_id),
+            )
+            del img
+            job.check()
+
+            self._update(
+                job.task_id,
+                progress=_INFER_PROGRESS,
+                current_step="保存结果",
+                estimated_remaining=0,
+                output_resolution=f"{output.shape[1]}x{output.shape[0]}",
+            )
+            output_path = await self.run_blocking(self._encode, job, output)
+            await self.run_blocking(self._publish, job, output_path)
+        except Exception as e:
+            cancelled = isinstance(e, TaskCancelledError)
+            if isinstance(e, (TaskCancelledError, TaskTimeoutError)):
+                logger.info(f"任务 {job.task_id} 已中止: {e}")
+                message = str(e)
+            else:
+                logger.error(f"任务 {job.task_id} 处理失败: {e}")
+                message = f"图片处理失败: {str(e)}"
+            # 丢弃异常栈帧引用的中间张量后再释放内存
+            e.__traceback__ = None
+            job.content = img = output = None
+            await self.run_blocking(model_manager.release_memory)
+            artifact_index.remove(job.task_id)
+            for follower_id in self._release(job):
+                self._update(follower_id, status=TaskState.FAILED, message=message,
+                             current_step=None, completed_at=datetime.now())
+            self._update(
+                job.task_id,
+                status=TaskState.CANCELLED if cancelled else TaskState.FAILED,
+                message=message,
+                current_step=None,
+                estimated_remaining=None,
+                completed_at=datetime.now(),
+                processing_time=time.perf_counter() - started,
+                error_details={"error": str(e), "type": type(e).__name__},
+            )
+            return
+
+        self._update(
+            job.task_id,
+            status=TaskState.COMPLETED,
+            progress=100.0,
+            message="处理完成",
+            current_step=None,
+            completed_at=datetime.now(),
+            processing_time=time.perf_counter() - started,
+            output_filename=output_path.name,
+            download_url=f"/download/{job.task_id}",
+        )
+        for follower_id in self._release(job):
+            self._update(
+                follower_id,
+                output_filename=f"{follower_id}_output{output_path.suffix}",
+                download_url=f"/download/{follower_id}",
+            )
+        # 主任务在处理中被取消，结果只保留给跟随任务
+        task = self._tasks.get(job.task_id)
+        if task is None or task.status == TaskState.CANCELLED:
+            artifact_index.remove(job.task_id)
+
+    async def _execute(self, job: UpscaleJob, img: np.ndarray,
+                       on_plan: Optional[Callable[[dict], None]] = None,
+                       on_progress: Optional[Callable[[int, int], None]] = None,
+                       on_downgrade: Optional[Callable[[int, int, str], None]] = None) -> np.ndarray:
+        """规划并执行推理：进程模式下交给推理进程池，否则在推理线程池中执行"""
+        if worker_pool.is_running:
+            return await worker_pool.infer(img, job, on_plan, on_progress, on_downgrade)
+
+        plan = await self.run_blocking(self._plan, job, img)
+        if on_plan is not None:
+            on_plan(plan.describe())
+        job.check()
+        return await self.run_blocking(self._infer, img, plan, on_progress, job.check, on_downgrade)
+
+    def _progress_reporter(self, task_id: str) -> Callable[[int, int], None]:
+        """创建瓦片进度回调（在推理线程中调用，状态更新投递回事件循环）"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        def report(done: int, total: int):
+            elapsed = time.perf_counter() - started
+            fraction = done / total
+            loop.call_soon_threadsafe(functools.partial(
+                self._update,
+                task_id,
+                progress=round(_DECODE_PROGRESS + (_INFER_PROGRESS - _DECODE_PROGRESS) * fraction, 1),
+                current_step=f"AI处理中 ({done}/{total})",
+                estimated_remaining=int(elapsed / done * (total - done)),
+            ))
+
+        return report
+
+    def _downgrade_recorder(self, task_id: str) -> Callable[[int, int, str], None]:
+        """创建瓦片降级回调，将每次降级记录到任务的processing_params"""
+        loop = asyncio.get_running_loop()
+
+        def record(previous: int, tile_size: int, reason: str):
+            loop.call_soon_threadsafe(self._record_downgrade, task_id, previous, tile_size, reason)
+
+        return record
+
+    def _record_downgrade(self, task_id: str, previous: int, tile_size: int, reason: str):
+        """记录一次内存不足导致的瓦片降级"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        params = dict(task.processing_params or {})
+        params["tile_size"] = tile_size
+        params["tile_downgrades"] = params.get("tile_downgrades", []) + [
+            {"from": previous, "to": tile_size, "reason": reason}
+        ]
+        self._update(task_id, processing_params=params)
+
+    def _release(self, job: UpscaleJob) -> List[str]:
+        """任务结束，解除缓存键的占用并返回跟随任务ID列表"""
+        if job.cache_key is not None and self._inflight.get(job.cache_key) == job.task_id:
+            del self._inflight[job.cache_key]
+        return self._followers.pop(job.task_id, [])
+
+    def _publish(self, job: UpscaleJob, output_path: Path):
+        """将结果写入缓存并链接给跟随任务"""
+        if job.cache_key is not None:
+            result_cache.put(job.cache_key, output_path)
+        for follower_id in self._followers.get(job.task_id, ()):
+            self._link_output(follower_id, output_path)
+
+    @staticmethod
+    def _link_output(task_id: str, src: Path) -> Path:
+        """将已有结果文件链接为任务的输出文件并登记索引"""
+        output_path = settings.output_dir / f"{task_id}_output{src.suffix}"
+        link_or_copy(src, output_path)
+        artifact_index.add(task_id, output_path)
+        return output_path
+
+    @staticmethod
+    def _decode(job: UpscaleJob) -> np.ndarray:
+        """从上传内容解码输入图片，解码后释放原始字节"""
+        img = decode_image(memoryview(job.content))
+        job.content = None
+
+        # 文件头无法解析尺寸的格式在解码后再次校验
+        height, width = img.shape[:2]
+        if width * height > settings.max_input_pixels:
+            raise ImageProcessingError(f"图片尺寸超出限制: {width}x{height}")
+        return img
+
+    @staticmethod
+    def _plan(job: UpscaleJob, img: np.ndarray) -> ScalePlan:
+        """为任务选择输出倍数的执行计划（允许时可改用已驻留的模型）"""
+        height, width = img.shape[:2]
+        return model_manager.plan_scale(
+            height, width, job.outscale, job.model_name, allow_substitute=job.allow_substitute
+        )
+
+    @staticmethod
+    def _infer(img: np.ndarray, plan: ScalePlan,
+               on_progress: Optional[Callable[[int, int], None]] = None,
+               check: Optional[Callable[[], None]] = None,
+               on_downgrade: Optional[Callable[[int, int, str], None]] = None) -> np.ndarray:
+        """按执行计划进行AI放大推理并缩放到目标倍数
+
+        check在每个瓦片之前调用以响应取消和超时。
+        """
+        height, width = img.shape[:2]
+        output = img
+        for index, step in enumerate(plan.passes):
+            if step.input_scale != 1.0:
+                h, w = output.shape[:2]
+                size = (max(1, round(w * step.input_scale)), max(1, round(h * step.input_scale)))
+                output = cv2.resize(output, size, interpolation=cv2.INTER_AREA)
+
+            # 多次推理时进度按次数均分
+            report = on_progress
+            if on_progress is not None and len(plan.passes) > 1:
+                def report(done, total, index=index):
+                    on_progress(index * total + done, len(plan.passes) * total)
+
+            output = TaskManager._run_pass(output, step, report, check, on_downgrade)
+
+        target = (max(1, round(width * plan.outscale)), max(1, round(height * plan.outscale)))
+        if (output.shape[1], output.shape[0]) != target:
+            interpolation = cv2.INTER_LANCZOS4 if target[0] > output.shape[1] else cv2.INTER_AREA
+            output = cv2.resize(output, target, interpolation=interpolation)
+        return output
+
+    @staticmethod
+    def _run_pass(img: np.ndarray, step: PlanPass,
+                  on_progress: Optional[Callable[[int, int], None]] = None,
+                  check: Optional[Callable[[], None]] = None,
+                  on_downgrade: Optional[Callable[[int, int, str], None]] = None) -> np.ndarray:
+        """执行一次模型推理
+
+        内存分配失败时释放缓存，将瓦片减半后重试，直到瓦片下限；
+        每次降级调用on_downgrade(原瓦片, 新瓦片, 原因)。
+        """
+        from .inference import enhance
+
+        height, width = img.shape[:2]
+        tile_size = step.tile_size
+        with model_manager.acquire(step.model_name) as model, \
+                model.lease(timeout=settings.task_timeout or None) as upsampler:
+            while True:
+                started = time.perf_counter()
+                try:
+                    output, _ = enhance(
+                        upsampler, img,
+                        batcher=model.batcher,
+                        tile_size=tile_size,
+                        on_progress=on_progress,
+                        check=check,
+                    )
+                    model.record_speed(height * width, time.perf_counter() - started)
+                    return output
+                except Exception as e:
+                    if not is_out_of_memory(e):
+                        raise
+                    reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+                    e.__traceback__ = None
+
+                model_manager.release_memory()
+                smaller = shrink_tile_size(tile_size, height, width, settings.min_tile_size)
+                if smaller is None:
+                    raise GPUMemoryError(f"内存不足，瓦片大小已降至下限{tile_size}仍无法处理: {reason}")
+                logger.warning(f"推理内存不足，瓦片大小 {tile_size} -> {smaller} 后重试: {reason}")
+                if on_downgrade is not None:
+                    on_downgrade(tile_size, smaller, reason)
+                step.tile_size = tile_size = smaller
+
+    @staticmethod
+    def _encode(job: UpscaleJob, output: np.ndarray) -> Path:
+        """编码并保存处理结果"""
+        output_path = settings.output_dir / f"{job.task_id}_output{job.file_ext}"
+        if not cv2.imwrite(str(output_path), output):
+            raise ImageProcessingError("无法保存处理结果")
+        artifact_index.add(job.task_id, output_path)
+        return output_path
+
+
+# 全局任务管理器实例
+task_manager = TaskManager()
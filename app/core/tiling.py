@@ -0,0 +1,150 @@
+"""
+瓦片大小规划
+根据图片尺寸、模型倍数和可用内存为每个请求选择瓦片大小
+"""
+
+import logging
+import math
+import sys
+from typing import TYPE_CHECKING, Optional
+
+import psutil
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+# 探测模型激活内存时使用的输入边长
+_PROBE_SIZE = 32
+
+# 激活内存估算的安全系数：叶子模块统计不含拼接副本、分配器碎片等，
+# CPU上实测峰值约为估算值的1.6倍，再留出余量
+_SAFETY_FACTOR = 2.0
+
+# 瓦片边长对齐单位，使不同请求的瓦片形状一致便于合批
+TILE_ALIGN = 32
+
+
+def measure_activation_bytes(model: "torch.nn.Module", device: "torch.device",
+                             half: bool = False) -> float:
+    """校准模型每个输入像素的峰值激活内存（字节）
+
+    用小尺寸输入执行一次前向计算，在每个叶子模块上统计输入与输出
+    张量的总大小，取最大值按输入像素数归一化。RRDBNet的激活内存与
+    输入面积成正比，因此可以线性外推到任意瓦片尺寸。
+    """
+    import torch
+
+    peak = 0
+
+    def hook(module, inputs, output):
+        nonlocal peak
+        size = sum(t.numel() * t.element_size() for t in inputs if torch.is_tensor(t))
+        if torch.is_tensor(output):
+            size += output.numel() * output.element_size()
+        peak = max(peak, size)
+
+    handles = [
+        module.register_forward_hook(hook)
+        for module in model.modules() if next(module.children(), None) is None
+    ]
+    try:
+        probe = torch.zeros(1, 3, _PROBE_SIZE, _PROBE_SIZE, device=device)
+        if half:
+            probe = probe.half()
+        with torch.no_grad():
+            model(probe)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    return peak / (_PROBE_SIZE * _PROBE_SIZE)
+
+
+def available_memory(device: "torch.device") -> int:
+    """获取推理设备当前可用内存（字节）"""
+    if device.type == "cuda":
+        import torch
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    return psutil.virtual_memory().available
+
+
+def image_bytes(height: int, width: int, scale: int) -> int:
+    """估算与瓦片大小无关的整图内存：输入张量、输出张量及后处理副本"""
+    # 输入float32 + 输出float32张量 + 输出float32数组 + 输出uint8数组
+    return height * width * (3 * 4 + 3 * scale * scale * (4 + 4 + 1))
+
+
+def select_tile_size(height: int, width: int, scale: int, activation_bytes: float,
+                     budget: float, tile_pad: int, pre_pad: int = 0,
+                     parallel: int = 1, min_tile: int = TILE_ALIGN) -> int:
+    """选择内存预算内最大的瓦片
+
+    Args:
+        height, width: 输入图片尺寸
+        scale: 模型放大倍数
+        activation_bytes: 每个输入像素的峰值激活内存（见measure_activation_bytes）
+        budget: 本请求可用的内存预算（字节）
+        tile_pad: 瓦片填充
+        pre_pad: 预填充
+        parallel: 同时执行前向计算的瓦片数（合批大小）
+        min_tile: 瓦片大小下限
+
+    Returns:
+        瓦片大小，0表示整图推理
+    """
+    per_pixel = activation_bytes * _SAFETY_FACTOR
+    budget -= image_bytes(height, width, scale)
+
+    # 整图放得下时不分块
+    if (height + pre_pad) * (width + pre_pad) * per_pixel <= budget:
+        return 0
+
+    tile_pixels = max(budget, 0) / (per_pixel * max(1, parallel))
+    tile = int(math.sqrt(tile_pixels)) - 2 * tile_pad
+    tile = max(min_tile, tile // TILE_ALIGN * TILE_ALIGN)
+    if tile >= max(height, width):
+        return 0
+    return tile
+
+
+def memory_budget(device: "torch.device", threshold: float,
+                  workers: int) -> Optional[float]:
+    """按内存阈值和并发工作数计算单个请求的内存预算（字节）"""
+    try:
+        return available_memory(device) * threshold / max(1, workers)
+    except Exception as e:
+        logger.warning(f"无法获取可用内存: {e}")
+        return None
+
+
+# 分配器内存不足错误的特征信息（CUDA、CPU分配器）
+_OOM_MARKERS = ("out of memory", "can't allocate memory", "failed to allocate")
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """判断异常是否为内存分配失败"""
+    if isinstance(error, MemoryError):
+        return True
+    # 尚未导入PyTorch时不会产生其内存错误
+    torch = sys.modules.get("torch")
+    if torch is not None and isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    return isinstance(error, RuntimeError) and any(
+        marker in str(error).lower() for marker in _OOM_MARKERS
+    )
+
+
+def shrink_tile_size(tile: int, height: int, width: int,
+                     min_tile: int = TILE_ALIGN) -> Optional[int]:
+    """内存不足时将瓦片减半（整图推理从最长边的一半开始）
+
+    Returns:
+        新的瓦片大小，已到达下限时返回None
+    """
+    current = tile or max(height, width)
+    if current <= min_tile:
+        return None
+    return max(min_tile, current // 2 // TILE_ALIGN * TILE_ALIGN)
@@ -0,0 +1,594 @@
+"""
+推理进程池
+在独立进程中运行推理，每个进程持有自己的模型，使CPU推理不受单进程GIL限制
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from ..config import settings
+from ..utils.exceptions import (
+    GPUMemoryError, ImageProcessingError, TaskCancelledError, TaskTimeoutError
+)
+
+logger = logging.getLogger(__name__)
+
+# 输入共享内存块头部：第0字节为取消标记，图片数据从对齐的偏移处开始
+_HEADER_SIZE = 64
+
+# 等待结果时检查任务取消和超时的间隔（秒）
+_CHECK_INTERVAL = 0.1
+
+# 读取线程的轮询间隔（秒），用于检查进程存活和到期的重启
+_POLL_INTERVAL = 0.5
+
+# 进程在加载模型前连续退出时的重启退避上限（秒）
+_MAX_RESTART_DELAY = 30.0
+
+# 子进程中可以原样重建的异常类型
+_ERRORS = {
+    cls.__name__: cls
+    for cls in (TaskCancelledError, TaskTimeoutError, GPUMemoryError, ImageProcessingError)
+}
+
+
+@dataclass(eq=False)
+class _WorkerSlot:
+    """推理进程槽位，进程退出后在同一槽位重启"""
+
+    index: int
+    process: Optional[multiprocessing.process.BaseProcess] = None
+    conn: Optional[Connection] = None
+    ready: bool = False
+    # 已分配给该进程、尚未结束的任务
+    inflight: Set[int] = field(default_factory=set)
+    completed: int = 0
+    restarts: int = 0
+    # 加载模型前连续退出的次数及下次重启时间（time.monotonic）
+    failures: int = 0
+    restart_at: Optional[float] = None
+
+
+@dataclass
+class _PendingJob:
+    """已分配给推理进程的任务"""
+
+    job_id: int
+    request: tuple
+    block: shared_memory.SharedMemory
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+    on_plan: Optional[Callable[[dict], None]] = None
+    on_progress: Optional[Callable[[int, int], None]] = None
+    on_downgrade: Optional[Callable[[int, int, str], None]] = None
+    # 分配到的进程，暂无存活进程时为None
+    worker: Optional[_WorkerSlot] = None
+    # 子进程已开始处理；进程退出时未开始的任务转交给其他进程
+    started: bool = False
+
+
+class InferenceWorkerPool:
+    """推理进程池
+
+    解码后的图片写入共享内存块交给推理进程，结果由推理进程写入新的
+    共享内存块返回，进程间只传递块名称和形状。任务分配给未完成任务
+    最少的进程；进程异常退出后自动重启，未开始的任务转交给其他进程。
+
+    Args:
+        target: 推理进程入口，参数为槽位序号和管道连接（测试中替换为桩模型）
+    """
+
+    def __init__(self, target: Optional[Callable[[int, Connection], None]] = None):
+        self._context = multiprocessing.get_context("spawn")
+        self._target = target or _worker_main
+        self._workers: List[_WorkerSlot] = []
+        self._pending: Dict[int, _PendingJob] = {}
+        # 暂无存活进程可分配的任务，进程重启后分配
+        self._backlog: List[int] = []
+        # 已被替换、处理完已分配的任务后退出的旧进程
+        self._retired: List[_WorkerSlot] = []
+        # 重新加载时正在加载模型的替换进程，就绪或退出时设置_standby_settled
+        self._standby: Optional[_WorkerSlot] = None
+        self._standby_settled = threading.Event()
+        self._reload_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._reader: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        """检查进程池是否已启动"""
+        return self._reader is not None
+
+    @property
+    def ready_workers(self) -> int:
+        """已加载模型、可以处理任务的进程数"""
+        return sum(1 for worker in self._workers if worker.ready)
+
+    @property
+    def is_ready(self) -> bool:
+        """是否有进程可以处理任务"""
+        return self.ready_workers > 0
+
+    def start(self, num_workers: int):
+        """启动推理进程"""
+        if self.is_running:
+            return
+        self._stopping.clear()
+        self._workers = [_WorkerSlot(index=i) for i in range(num_workers)]
+        for worker in self._workers:
+            self._spawn(worker)
+        self._reader = threading.Thread(target=self._read_loop, name="worker-pool-reader", daemon=True)
+        self._reader.start()
+        logger.info(f"推理进程池已启动，进程数: {num_workers}")
+
+    def stop(self, timeout: float = 5.0):
+        """停止推理进程，未完成的任务以失败结束"""
+        if not self.is_running:
+            return
+        self._stopping.set()
+        self._reader.join()
+        self._reader = None
+
+        workers = self._all_workers()
+        for worker in workers:
+            self._send(worker, None)
+        for worker in workers:
+            if worker.process is not None:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join()
+            if worker.conn is not None:
+                worker.conn.close()
+
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for job in pending:
+            self._resolve(job, error=ImageProcessingError("推理进程已停止"))
+        self._workers = []
+        self._retired = []
+        self._standby = None
+        self._backlog = []
+        logger.info("推理进程池已停止")
+
+    def reload(self) -> bool:
+        """逐个替换推理进程，替换进程加载新模型并就绪后再回收旧进程
+
+        旧进程处理完已分配的任务后退出，替换期间始终有进程可用。替换进程
+        加载失败时保留旧进程，不再替换其余进程并返回False。调用会阻塞到
+        替换结束，应在线程中执行。
+        """
+        with self._reload_lock:
+            for index in range(len(self._workers)):
+                if not self._replace(index):
+                    return False
+        logger.info("推理进程已全部替换为重新加载模型的进程")
+        return True
+
+    def _replace(self, index: int) -> bool:
+        """启动替换进程，就绪后接替槽位上的旧进程"""
+        with self._lock:
+            if not self.is_running:
+                return False
+            standby = _WorkerSlot(index=index)
+            self._standby_settled.clear()
+            self._spawn(standby)
+            self._standby = standby
+
+        while not self._standby_settled.wait(_POLL_INTERVAL):
+            if self._stopping.is_set():
+                break
+
+        with self._lock:
+            self._standby = None
+            if not standby.ready:
+                logger.error(f"推理进程 {index} 的替换进程加载模型失败，继续使用原进程")
+                _terminate(standby)
+                return False
+            old = self._workers[index]
+            standby.completed = old.completed
+            standby.restarts = old.restarts
+            self._workers[index] = standby
+            if old.conn is not None:
+                self._retired.append(old)
+                self._send(old, None)
+            self._dispatch_backlog()
+        logger.info(f"推理进程 {index} 已替换 (pid={standby.process.pid})")
+        return True
+
+    async def infer(self, img: np.ndarray, job: Any,
+                    on_plan: Optional[Callable[[dict], None]] = None,
+                    on_progress: Optional[Callable[[int, int], None]] = None,
+                    on_downgrade: Optional[Callable[[int, int, str], None]] = None) -> np.ndarray:
+        """在推理进程中按输出倍数规划并推理
+
+        Args:
+            img: 解码后的输入图片
+            job: 任务（UpscaleJob），提供模型、输出倍数、截止时间和取消检查
+            on_plan: 执行计划确定后在事件循环中调用，参数为计划描述
+            on_progress, on_downgrade: 进度和瓦片降级回调（在读取线程中调用）
+        """
+        if not self.is_running:
+            raise ImageProcessingError("推理进程池未启动")
+
+        # 大图复制耗时较长，在线程中执行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        block = await loop.run_in_executor(None, _share_image, img)
+        with self._lock:
+            self._sequence += 1
+            request = (self._sequence, block.name, img.shape, img.dtype.str,
+                       job.model_name, job.outscale, job.allow_substitute, job.deadline)
+            pending = _PendingJob(
+                self._sequence, request, block, loop, loop.create_future(),
+                on_plan, on_progress, on_downgrade,
+            )
+            self._pending[pending.job_id] = pending
+            self._dispatch(pending)
+
+        try:
+            while True:
+                done, _ = await asyncio.wait({pending.future}, timeout=_CHECK_INTERVAL)
+                if done:
+                    break
+                try:
+                    job.check()
+                except (TaskCancelledError, TaskTimeoutError):
+                    # 设置共享内存中的取消标记，推理进程在下一个瓦片前中止
+                    block.buf[0] = 1
+            try:
+                return pending.future.result()
+            except (TaskCancelledError, TaskTimeoutError):
+                # 以本进程记录的取消原因为准
+                job.check()
+                raise
+        finally:
+            block.buf[0] = 1
+            self._finish(pending)
+
+    def get_stats(self) -> dict:
+        """获取进程池状态"""
+        return {
+            "enabled": self.is_running,
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid if worker.process is not None else None,
+                    "alive": worker.process is not None and worker.process.is_alive(),
+                    "ready": worker.ready,
+                    "inflight": len(worker.inflight),
+                    "completed": worker.completed,
+                    "restarts": worker.restarts,
+                }
+                for worker in self._workers
+            ],
+            "pending": len(self._pending),
+        }
+
+    def _all_workers(self) -> List[_WorkerSlot]:
+        """槽位上的进程、待退出的旧进程和正在加载的替换进程"""
+        with self._lock:
+            standby = [self._standby] if self._standby is not None else []
+            return self._workers + self._retired + standby
+
+    def _spawn(self, worker: _WorkerSlot):
+        """在槽位上启动推理进程"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=self._target,
+            args=(worker.index, child_conn),
+            name=f"upscale-infer-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        # 关闭父进程持有的子端，子进程退出时父端读到EOF
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.ready = False
+        worker.restart_at = None
+
+    def _send(self, worker: _WorkerSlot, message: Optional[tuple]) -> bool:
+        """向推理进程发送消息，进程已退出时返回False"""
+        if worker.conn is None:
+            return False
+        try:
+            worker.conn.send(message)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _dispatch(self, pending: _PendingJob):
+        """将任务分配给未完成任务最少的进程（需持有锁）"""
+        candidates = [w for w in self._workers if w.conn is not None]
+        if not candidates:
+            pending.worker = None
+            self._backlog.append(pending.job_id)
+            return
+        # 优先已就绪的进程，其次未完成任务最少的进程
+        worker = min(candidates, key=lambda w: (not w.ready, len(w.inflight), w.index))
+        pending.worker = worker
+        pending.started = False
+        worker.inflight.add(pending.job_id)
+        # 发送失败说明进程已退出，由读取线程在处理退出时转交
+        self._send(worker, pending.request)
+
+    def _dispatch_backlog(self):
+        """分配暂无存活进程时积压的任务（需持有锁）"""
+        backlog, self._backlog = self._backlog, []
+        for job_id in backlog:
+            if job_id in self._pending:
+                self._dispatch(self._pending[job_id])
+
+    def _finish(self, pending: _PendingJob):
+        """任务结束，释放输入共享内存块"""
+        with self._lock:
+            self._pending.pop(pending.job_id, None)
+            if pending.worker is not None:
+                pending.worker.inflight.discard(pending.job_id)
+        pending.block.close()
+        try:
+            pending.block.unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _resolve(pending: _PendingJob, result: Optional[np.ndarray] = None,
+                 error: Optional[BaseException] = None):
+        """在事件循环中设置任务结果"""
+        def apply():
+            if pending.future.done():
+                return
+            if error is not None:
+                pending.future.set_exception(error)
+            else:
+                pending.future.set_result(result)
+
+        try:
+            pending.loop.call_soon_threadsafe(apply)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _read_loop(self):
+        """读取推理进程的消息，处理进程退出和重启"""
+        while not self._stopping.is_set():
+            conns = {worker.conn: worker for worker in self._all_workers() if worker.conn is not None}
+            for conn in wait(list(conns), timeout=_POLL_INTERVAL):
+                worker = conns[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._handle_exit(worker)
+                    continue
+                try:
+                    self._handle_message(worker, message)
+                except Exception as e:
+                    logger.error(f"处理推理进程消息失败: {e}")
+
+            now = time.monotonic()
+            for worker in self._workers:
+                if worker.restart_at is not None and now >= worker.restart_at:
+                    with self._lock:
+                        self._spawn(worker)
+                        worker.restarts += 1
+                        self._dispatch_backlog()
+
+    def _handle_message(self, worker: _WorkerSlot, message: tuple):
+        """处理推理进程发来的消息"""
+        kind = message[0]
+        if kind == "ready":
+            worker.ready = True
+            worker.failures = 0
+            logger.info(f"推理进程 {worker.index} 已就绪 (pid={message[1]})")
+            if worker is self._standby:
+                self._standby_settled.set()
+            return
+
+        pending = self._pending.get(message[1])
+        if pending is None:
+            # 任务已结束（取消或超时），子进程稍后返回的结果直接释放
+            if kind == "done":
+                _discard_block(message[2])
+            return
+
+        if kind == "started":
+            pending.started = True
+        elif kind == "plan":
+            if pending.on_plan is not None:
+                pending.loop.call_soon_threadsafe(pending.on_plan, message[2])
+        elif kind == "progress":
+            if pending.on_progress is not None:
+                pending.on_progress(message[2], message[3])
+        elif kind == "downgrade":
+            if pending.on_downgrade is not None:
+                pending.on_downgrade(message[2], message[3], message[4])
+        elif kind == "done":
+            worker.completed += 1
+            self._resolve(pending, result=_take_block(message[2], message[3], message[4]))
+        elif kind == "error":
+            error_type = _ERRORS.get(message[2], RuntimeError)
+            self._resolve(pending, error=error_type(message[3]))
+
+    def _handle_exit(self, worker: _WorkerSlot):
+        """推理进程退出：结束正在处理的任务，安排重启"""
+        worker.process.join()
+        exitcode = worker.process.exitcode
+        worker.conn.close()
+        worker.conn = None
+
+        with self._lock:
+            if worker is self._standby:
+                # 替换进程在就绪前退出，由reload保留旧进程
+                logger.error(f"推理进程 {worker.index} 的替换进程异常退出，退出码: {exitcode}")
+                self._standby_settled.set()
+                return
+
+            assigned = [self._pending[job_id] for job_id in worker.inflight if job_id in self._pending]
+            worker.inflight.clear()
+            lost = [pending for pending in assigned if pending.started]
+
+            if worker in self._retired:
+                self._retired.remove(worker)
+                logger.info(f"推理进程 {worker.index} 的旧进程已退出")
+            else:
+                logger.error(f"推理进程 {worker.index} 异常退出，退出码: {exitcode}")
+                if not worker.ready:
+                    worker.failures += 1
+                delay = min(_MAX_RESTART_DELAY, 2.0 ** worker.failures - 1)
+                worker.restart_at = time.monotonic() + delay
+            worker.ready = False
+
+            # 尚未开始的任务转交给其他进程
+            for pending in assigned:
+                if not pending.started:
+                    self._dispatch(pending)
+
+        for pending in lost:
+            self._resolve(pending, error=ImageProcessingError(
+                f"推理进程异常退出（退出码{exitcode}）"
+            ))
+
+
+def _terminate(worker: _WorkerSlot):
+    """结束未就绪的进程并关闭连接"""
+    if worker.process is not None and worker.process.is_alive():
+        worker.process.terminate()
+        worker.process.join()
+    if worker.conn is not None:
+        worker.conn.close()
+        worker.conn = None
+
+
+def _share_image(img: np.ndarray) -> shared_memory.SharedMemory:
+    """将输入图片复制到新的共享内存块，取消标记置0"""
+    block = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + img.nbytes)
+    block.buf[0] = 0
+    np.ndarray(img.shape, img.dtype, buffer=block.buf, offset=_HEADER_SIZE)[...] = img
+    return block
+
+
+def _take_block(name: str, shape: tuple, dtype: str) -> np.ndarray:
+    """从推理进程创建的共享内存块复制结果并释放该块"""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, np.dtype(dtype), buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _discard_block(name: str):
+    """释放无人接收的结果共享内存块"""
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _worker_main(index: int, conn: Connection):
+    """推理进程入口：加载模型后依次处理任务"""
+    # 中断信号由主进程处理，子进程随主进程停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=getattr(logging, settings.log_level.upper()),
+        format=f'%(asctime)s - %(name)s[{index}] - %(levelname)s - %(message)s'
+    )
+
+    from .cpu_engine import configure_threads
+    from .model_manager import model_manager
+    from .task_manager import TaskManager
+
+    # 各推理进程均分CPU核心
+    configure_threads()
+    send_lock = threading.Lock()
+
+    def send(*message):
+        with send_lock:
+            conn.send(message)
+
+    model_manager.load_model()
+    send("ready", os.getpid())
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        _serve(request, send, model_manager, TaskManager)
+    conn.close()
+
+
+def _serve(request: tuple, send: Callable[..., None], model_manager, task_manager_cls):
+    """在推理进程中处理一个任务"""
+    job_id, name, shape, dtype, model_name, outscale, allow_substitute, deadline = request
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        # 任务在开始前已结束
+        return
+
+    img = output = None
+    try:
+        if block.buf[0]:
+            return
+        send("started", job_id)
+        img = np.ndarray(shape, np.dtype(dtype), buffer=block.buf, offset=_HEADER_SIZE)
+
+        def check():
+            if block.buf[0]:
+                raise TaskCancelledError("任务已取消")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TaskTimeoutError(f"任务处理超时（超过{settings.task_timeout}秒）")
+
+        height, width = shape[:2]
+        plan = model_manager.plan_scale(
+            height, width, outscale, model_name, allow_substitute=allow_substitute
+        )
+        send("plan", job_id, plan.describe())
+        output = task_manager_cls._infer(
+            img, plan,
+            on_progress=lambda done, total: send("progress", job_id, done, total),
+            check=check,
+            on_downgrade=lambda previous, tile, reason: send("downgrade", job_id, previous, tile, reason),
+        )
+        img = None
+        check()
+
+        result = shared_memory.SharedMemory(create=True, size=max(1, output.nbytes))
+        np.ndarray(output.shape, output.dtype, buffer=result.buf)[...] = output
+        send("done", job_id, result.name, output.shape, output.dtype.str)
+        result.close()
+    except Exception as e:
+        e.__traceback__ = None
+        img = output = None
+        model_manager.release_memory()
+        send("error", job_id, type(e).__name__, str(e))
+    finally:
+        img = output = None
+        try:
+            block.close()
+        except BufferError:
+            # 仍有数组引用输入块，映射在其释放后由垃圾回收关闭
+            pass
+
+
+# 全局推理进程池实例
+worker_pool = InferenceWorkerPool()
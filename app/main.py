@@ -3,18 +3,26 @@
 基于FastAPI + Pydantic的企业级架构
 """
 
+import asyncio
 import logging
+import time
 import warnings
 from contextlib import asynccontextmanager
 from datetime import datetime
 
+import psutil
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from .config import settings
+from .core.artifact_index import artifact_index
+from .core.janitor import artifact_janitor
 from .core.model_manager import model_manager
+from .core.result_cache import result_cache
+from .core.task_manager import task_manager
 from .utils.exceptions import BaseAPIException
+from .utils.upload import MULTIPART_OVERHEAD, UploadSizeLimitMiddleware
 from .models.response import ErrorResponse
 
 # 过滤警告
@@ -30,6 +38,32 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def load_model_in_background():
+    """在后台线程中导入推理库并加载默认模型，服务在加载期间即可接受请求"""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, model_manager.load_model)
+        # 从进程启动到模型完成首次推理（预热）的耗时
+        elapsed = time.time() - psutil.Process().create_time()
+        logger.info(f"✅ AI模型加载成功，启动至首次推理: {elapsed:.2f}秒")
+    except Exception as e:
+        logger.error(f"❌ AI模型加载失败: {e}")
+
+
+async def rebuild_indexes_in_background():
+    """在后台线程中扫描输出目录和缓存目录重建索引
+
+    文件很多时扫描耗时较长，不阻塞服务启动；完成前查找未命中的结果按文件名在目录中检查。
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, artifact_index.rebuild)
+        if settings.cache_enabled:
+            await loop.run_in_executor(None, result_cache.load_index)
+    except Exception as e:
+        logger.error(f"❌ 结果索引重建失败: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
@@ -39,13 +73,19 @@ async def lifespan(app: FastAPI):
     # 创建必要目录
     settings.create_directories()
     
-    # 加载AI模型
-    try:
-        model_manager.load_model()
-        logger.info("✅ AI模型加载成功")
-    except Exception as e:
-        logger.error(f"❌ AI模型加载失败: {e}")
-        # 根据需要决定是否继续启动服务
+    # 后台重建结果文件索引和结果缓存索引
+    index_loader = asyncio.create_task(rebuild_indexes_in_background())
+    
+    # 后台加载AI模型，就绪前/health/ready和/upscale返回503（进程模式下由各推理进程自行加载）
+    model_loader = None
+    if not settings.use_worker_processes:
+        model_loader = asyncio.create_task(load_model_in_background())
+    
+    # 启动任务工作池
+    await task_manager.start()
+    
+    # 启动文件清理器
+    await artifact_janitor.start()
     
     # 记录启动信息
     logger.info(f"📍 本地访问: http://localhost:{settings.port}")
@@ -56,6 +96,12 @@ async def lifespan(app: FastAPI):
     
     # 关闭时执行
     logger.info("🛑 正在关闭API服务...")
+    if model_loader is not None and not model_loader.done():
+        # 加载线程无法中断，等待其结束后再卸载模型
+        await model_loader
+    await index_loader
+    await artifact_janitor.stop()
+    await task_manager.stop()
     model_manager.unload_model()
     logger.info("✅ API服务已关闭")
 
@@ -79,6 +125,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 上传大小限制中间件：请求体边到达边计数，超限立即返回413
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=settings.max_file_size + MULTIPART_OVERHEAD,
+    paths=["/upscale"],
+)
+
 
 # 全局异常处理器
 @app.exception_handler(BaseAPIException)
@@ -116,7 +169,7 @@ async def root():
         "message": settings.app_name,
         "version": settings.app_version,
         "status": "running",
-        "model_loaded": model_manager.is_loaded,
+        "model_loaded": task_manager.model_ready,
         "docs_url": "/docs",
         "redoc_url": "/redoc"
     }
@@ -144,5 +197,6 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=settings.reload,
+        workers=settings.server_workers,
         log_level=settings.log_level.lower()
     ) 
\ No newline at end of file
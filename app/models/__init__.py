@@ -2,15 +2,24 @@
 Pydantic数据模型包
 """
 
-from .request import UpscaleRequest
-from .response import UpscaleResponse, TaskStatusResponse, SystemStatusResponse
+from .request import UpscaleRequest, BulkStatusRequest
+from .response import (
+    UpscaleResponse,
+    TaskStatusResponse,
+    SystemStatusResponse,
+    TaskBrief,
+    BulkStatusResponse,
+)
 from .task import TaskStatus, TaskState
 
 __all__ = [
     "UpscaleRequest",
+    "BulkStatusRequest",
     "UpscaleResponse", 
     "TaskStatusResponse",
     "SystemStatusResponse",
+    "TaskBrief",
+    "BulkStatusResponse",
     "TaskStatus",
     "TaskState",
 ] 
\ No newline at end of file
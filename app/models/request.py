@@ -2,7 +2,7 @@
 请求数据模型
 """
 
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field, validator
 
 
@@ -72,4 +72,22 @@ class UpscaleRequest(BaseModel):
                 "pre_pad": 0,
                 "use_half_precision": True
             }
-        } 
\ No newline at end of file
+        } 
+
+
+class BulkStatusRequest(BaseModel):
+    """批量任务状态查询请求模型"""
+    
+    task_ids: List[str] = Field(
+        min_length=1,
+        max_length=1000,
+        description="要查询的任务ID列表",
+        example=["123e4567-e89b-12d3-a456-426614174000"]
+    )
+    
+    since: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="变更游标，只返回该游标之后状态发生变化的任务",
+        example=None
+    )
@@ -51,6 +51,43 @@ class TaskStatusResponse(BaseModel):
     )
 
 
+class TaskBrief(BaseModel):
+    """精简任务状态（用于批量查询）"""
+    
+    task_id: str = Field(description="任务ID")
+    
+    status: str = Field(description="任务状态")
+    
+    progress: float = Field(default=0.0, description="任务进度百分比")
+    
+    download_url: Optional[str] = Field(default=None, description="下载链接")
+    
+    message: Optional[str] = Field(default=None, description="状态消息")
+
+
+class BulkStatusResponse(BaseModel):
+    """批量任务状态响应模型"""
+    
+    cursor: int = Field(description="当前变更游标，下次查询作为since传入")
+    
+    tasks: List[TaskBrief] = Field(description="任务状态列表")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "cursor": 1024,
+                "tasks": [
+                    {
+                        "task_id": "123e4567-e89b-12d3-a456-426614174000",
+                        "status": "completed",
+                        "progress": 100.0,
+                        "download_url": "/download/123e4567-e89b-12d3-a456-426614174000"
+                    }
+                ]
+            }
+        }
+
+
 class SystemStatusResponse(BaseModel):
     """系统状态响应模型"""
     
@@ -76,6 +113,16 @@ class SystemStatusResponse(BaseModel):
     version: str = Field(description="API版本")
 
 
+class ReadinessResponse(BaseModel):
+    """就绪检查响应模型"""
+    
+    status: str = Field(description="就绪状态：ready、loading、failed")
+    
+    timestamp: str = Field(description="检查时间戳")
+    
+    error: Optional[str] = Field(default=None, description="模型加载失败的原因")
+
+
 class TaskListResponse(BaseModel):
     """任务列表响应模型"""
     
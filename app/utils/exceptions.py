@@ -40,6 +40,20 @@ class TaskNotFoundError(BaseAPIException):
         super().__init__(f"任务不存在: {task_id}", "TASK_NOT_FOUND")
 
 
+class TaskCancelledError(BaseAPIException):
+    """任务已取消"""
+    
+    def __init__(self, message: str):
+        super().__init__(message, "TASK_CANCELLED")
+
+
+class TaskTimeoutError(BaseAPIException):
+    """任务处理超时"""
+    
+    def __init__(self, message: str):
+        super().__init__(message, "TASK_TIMEOUT")
+
+
 class GPUMemoryError(BaseAPIException):
     """GPU内存错误"""
     
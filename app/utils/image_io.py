@@ -0,0 +1,162 @@
+"""
+图片编解码工具
+"""
+
+import mimetypes
+import struct
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .exceptions import ImageProcessingError
+
+
+def decode_image(buffer: Union[bytes, bytearray, memoryview],
+                 flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """直接从内存缓冲区解码图片（不经过磁盘）"""
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if data.size == 0:
+        raise ImageProcessingError("图片内容为空")
+
+    img = cv2.imdecode(data, flags)
+    if img is None:
+        raise ImageProcessingError("无法解码图片文件")
+    return img
+
+
+def encode_image(img: np.ndarray, ext: str) -> bytes:
+    """在内存中将图片编码为指定格式"""
+    ok, buffer = cv2.imencode(ext, img)
+    if not ok:
+        raise ImageProcessingError(f"无法编码为{ext}格式")
+    return buffer.tobytes()
+
+
+def media_type_for(ext: str) -> str:
+    """根据扩展名获取图片MIME类型"""
+    media_type, _ = mimetypes.guess_type(f"image{ext}")
+    return media_type or "application/octet-stream"
+
+
+# JPEG中携带尺寸信息的SOF标记
+_JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+}
+
+
+def _png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 24:
+        return None
+    if data[12:16] != b"IHDR":
+        raise ImageProcessingError("PNG文件头无效")
+    return struct.unpack(">II", data[16:24])
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    pos = 2
+    while True:
+        # 跳过填充字节，定位到下一个标记
+        while pos < len(data) and data[pos] != 0xFF:
+            pos += 1
+        while pos < len(data) and data[pos] == 0xFF:
+            pos += 1
+        if pos >= len(data):
+            return None
+
+        marker = data[pos]
+        pos += 1
+        if marker == 0xD8 or marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            raise ImageProcessingError("JPEG文件缺少尺寸信息")
+        if pos + 2 > len(data):
+            return None
+
+        length = struct.unpack(">H", data[pos:pos + 2])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 7 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[pos + 3:pos + 7])
+            return width, height
+        pos += length
+
+
+def _webp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 30:
+        return None
+
+    chunk = data[12:16]
+    if chunk == b"VP8X":
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8 ":
+        if data[23:26] != b"\x9d\x01\x2a":
+            raise ImageProcessingError("WebP文件头无效")
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    raise ImageProcessingError("WebP文件头无效")
+
+
+def _bmp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 26:
+        return None
+    header_size = struct.unpack("<I", data[14:18])[0]
+    if header_size == 12:
+        width, height = struct.unpack("<HH", data[18:22])
+    else:
+        width, height = struct.unpack("<ii", data[18:26])
+    return abs(width), abs(height)
+
+
+def _tiff_size(data: bytes) -> Optional[Tuple[int, int]]:
+    endian = "<" if data[:2] == b"II" else ">"
+    if len(data) < 8:
+        return None
+    ifd = struct.unpack(f"{endian}I", data[4:8])[0]
+    if ifd + 2 > len(data):
+        return None
+
+    count = struct.unpack(f"{endian}H", data[ifd:ifd + 2])[0]
+    if ifd + 2 + count * 12 > len(data):
+        return None
+
+    size = {}
+    for i in range(count):
+        entry = ifd + 2 + i * 12
+        tag, field_type = struct.unpack(f"{endian}HH", data[entry:entry + 4])
+        if tag in (256, 257):
+            fmt = f"{endian}H" if field_type == 3 else f"{endian}I"
+            size[tag] = struct.unpack(fmt, data[entry + 8:entry + 8 + struct.calcsize(fmt)])[0]
+    if 256 not in size or 257 not in size:
+        raise ImageProcessingError("TIFF文件缺少尺寸信息")
+    return size[256], size[257]
+
+
+def read_image_size(data: Union[bytes, bytearray, memoryview]) -> Optional[Tuple[int, int]]:
+    """仅解析文件头获取图片宽高，不解码像素
+
+    支持PNG(IHDR)、JPEG(SOF)、WebP(VP8/VP8L/VP8X)、BMP和TIFF。
+    数据不足以确定尺寸时返回None，调用方可在收到更多数据后重试；
+    无法识别的格式同样返回None，由完整解码阶段处理。
+
+    Returns:
+        (宽, 高) 或 None
+    """
+    data = bytes(data)
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return _png_size(data)
+    if data[:2] == b"\xff\xd8":
+        return _jpeg_size(data)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _webp_size(data)
+    if data[:2] == b"BM":
+        return _bmp_size(data)
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return _tiff_size(data)
+    return None
@@ -0,0 +1,252 @@
+"""
+上传文件流式读取与限制
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from ..models.response import ErrorResponse
+from .exceptions import FileUploadError
+from .image_io import read_image_size
+
+# 解析文件头的最大字节数，超过后不再尝试（交给解码阶段校验）
+HEADER_PROBE_LIMIT = 512 * 1024
+
+# multipart编码带来的额外开销（边界、字段头等）
+MULTIPART_OVERHEAD = 64 * 1024
+
+# 普通表单字段的最大字节数
+MAX_FIELD_SIZE = 64 * 1024
+
+
+class UploadBuffer:
+    """在内存中累积上传内容，边接收边检查大小和图片尺寸
+
+    文件头一旦可以解析出宽高就立即校验像素数，超限的文件（包括
+    解压炸弹）只需接收几KB即被拒绝，不会进行任何解码。
+    """
+
+    def __init__(self, max_bytes: int, max_pixels: int):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self._buffer = bytearray()
+        self._probing = True
+
+    def feed(self, chunk: bytes):
+        """追加一块内容，超出限制时抛出FileUploadError"""
+        self._buffer += chunk
+        if len(self._buffer) > self.max_bytes:
+            raise FileUploadError(f"文件大小超出限制: >{self.max_bytes}")
+
+        if self._probing:
+            size = read_image_size(self._buffer)
+            if size is not None:
+                width, height = size
+                if width * height > self.max_pixels:
+                    raise FileUploadError(
+                        f"图片尺寸超出限制: {width}x{height} > {self.max_pixels}像素"
+                    )
+                self._probing = False
+            elif len(self._buffer) >= HEADER_PROBE_LIMIT:
+                self._probing = False
+
+    def getvalue(self) -> bytes:
+        """已接收的全部内容"""
+        return bytes(self._buffer)
+
+
+@dataclass
+class MultipartUpload:
+    """流式解析的multipart上传：一个文件和若干普通字段"""
+
+    filename: str
+    content: bytes
+    fields: Dict[str, str] = field(default_factory=dict)
+
+
+class _MultipartReader:
+    """multipart解析回调：文件内容写入UploadBuffer，普通字段保存为字符串"""
+
+    def __init__(self, file_field: str, allowed_extensions: Iterable[str], max_bytes: int, max_pixels: int):
+        self.file_field = file_field
+        self.allowed_extensions = tuple(allowed_extensions)
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.upload: Optional[MultipartUpload] = None
+        self.fields: Dict[str, str] = {}
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._name = ""
+        self._filename: Optional[str] = None
+        self._file: Optional[UploadBuffer] = None
+        self._data = bytearray()
+
+    @property
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._filename = None
+        self._file = None
+        self._data = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        self._name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if b"filename" not in options:
+            return
+        self._filename = options[b"filename"].decode("utf-8", errors="replace")
+        if self._name != self.file_field:
+            raise FileUploadError(f"不支持的文件字段: {self._name}")
+        if self.upload is not None:
+            raise FileUploadError("每个请求只能上传一个文件")
+        # 文件内容到达前按文件名检查格式
+        file_ext = Path(self._filename).suffix.lower()
+        if file_ext not in self.allowed_extensions:
+            raise FileUploadError(f"不支持的文件格式: {file_ext}")
+        self._file = UploadBuffer(self.max_bytes, self.max_pixels)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is not None:
+            self._file.feed(data[start:end])
+            return
+        self._data += data[start:end]
+        if len(self._data) > MAX_FIELD_SIZE:
+            raise FileUploadError(f"表单字段过大: {self._name}")
+
+    def on_part_end(self):
+        if self._file is not None:
+            self.upload = MultipartUpload(self._filename, self._file.getvalue())
+            self._file = None
+        else:
+            self.fields[self._name] = self._data.decode("utf-8", errors="replace")
+
+
+async def read_multipart_upload(request: Request, file_field: str, allowed_extensions: Iterable[str],
+                                max_bytes: int, max_pixels: int) -> MultipartUpload:
+    """流式解析multipart请求体，文件内容只保存在内存中
+
+    不经过Starlette的表单解析（会先接收完整请求体，并把超过1MB的文件
+    写入临时文件）：请求体边到达边解析，文件格式在文件头部字段到达时
+    检查，大小和图片尺寸随文件内容的到达检查，超限时不再接收剩余内容。
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise FileUploadError("请求须为multipart/form-data格式")
+
+    reader = _MultipartReader(file_field, allowed_extensions, max_bytes, max_pixels)
+    parser = MultipartParser(boundary, reader.callbacks)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                parser.write(chunk)
+        parser.finalize()
+    except FormParserError as e:
+        raise FileUploadError(f"multipart请求格式错误: {e}")
+
+    if reader.upload is None:
+        raise FileUploadError(f"缺少上传文件字段: {file_field}")
+    reader.upload.fields = reader.fields
+    return reader.upload
+
+
+class UploadSizeLimitMiddleware:
+    """请求体大小限制中间件
+
+    在multipart解析之前按到达的字节数累计请求体大小，超过限制立即
+    返回413，避免超大上传被完整缓冲后才被拒绝。
+    """
+
+    def __init__(self, app, max_body_size: int, paths: Iterable[str]):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "POST"
+                or not scope["path"].endswith(self.paths)):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() \
+                and int(content_length) > self.max_body_size:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise FileUploadError(f"请求体大小超出限制: >{self.max_body_size}")
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # 超限后丢弃应用自身的错误响应，统一返回413
+            if exceeded:
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except FileUploadError:
+            if not response_started:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        """发送413响应"""
+        body = ErrorResponse(
+            error_code="FILE_UPLOAD_ERROR",
+            error_message=f"文件大小超出限制: >{self.max_body_size}",
+            timestamp=datetime.now().isoformat()
+        ).json().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -36,6 +36,7 @@ if __name__ == "__main__":
     print(f"   - 放大倍数: {settings.model_scale}x")
     print(f"   - GPU设备: {settings.gpu_id}")
     print(f"   - 最大工作进程: {settings.max_workers}")
+    print(f"   - 服务进程数: {settings.server_workers}")
     print("=" * 60)
     print(f"📍 本地访问: http://localhost:{settings.port}")
     print(f"🌐 局域网访问: http://{settings.host}:{settings.port}")
@@ -48,6 +49,7 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=settings.reload,
+        workers=settings.server_workers,
         log_level=settings.log_level.lower(),
         access_log=True
     ) 
\ No newline at end of file
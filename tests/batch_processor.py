@@ -155,9 +155,11 @@ class BatchProcessor:
             result = response.json()
             task_id = result["task_id"]
             
-            # 等待处理完成
+            # 等待处理完成（长轮询：任务结束或等待超时才返回）
             while True:
-                status_response = requests.get(f"{API_BASE_URL}/status/{task_id}", timeout=10)
+                status_response = requests.get(
+                    f"{API_BASE_URL}/status/{task_id}", params={"wait": 30}, timeout=40
+                )
                 if status_response.status_code == 200:
                     status_data = status_response.json()
                     
@@ -0,0 +1,93 @@
+"""
+结果文件索引和结果缓存测试
+多个服务进程共用输出和缓存目录时，其他进程写入的文件在查找时被发现；
+下载时间写入文件，重启后保留最近下载顺序；后台重建索引期间新写入的结果不丢失
+"""
+
+import os
+import time
+
+import pytest
+
+from app.core.artifact_index import ArtifactIndex
+from app.core.result_cache import ResultCache
+
+
+def test_index_finds_outputs_written_by_other_processes(tmp_path):
+    writer = ArtifactIndex(tmp_path)
+    reader = ArtifactIndex(tmp_path)
+    reader.rebuild()
+
+    path = tmp_path / "task-1_output.png"
+    path.write_bytes(b"png")
+    writer.add("task-1", path)
+
+    info = reader.get("task-1")
+    assert info is not None
+    assert info.path == path
+    assert info.format == ".png"
+    assert reader.total_bytes == 3
+    assert reader.get("task-2") is None
+
+
+def test_index_rejects_task_ids_with_paths(tmp_path):
+    (tmp_path / "secret_output.png").write_bytes(b"png")
+    index = ArtifactIndex(tmp_path / "outputs")
+    assert index.get("../secret") is None
+    assert index.get("") is None
+
+
+def test_cache_finds_entries_written_by_other_processes(tmp_path):
+    src = tmp_path / "result.png"
+    src.write_bytes(b"png")
+    writer = ResultCache(tmp_path / "cache", max_bytes=1024)
+    reader = ResultCache(tmp_path / "cache", max_bytes=1024)
+    writer.load_index()
+    reader.load_index()
+
+    path = writer.put("key", src)
+    assert reader.get("key") is None
+    assert reader.get("key", ".png") == path
+    assert reader.get_stats()["entries"] == 1
+
+
+def test_download_order_survives_rebuild(tmp_path):
+    index = ArtifactIndex(tmp_path)
+    for task_id in ("old", "new"):
+        path = tmp_path / f"{task_id}_output.png"
+        path.write_bytes(b"png")
+        os.utime(path, (1000, 1000))
+        index.add(task_id, path)
+
+    index.touch("old")
+    restarted = ArtifactIndex(tmp_path)
+    restarted.rebuild()
+    old, new = restarted.get("old"), restarted.get("new")
+    # 下载时间写入文件，修改（创建）时间不变
+    assert old.accessed_at > new.accessed_at
+    assert old.accessed_at == pytest.approx(time.time(), abs=60)
+    assert old.created_at == 1000
+
+
+def test_rebuild_keeps_outputs_added_during_scan(tmp_path):
+    late = tmp_path / "late_output.png"
+
+    class WritingIndex(ArtifactIndex):
+        """扫描期间写入一个新结果"""
+
+        def parse_task_id(self, filename):
+            if not late.exists():
+                late.write_bytes(b"png")
+                self.add("late", late)
+            return super().parse_task_id(filename)
+
+    (tmp_path / "early_output.png").write_bytes(b"png")
+    index = WritingIndex(tmp_path)
+    removed = tmp_path / "removed_output.png"
+    removed.write_bytes(b"png")
+    index.add("removed", removed)
+    removed.unlink()
+    index.rebuild()
+    # 扫描前已在索引中但文件已不存在的条目被移除
+    assert set(index._artifacts) == {"early", "late"}
+    assert index.total_bytes == 6
@@ -0,0 +1,152 @@
+"""
+微批处理测试
+等待窗口内到达的同形状输入合并为一个批次，前向计算失败时每个请求都收到异常；
+合批推理与逐块推理的输出完全一致
+"""
+
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from app.core.batcher import MicroBatcher
+from app.core.inference import enhance
+
+
+class RecordingForward:
+    """记录每次前向计算的批大小，可在第一次调用时阻塞"""
+
+    def __init__(self, block: bool = False):
+        self.sizes = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, batch):
+        self.entered.set()
+        self.release.wait(10)
+        self.sizes.append(batch.shape[0])
+        return batch * 2
+
+
+@pytest.fixture
+def batcher():
+    batchers = []
+
+    def create(forward, max_batch_size=4, max_wait_ms=50.0):
+        batcher = MicroBatcher(forward, max_batch_size, max_wait_ms)
+        batcher.start()
+        batchers.append(batcher)
+        return batcher
+
+    yield create
+    for batcher in batchers:
+        batcher.stop()
+
+
+def test_inputs_within_window_share_one_batch(batcher):
+    forward = RecordingForward()
+    micro = batcher(forward, max_batch_size=4, max_wait_ms=200.0)
+    inputs = [torch.full((1, 3, 4, 4), float(i)) for i in range(3)]
+    futures = [micro.submit(tensor) for tensor in inputs]
+
+    for tensor, future in zip(inputs, futures):
+        assert torch.equal(future.result(10), tensor * 2)
+    assert forward.sizes == [3]
+    assert micro.get_stats()["avg_batch_size"] == 3
+
+
+def test_batch_size_limit_and_shape_groups(batcher):
+    forward = RecordingForward(block=True)
+    micro = batcher(forward, max_batch_size=3, max_wait_ms=0.0)
+    # 第一个批次执行期间排队，之后按批大小上限和形状分组
+    first = micro.submit(torch.zeros(1, 3, 4, 4))
+    assert forward.entered.wait(10)
+    small = [micro.submit(torch.zeros(1, 3, 4, 4)) for _ in range(2)]
+    large = micro.submit(torch.zeros(1, 3, 8, 8))
+    extra = micro.submit(torch.zeros(1, 3, 4, 4))
+    forward.release.set()
+
+    for future in [first, *small, large, extra]:
+        future.result(10)
+    assert forward.sizes == [1, 2, 1, 1]
+    assert large.result().shape == (1, 3, 8, 8)
+
+
+def test_forward_error_reaches_every_request(batcher):
+    def failing(batch):
+        raise RuntimeError("forward failed")
+
+    micro = batcher(failing, max_wait_ms=200.0)
+    futures = [micro.submit(torch.zeros(1, 3, 4, 4)) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="forward failed"):
+            future.result(10)
+    # 出错后继续处理后续请求
+    micro._forward = lambda batch: batch
+    assert micro.submit(torch.ones(1, 3, 4, 4)).result(10).sum() == 48
+
+
+def test_cancelled_requests_are_skipped(batcher):
+    forward = RecordingForward(block=True)
+    micro = batcher(forward, max_wait_ms=0.0)
+    first = micro.submit(torch.zeros(1, 3, 4, 4))
+    assert forward.entered.wait(10)
+    cancelled = micro.submit(torch.zeros(1, 3, 4, 4))
+    kept = micro.submit(torch.zeros(1, 3, 4, 4))
+    assert cancelled.cancel()
+    forward.release.set()
+
+    first.result(10)
+    kept.result(10)
+    assert forward.sizes == [1, 1]
+
+
+def upsampler(tile_size: int):
+    """感受野大于瓦片填充的x2小网络"""
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.Conv2d(3, 8, 5, padding=2),
+        torch.nn.ReLU(),
+        torch.nn.Conv2d(8, 8, 5, padding=2),
+        torch.nn.ReLU(),
+        torch.nn.Conv2d(8, 12, 5, padding=2),
+        torch.nn.PixelShuffle(2),
+        torch.nn.Sigmoid(),
+    ).eval()
+    return SimpleNamespace(model=model, scale=2, device=torch.device("cpu"), half=False,
+                           pre_pad=0, tile_size=tile_size, tile_pad=4)
+
+
+@pytest.mark.parametrize("shape, tile_size", [
+    ((40, 50, 3), 32),
+    ((40, 50, 4), 32),
+    ((30, 20, 3), 0),
+])
+def test_batched_output_matches_unbatched(batcher, shape, tile_size):
+    img = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    net = upsampler(tile_size)
+    expected, _ = enhance(net, img)
+
+    # 每个请求的全部瓦片在一个等待窗口内提交，同位置的瓦片跨请求合批
+    micro = batcher(net.model, max_batch_size=8, max_wait_ms=500.0)
+    results = [None, None]
+    barrier = threading.Barrier(2)
+
+    def run(index):
+        barrier.wait()
+        results[index] = enhance(net, img, batcher=micro)[0]
+
+    # 两个请求同时推理
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for output in results:
+        assert np.array_equal(output, expected)
+    assert micro.get_stats()["avg_batch_size"] > 1
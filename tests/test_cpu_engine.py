@@ -0,0 +1,166 @@
+"""
+CPU推理优化测试
+线程划分按配置的核心数和工作数均分；编译结果按输入形状缓存，
+同一形状第二次出现时编译一次，之后不再重复编译
+"""
+
+import pytest
+import torch
+
+from app.config import settings
+from app.core import cpu_engine
+from app.core.cpu_engine import CompiledModel, configure_threads, intra_op_threads
+
+
+@pytest.fixture
+def threads(monkeypatch):
+    """记录设置的线程数，并允许再次执行configure_threads"""
+    calls = {}
+    monkeypatch.setattr(cpu_engine, "_threads_configured", False)
+    monkeypatch.setattr(cpu_engine.os, "cpu_count", lambda: 16)
+    monkeypatch.setattr(torch, "set_num_threads", lambda n: calls.setdefault("intra", []).append(n))
+    monkeypatch.setattr(torch, "set_num_interop_threads", lambda n: calls.setdefault("interop", []).append(n))
+    monkeypatch.setattr(cpu_engine.cv2, "setNumThreads", lambda n: calls.setdefault("opencv", []).append(n))
+    for name, value in (("cpu_threads", 0), ("server_workers", 1),
+                        ("auto_detect_workers", False), ("max_workers", 1),
+                        ("use_worker_processes", False), ("batch_max_size", 1),
+                        ("cpu_interop_threads", 1), ("opencv_threads", 1)):
+        monkeypatch.setattr(settings, name, value)
+    return calls
+
+
+@pytest.mark.parametrize("server_workers, worker_count, processes, batch, expected", [
+    (1, 1, False, 1, 16),
+    (2, 1, False, 1, 8),
+    (1, 4, False, 1, 4),
+    (2, 4, True, 4, 2),
+    # 线程模式合批时前向计算由合批线程串行执行，使用进程分到的全部核心
+    (2, 4, False, 4, 8),
+    # 核心数少于工作数时至少使用一个线程
+    (4, 8, True, 1, 1),
+])
+def test_threads_partition_cores(threads, monkeypatch, server_workers, worker_count,
+                                 processes, batch, expected):
+    monkeypatch.setattr(settings, "server_workers", server_workers)
+    monkeypatch.setattr(settings, "max_workers", worker_count)
+    monkeypatch.setattr(settings, "use_worker_processes", processes)
+    monkeypatch.setattr(settings, "batch_max_size", batch)
+    assert intra_op_threads() == expected
+
+
+def test_configured_thread_count_overrides_partition(threads, monkeypatch):
+    monkeypatch.setattr(settings, "cpu_threads", 3)
+    monkeypatch.setattr(settings, "max_workers", 4)
+    monkeypatch.setattr(settings, "cpu_interop_threads", 2)
+    monkeypatch.setattr(settings, "opencv_threads", 0)
+
+    configure_threads()
+    configure_threads()
+    # 只设置一次
+    assert threads == {"intra": [3], "interop": [2], "opencv": [0]}
+
+
+class CountingModel(torch.nn.Module):
+    """记录前向计算次数的模型"""
+
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 3, 3, padding=1)
+        self.calls = 0
+
+    def forward(self, x):
+        self.calls += 1
+        return self.conv(x)
+
+
+@pytest.fixture
+def traces(monkeypatch):
+    """记录每次编译的输入形状"""
+    shapes = []
+    trace = torch.jit.trace
+
+    def recording(model, x, **kwargs):
+        shapes.append(tuple(x.shape))
+        return trace(model, x, **kwargs)
+
+    monkeypatch.setattr(torch.jit, "trace", recording)
+    return shapes
+
+
+def run(model: CompiledModel, shape) -> torch.Tensor:
+    with torch.no_grad():
+        return model(torch.rand(shape))
+
+
+def test_compiles_once_per_repeated_shape(traces):
+    model = CompiledModel(CountingModel(), mode="jit")
+    small, large = (1, 3, 8, 8), (1, 3, 16, 16)
+
+    # 第一次出现的形状使用未编译模型
+    run(model, small)
+    run(model, large)
+    assert traces == []
+
+    for _ in range(3):
+        run(model, small)
+    assert traces == [small]
+    run(model, large)
+    run(model, large)
+    assert traces == [small, large]
+    assert model.get_stats()["compiled_shapes"] == [list(small), list(large)]
+
+    # 已编译的形状不再调用原模型
+    calls = model.model.calls
+    run(model, small)
+    assert model.model.calls == calls
+
+
+def test_compiled_output_matches_model(traces):
+    model = CompiledModel(CountingModel(), mode="jit")
+    x = torch.rand(1, 3, 8, 8)
+    with torch.no_grad():
+        expected = model.model(x)
+        for _ in range(3):
+            assert torch.allclose(model(x), expected)
+    assert len(traces) == 1
+
+
+def test_cache_evicts_least_recently_used_shape(traces):
+    model = CompiledModel(CountingModel(), mode="jit", max_shapes=2)
+    shapes = [(1, 3, 8, 8), (1, 3, 12, 12), (1, 3, 16, 16)]
+    for shape in shapes[:2]:
+        run(model, shape)
+        run(model, shape)
+    run(model, shapes[0])
+    for _ in range(2):
+        run(model, shapes[2])
+
+    assert model.get_stats()["compiled_shapes"] == [list(shapes[0]), list(shapes[2])]
+    # 被淘汰的形状重新计数，再出现两次才重新编译
+    run(model, shapes[1])
+    assert len(traces) == 3
+    run(model, shapes[1])
+    assert traces[-1] == shapes[1]
+
+
+def test_failed_compile_falls_back_without_retry(monkeypatch):
+    attempts = []
+
+    def failing(model, x, **kwargs):
+        attempts.append(tuple(x.shape))
+        raise RuntimeError("trace failed")
+
+    monkeypatch.setattr(torch.jit, "trace", failing)
+    model = CompiledModel(CountingModel(), mode="jit")
+    for _ in range(4):
+        assert run(model, (1, 3, 8, 8)).shape == (1, 3, 8, 8)
+    assert attempts == [(1, 3, 8, 8)]
+    assert model.get_stats()["failed_shapes"] == 1
+
+
+def test_mode_none_never_compiles(traces):
+    model = CompiledModel(CountingModel(), mode="none")
+    for _ in range(3):
+        run(model, (1, 3, 8, 8))
+    assert traces == []
+    assert model.model.calls == 3
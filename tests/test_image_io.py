@@ -0,0 +1,106 @@
+"""
+图片文件头解析测试
+各格式只解析文件头即可得到宽高，数据不足时返回None，文件头无效时抛出异常；
+上传时超出像素上限的图片在接收完前被拒绝
+"""
+
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from app.utils.exceptions import FileUploadError, ImageProcessingError
+from app.utils.image_io import read_image_size
+from app.utils.upload import UploadBuffer
+
+WIDTH, HEIGHT = 37, 21
+
+
+def encode(ext: str, *params: int) -> bytes:
+    img = np.random.default_rng(0).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    ok, buffer = cv2.imencode(ext, img, list(params))
+    assert ok
+    return buffer.tobytes()
+
+
+def webp_vp8x(width: int, height: int) -> bytes:
+    """扩展格式WebP的文件头（画布尺寸减1，各24位）"""
+    chunk = b"\x00" * 4 + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little")
+    return b"RIFF" + struct.pack("<I", 4 + 8 + len(chunk)) + b"WEBP" + b"VP8X" + struct.pack("<I", len(chunk)) + chunk
+
+
+@pytest.mark.parametrize("data", [
+    encode(".png"),
+    encode(".jpg"),
+    encode(".jpg", cv2.IMWRITE_JPEG_PROGRESSIVE, 1),
+    encode(".webp", cv2.IMWRITE_WEBP_QUALITY, 90),
+    encode(".webp", cv2.IMWRITE_WEBP_QUALITY, 101),
+    encode(".bmp"),
+    encode(".tiff"),
+    webp_vp8x(WIDTH, HEIGHT),
+], ids=["png", "jpeg", "jpeg-progressive", "webp-vp8", "webp-vp8l", "bmp", "tiff", "webp-vp8x"])
+def test_size_from_header(data):
+    assert read_image_size(data) == (WIDTH, HEIGHT)
+
+
+@pytest.mark.parametrize("data", [
+    encode(".png")[:20],
+    encode(".jpg")[:4],
+    encode(".webp", cv2.IMWRITE_WEBP_QUALITY, 90)[:20],
+    encode(".bmp")[:20],
+    encode(".tiff")[:6],
+    b"",
+    b"GIF89a",
+], ids=["png", "jpeg", "webp", "bmp", "tiff", "empty", "unknown"])
+def test_truncated_or_unknown_header_returns_none(data):
+    assert read_image_size(data) is None
+
+
+def test_truncated_jpeg_resumes_when_more_data_arrives():
+    data = encode(".jpg")
+    sizes = [read_image_size(data[:n]) for n in range(2, len(data), 16)]
+    assert all(size in (None, (WIDTH, HEIGHT)) for size in sizes)
+    assert sizes[-1] == (WIDTH, HEIGHT)
+
+
+@pytest.mark.parametrize("data", [
+    encode(".png")[:12] + b"IDAT" + b"\x00" * 8,
+    b"\xff\xd8\xff\xda\x00\x08" + b"\x00" * 8,
+    b"RIFF\x00\x00\x00\x00WEBPVP8Z" + b"\x00" * 14,
+    b"RIFF\x00\x00\x00\x00WEBPVP8 " + b"\x00" * 14,
+    # 只有一个非尺寸标签的TIFF目录
+    b"II*\x00\x08\x00\x00\x00\x01\x00" + struct.pack("<HHII", 259, 3, 1, 1),
+], ids=["png", "jpeg", "webp-chunk", "webp-vp8", "tiff"])
+def test_malformed_header_raises(data):
+    with pytest.raises(ImageProcessingError):
+        read_image_size(data)
+
+
+def chunks(data: bytes, size: int = 4096):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_upload_over_pixel_limit_is_rejected_from_header():
+    data = encode(".png") + b"\x00" * (4 * 4096)
+    buffer = UploadBuffer(max_bytes=len(data), max_pixels=WIDTH * HEIGHT - 1)
+    parts = chunks(data)
+    # 第一块即解析出尺寸并拒绝
+    with pytest.raises(FileUploadError):
+        buffer.feed(parts[0])
+
+
+def test_upload_within_limits_is_kept_completely():
+    data = encode(".png")
+    buffer = UploadBuffer(max_bytes=len(data), max_pixels=WIDTH * HEIGHT)
+    for part in chunks(data, 7):
+        buffer.feed(part)
+    assert buffer.getvalue() == data
+
+
+def test_upload_over_size_limit_is_rejected():
+    data = encode(".bmp")
+    buffer = UploadBuffer(max_bytes=len(data) - 1, max_pixels=WIDTH * HEIGHT)
+    with pytest.raises(FileUploadError):
+        for part in chunks(data):
+            buffer.feed(part)
@@ -0,0 +1,162 @@
+"""
+文件清理器测试
+按文件的修改/访问时间验证保留时间、容量上限和最近下载顺序的淘汰；
+目录按游标增量扫描，多进程时同步其他进程写入和删除的文件而不重新扫描整个目录
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.config import settings
+from app.core import janitor
+from app.core.artifact_index import ArtifactIndex
+from app.core.janitor import ArtifactJanitor
+from app.core.result_cache import ResultCache
+
+NOW = time.time()
+HOUR = 3600
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    """输出、缓存和上传目录位于临时目录，清理器使用独立的索引"""
+    output_dir, upload_dir = tmp_path / "outputs", tmp_path / "uploads"
+    cache_dir = output_dir / "cache"
+    for path in (output_dir, upload_dir, cache_dir):
+        path.mkdir(parents=True)
+    monkeypatch.setattr(settings, "output_dir", output_dir)
+    monkeypatch.setattr(settings, "upload_dir", upload_dir)
+    monkeypatch.setattr(settings, "server_workers", 1)
+    monkeypatch.setattr(settings, "cache_enabled", False)
+    monkeypatch.setattr(settings, "artifact_ttl", 0)
+    monkeypatch.setattr(janitor, "artifact_index", ArtifactIndex(output_dir))
+    monkeypatch.setattr(janitor, "result_cache", ResultCache(cache_dir, max_bytes=10 ** 9))
+    return output_dir, upload_dir, cache_dir
+
+
+def write(path, size: int = 100, mtime: float = NOW, atime: float = None):
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime if atime is None else atime, mtime))
+    return path
+
+
+def sweep(cleaner: ArtifactJanitor) -> dict:
+    return asyncio.run(cleaner.sweep())
+
+
+def outputs(output_dir) -> set:
+    return {path.name for path in output_dir.iterdir() if path.is_file()}
+
+
+def test_outputs_expire_by_last_download(dirs, monkeypatch):
+    output_dir, _, _ = dirs
+    monkeypatch.setattr(settings, "artifact_ttl", HOUR)
+    # 很早生成但最近下载过的结果保留
+    write(output_dir / "old_output.png", mtime=NOW - 3 * HOUR)
+    write(output_dir / "downloaded_output.png", mtime=NOW - 3 * HOUR, atime=NOW - 60)
+    write(output_dir / "new_output.png", mtime=NOW - 60)
+    janitor.artifact_index.rebuild()
+
+    result = sweep(ArtifactJanitor())
+    assert outputs(output_dir) == {"downloaded_output.png", "new_output.png"}
+    assert result["outputs_removed"] == 1
+    assert janitor.artifact_index.get("old") is None
+
+
+def test_outputs_over_quota_evict_least_recently_downloaded(dirs, monkeypatch):
+    output_dir, _, _ = dirs
+    monkeypatch.setattr(settings, "output_quota", 250)
+    write(output_dir / "a_output.png", atime=NOW - 300)
+    write(output_dir / "b_output.png", atime=NOW - 100)
+    write(output_dir / "c_output.png", atime=NOW - 200)
+    janitor.artifact_index.rebuild()
+    janitor.artifact_index.touch("a")
+
+    result = sweep(ArtifactJanitor())
+    assert outputs(output_dir) == {"a_output.png", "b_output.png"}
+    assert result["outputs_freed_mb"] == round(100 / (1024 * 1024), 2)
+    assert janitor.artifact_index.total_bytes == 200
+
+
+def test_uploads_expire_and_evict_oldest(dirs, monkeypatch):
+    _, upload_dir, _ = dirs
+    monkeypatch.setattr(settings, "artifact_ttl", HOUR)
+    monkeypatch.setattr(settings, "upload_quota", 250)
+    write(upload_dir / "expired.png", mtime=NOW - 2 * HOUR)
+    write(upload_dir / "older.png", mtime=NOW - 300)
+    write(upload_dir / "old.png", mtime=NOW - 200)
+    write(upload_dir / "new.png", mtime=NOW - 100)
+
+    result = sweep(ArtifactJanitor())
+    assert {path.name for path in upload_dir.iterdir()} == {"old.png", "new.png"}
+    assert result["uploads_removed"] == 2
+
+
+def test_upload_scan_resumes_across_sweeps(dirs, monkeypatch):
+    _, upload_dir, _ = dirs
+    monkeypatch.setattr(settings, "artifact_ttl", HOUR)
+    monkeypatch.setattr(settings, "cleanup_scan_limit", 2)
+    for i in range(5):
+        write(upload_dir / f"{i}.png", mtime=NOW - 2 * HOUR)
+
+    cleaner = ArtifactJanitor()
+    # 每轮最多读取2个目录项，从上一轮停下的位置继续
+    assert [sweep(cleaner)["uploads_removed"] for _ in range(4)] == [2, 2, 1, 0]
+    assert not any(upload_dir.iterdir())
+
+
+def test_shared_outputs_sync_incrementally(dirs, monkeypatch):
+    output_dir, _, _ = dirs
+    monkeypatch.setattr(settings, "server_workers", 2)
+    monkeypatch.setattr(settings, "cleanup_scan_limit", 2)
+    monkeypatch.setattr(settings, "output_quota", 10 ** 9)
+
+    def no_rebuild():
+        raise AssertionError("清理时重新扫描了整个目录")
+
+    monkeypatch.setattr(janitor.artifact_index, "rebuild", no_rebuild)
+    mine = write(output_dir / "mine_output.png")
+    janitor.artifact_index.add("mine", mine)
+    # 其他服务进程写入的结果，其中一个被下载过
+    for name in ("x", "y", "z"):
+        write(output_dir / f"{name}_output.png", atime=NOW - 500)
+    os.utime(output_dir / "y_output.png", (NOW, NOW))
+
+    # 目录中有5项（含cache子目录），每轮最多读取2项，3轮读完一遍
+    cleaner = ArtifactJanitor()
+    sweep(cleaner)
+    assert len(janitor.artifact_index) <= 3
+    sweep(cleaner)
+    sweep(cleaner)
+    assert len(janitor.artifact_index) == 4
+    assert janitor.artifact_index.total_bytes == 400
+    assert janitor.artifact_index.get("y").accessed_at == pytest.approx(NOW)
+
+    # 其他进程删除的文件在一遍扫描结束时移出索引
+    (output_dir / "x_output.png").unlink()
+    mine.unlink()
+    for _ in range(3):
+        sweep(cleaner)
+    assert sorted(info.task_id for info in janitor.artifact_index.snapshot()) == ["y", "z"]
+    assert janitor.artifact_index.total_bytes == 200
+
+
+def test_shared_cache_entries_are_synced(dirs, monkeypatch):
+    _, _, cache_dir = dirs
+    monkeypatch.setattr(settings, "server_workers", 2)
+    monkeypatch.setattr(settings, "cache_enabled", True)
+    cache = ResultCache(cache_dir, max_bytes=250)
+    monkeypatch.setattr(janitor, "result_cache", cache)
+    src = write(cache_dir.parent / "result.png")
+    cache.put("mine", src)
+    for name in ("a", "b"):
+        write(cache_dir / f"{name}.png")
+
+    sweep(ArtifactJanitor())
+    # 其他进程写入的缓存项视为最久未使用，超出容量时先淘汰
+    assert cache.get_stats()["entries"] == 2
+    assert (cache_dir / "mine.png").exists()
+    assert len(list(cache_dir.iterdir())) == 2
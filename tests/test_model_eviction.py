@@ -0,0 +1,79 @@
+"""
+驻留模型淘汰测试
+超出驻留数量或内存预算时按最近使用顺序淘汰空闲模型，使用中的模型保留
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.core.model_manager import LoadedModel, ModelManager, ModelSpec
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(settings, "max_loaded_models", 10)
+    monkeypatch.setattr(settings, "model_memory_budget", 300 * MB)
+    manager = ModelManager()
+    monkeypatch.setattr(manager, "_start_idle_monitor", lambda: None)
+    return manager
+
+
+def install(manager: ModelManager, name: str, weight_mb: int = 100) -> LoadedModel:
+    """登记一个不含权重的模型"""
+    model = LoadedModel(ModelSpec(name, scale=4, num_block=6), Path(f"{name}.pth"))
+    model.weight_bytes = weight_mb * MB
+    model.upsampler = SimpleNamespace(model=None)
+    return manager._install(model)
+
+
+def test_budget_evicts_least_recently_used_idle_model(manager):
+    a, b, c = (install(manager, name) for name in "abc")
+    with manager.acquire("a"):
+        # 使用a之后又使用了b、c，a为最久未使用但仍在使用中
+        manager.get_model("b")
+        manager.get_model("c")
+        install(manager, "d")
+
+        assert manager.loaded_models == ["a", "c", "d"]
+        assert b.upsampler is None
+        assert a.upsampler is not None
+        info = manager.get_model_info()
+        assert info["evictions"] == 1
+        assert info["residency"]["b"]["unload_reason"] == "evicted"
+
+    # a不再使用后按最近使用顺序淘汰
+    install(manager, "e")
+    assert manager.loaded_models == ["c", "d", "e"]
+    assert a.upsampler is None
+
+
+def test_large_model_evicts_several(manager):
+    for name in "abc":
+        install(manager, name)
+    install(manager, "big", weight_mb=250)
+    assert manager.loaded_models == ["big"]
+    assert manager.get_model_info()["evictions"] == 3
+
+
+def test_model_count_limit(manager, monkeypatch):
+    monkeypatch.setattr(settings, "model_memory_budget", 0)
+    monkeypatch.setattr(settings, "max_loaded_models", 2)
+    for name in "abc":
+        install(manager, name, weight_mb=1000)
+    assert manager.loaded_models == ["b", "c"]
+
+
+def test_models_in_use_are_never_evicted(manager):
+    install(manager, "a")
+    install(manager, "b")
+    with manager.acquire("a"), manager.acquire("b"):
+        install(manager, "c", weight_mb=200)
+        # 超出预算但其余模型均在使用中，暂不淘汰
+        assert manager.loaded_models == ["a", "b", "c"]
+    install(manager, "d", weight_mb=10)
+    assert manager.loaded_models == ["c", "d"]
@@ -0,0 +1,97 @@
+"""
+空闲模型卸载测试
+空闲超时且没有请求在用的模型被卸载，服务仍可用；下一个请求到达时沿用卸载前的
+推理速度快速重新加载，期间的请求等待同一次加载
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.config import settings
+from app.core.model_manager import LoadedModel, ModelManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """加载时不读取权重的模型管理器，记录每次加载沿用的推理速度"""
+    monkeypatch.setattr(settings, "model_dir", tmp_path)
+    monkeypatch.setattr(settings, "engine", "torch")
+    monkeypatch.setattr(settings, "model_idle_timeout", 60)
+    (tmp_path / "fake_x4.pth").touch()
+
+    loads = []
+
+    def load(self, seconds_per_pixel=0.0):
+        loads.append(seconds_per_pixel)
+        time.sleep(0.1)
+        self.seconds_per_pixel = seconds_per_pixel or 1e-6
+        self.load_time = 0.01 if seconds_per_pixel else 2.0
+
+    monkeypatch.setattr(LoadedModel, "load", load)
+    manager = ModelManager()
+    monkeypatch.setattr(manager, "_start_idle_monitor", lambda: None)
+    manager.loads = loads
+    return manager
+
+
+def make_idle(manager, name="fake_x4"):
+    manager.get_model(name).last_used = time.monotonic() - settings.model_idle_timeout
+
+
+def test_idle_model_is_unloaded_and_rehydrated(manager):
+    manager.get_model("fake_x4")
+    assert manager.unload_idle() == []
+
+    make_idle(manager)
+    assert manager.unload_idle() == ["fake_x4"]
+    assert not manager.is_loaded
+    assert manager.is_available
+    residency = manager.get_model_info()["residency"]["fake_x4"]
+    assert residency["state"] == "unloaded"
+    assert residency["unload_reason"] == "idle"
+    assert residency["idle_unloads"] == 1
+
+    # 重新加载沿用卸载前的推理速度，跳过预热
+    assert manager.get_model("fake_x4").seconds_per_pixel == 1e-6
+    assert manager.loads == [0.0, 1e-6]
+    residency = manager.get_model_info()["residency"]["fake_x4"]
+    assert residency["state"] == "resident"
+    assert residency["loads"] == 2
+    assert residency["load_times"] == [2.0, 0.01]
+
+
+def test_model_in_use_is_not_unloaded(manager):
+    with manager.acquire("fake_x4") as model:
+        model.last_used = time.monotonic() - settings.model_idle_timeout
+        assert manager.unload_idle() == []
+    # 请求结束时刷新最近使用时间
+    assert manager.unload_idle() == []
+    assert manager.loaded_models == ["fake_x4"]
+
+
+def test_requests_wait_for_rehydration(manager):
+    make_idle(manager)
+    manager.unload_idle()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(manager.get_model("fake_x4")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 4
+    assert all(model is results[0] for model in results)
+    assert manager.loads == [0.0, 1e-6]
+
+
+def test_explicit_unload_is_not_rehydrated(manager):
+    manager.get_model("fake_x4")
+    manager.unload_model()
+    assert not manager.is_available
+    assert manager.get_model_info()["residency"]["fake_x4"]["unload_reason"] == "unloaded"
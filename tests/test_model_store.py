@@ -0,0 +1,90 @@
+"""
+预序列化模型存储测试
+保存后加载的模型输出需与原模型一致，权重或配置变化时使用新的文件
+"""
+
+import pytest
+import torch
+
+rrdbnet_arch = pytest.importorskip("basicsr.archs.rrdbnet_arch")
+
+from app.config import settings
+from app.core import model_store
+from app.core.precision import load_images, quantize_int8
+
+
+def build():
+    return rrdbnet_arch.RRDBNet(
+        num_in_ch=3, num_out_ch=3, num_feat=16, num_block=2, num_grow_ch=8, scale=4
+    )
+
+
+@pytest.fixture
+def weights(tmp_path, monkeypatch):
+    """小尺寸随机权重的RRDBNet及其权重文件，存储目录位于临时目录"""
+    monkeypatch.setattr(settings, "model_dir", tmp_path)
+    torch.manual_seed(0)
+    net = build().eval()
+    path = tmp_path / "tiny_x4.pth"
+    torch.save({"params_ema": net.state_dict()}, path)
+    return net, path
+
+
+def test_state_dict_round_trip(weights):
+    net, path = weights
+    artifact = model_store.artifact_path("tiny_x4", path, {"precision": "fp32"})
+    assert model_store.load_artifact(artifact, build, torch.device("cpu")) is None
+
+    model_store.save_artifact(artifact, net, {"activation_bytes": 1.5})
+    loaded, metadata = model_store.load_artifact(artifact, build, torch.device("cpu"))
+    assert metadata == {"activation_bytes": 1.5}
+
+    x = torch.rand(1, 3, 24, 40)
+    with torch.no_grad():
+        assert torch.equal(loaded(x), net(x))
+
+
+def test_torchscript_round_trip(weights):
+    net, path = weights
+    quantized = quantize_int8(net, load_images("calib"))
+    artifact = model_store.artifact_path("tiny_x4", path, {"precision": "int8"}, torchscript=True)
+    model_store.save_artifact(artifact, quantized, {"precision": "int8"}, torch.zeros(1, 3, 32, 32))
+
+    loaded, metadata = model_store.load_artifact(artifact, build, torch.device("cpu"))
+    assert metadata == {"precision": "int8"}
+    # 追踪时的示例尺寸之外的输入同样适用
+    for shape in [(1, 3, 32, 32), (2, 3, 24, 40)]:
+        x = torch.rand(*shape)
+        with torch.no_grad():
+            assert torch.equal(loaded(x), quantized(x))
+
+
+def test_key_tracks_weights_and_options(weights):
+    net, path = weights
+    fp32 = model_store.artifact_path("tiny_x4", path, {"precision": "fp32"})
+    assert model_store.artifact_path("tiny_x4", path, {"precision": "fp32"}) == fp32
+    assert model_store.artifact_path("tiny_x4", path, {"precision": "bf16"}) != fp32
+    model_store.save_artifact(fp32, net, {})
+
+    # 权重更新后使用新文件，旧权重生成的文件被删除
+    torch.manual_seed(1)
+    torch.save({"params_ema": build().state_dict()}, path)
+    updated = model_store.artifact_path("tiny_x4", path, {"precision": "fp32"})
+    assert updated != fp32
+    model_store.save_artifact(updated, net, {})
+    assert not fp32.exists()
+    assert updated.exists()
+
+
+def test_atomic_write_keeps_target_on_failure(tmp_path):
+    path = tmp_path / "model.pt"
+    with model_store.atomic_write(path) as tmp:
+        tmp.write_bytes(b"v1")
+    assert path.read_bytes() == b"v1"
+
+    with pytest.raises(RuntimeError):
+        with model_store.atomic_write(path) as tmp:
+            tmp.write_bytes(b"partial")
+            raise RuntimeError("导出失败")
+    assert path.read_bytes() == b"v1"
+    assert list(tmp_path.iterdir()) == [path]
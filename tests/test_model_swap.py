@@ -0,0 +1,69 @@
+"""
+模型热替换测试
+重新加载时新模型原子替换旧模型，进行中的请求在旧模型上完成，加载失败时保留旧模型
+"""
+
+from pathlib import Path
+
+import pytest
+
+from app.core.model_manager import LoadedModel, ModelManager, ModelSpec
+from app.utils.exceptions import ModelLoadError
+
+
+class FakeModel(LoadedModel):
+    """不加载权重的模型，记录是否已释放"""
+
+    def __init__(self, version: int):
+        super().__init__(ModelSpec("fake_x4", scale=4, num_block=1), Path("fake_x4.pth"))
+        self.version = version
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def manager():
+    manager = ModelManager()
+    manager._install(FakeModel(1))
+    return manager
+
+
+def test_reload_swaps_after_in_flight_requests(manager, monkeypatch):
+    monkeypatch.setattr(manager, "_create", lambda name: FakeModel(2))
+
+    with manager.acquire("fake_x4") as old:
+        assert manager.reload_model()
+        # 新请求使用新模型，进行中的请求仍持有旧模型
+        assert manager.get_model("fake_x4").version == 2
+        assert old.version == 1
+        assert not old.closed
+        assert manager.get_model_info()["retired_in_use"] == ["fake_x4"]
+
+    assert old.closed
+    assert manager.get_model_info()["retired_in_use"] == []
+    assert not manager.get_model("fake_x4").closed
+
+
+def test_idle_model_is_released_immediately(manager, monkeypatch):
+    old = manager.get_model("fake_x4")
+    monkeypatch.setattr(manager, "_create", lambda name: FakeModel(2))
+
+    manager.reload_model()
+    assert old.closed
+    assert manager.loaded_models == ["fake_x4"]
+
+
+def test_failed_reload_keeps_old_model(manager, monkeypatch):
+    old = manager.get_model("fake_x4")
+
+    def fail(name):
+        raise ModelLoadError("模型加载失败: 权重损坏")
+
+    monkeypatch.setattr(manager, "_create", fail)
+    with pytest.raises(ModelLoadError):
+        manager.reload_model()
+
+    assert manager.get_model("fake_x4") is old
+    assert not old.closed
@@ -0,0 +1,85 @@
+"""
+ONNX Runtime推理引擎测试
+导出的模型输出需与PyTorch推理在容差内一致；GPU上的半精度模型也在CPU上导出
+"""
+
+import os
+
+import pytest
+import torch
+
+pytest.importorskip("onnxruntime")
+rrdbnet_arch = pytest.importorskip("basicsr.archs.rrdbnet_arch")
+
+from app.core.onnx_engine import export_onnx, load_onnx_model, onnx_path
+
+# 与PyTorch输出的最大绝对误差（输出范围约0-1）
+TOLERANCE = 1e-4
+
+
+@pytest.fixture
+def model_files(tmp_path):
+    """小尺寸随机权重的RRDBNet及其权重文件"""
+    torch.manual_seed(0)
+    net = rrdbnet_arch.RRDBNet(
+        num_in_ch=3, num_out_ch=3, num_feat=16, num_block=2, num_grow_ch=8, scale=4
+    ).eval()
+    weights = tmp_path / "tiny_x4.pth"
+    torch.save({"params_ema": net.state_dict()}, weights)
+    return net, weights
+
+
+@pytest.mark.parametrize("shape", [(1, 3, 32, 32), (2, 3, 24, 40), (1, 3, 37, 21)])
+def test_onnx_matches_torch(model_files, shape):
+    net, weights = model_files
+    onnx_model = load_onnx_model(net, weights)
+
+    x = torch.rand(*shape)
+    with torch.no_grad():
+        expected = net(x)
+    actual = onnx_model(x)
+
+    assert actual.shape == expected.shape
+    assert torch.max(torch.abs(actual - expected)).item() < TOLERANCE
+
+
+def test_export_is_cached_next_to_weights(model_files):
+    net, weights = model_files
+    path = export_onnx(net, weights)
+    assert path == onnx_path(weights)
+    assert path.parent == weights.parent
+
+    # 权重未更新时复用已导出的文件
+    exported_at = path.stat().st_mtime_ns
+    assert export_onnx(net, weights) == path
+    assert path.stat().st_mtime_ns == exported_at
+
+    # 权重内容变化时重新导出，即使复制时保留了修改时间（cp -p、rsync -a）
+    mtime = weights.stat().st_mtime_ns
+    torch.manual_seed(1)
+    for param in net.parameters():
+        param.data.normal_()
+    torch.save({"params_ema": net.state_dict()}, weights)
+    os.utime(weights, ns=(mtime, mtime))
+    updated = export_onnx(net, weights)
+    assert updated != path
+    assert updated.exists()
+    assert not path.exists()
+
+
+
+@pytest.mark.parametrize("device", [
+    "cpu",
+    pytest.param("cuda", marks=pytest.mark.skipif(not torch.cuda.is_available(), reason="需要CUDA")),
+])
+def test_export_half_model_on_device(model_files, device):
+    net, weights = model_files
+    # 示例输入在CPU上创建，模型转换为CPU上的fp32后导出
+    onnx_model = load_onnx_model(net.to(device).half(), weights)
+    param = next(net.parameters())
+    assert (param.device.type, param.dtype) == ("cpu", torch.float32)
+
+    x = torch.rand(1, 3, 32, 32)
+    with torch.no_grad():
+        expected = net(x)
+    assert torch.max(torch.abs(onnx_model(x) - expected)).item() < TOLERANCE
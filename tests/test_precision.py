@@ -0,0 +1,65 @@
+"""
+CPU低精度推理画质测试
+bf16和INT8模型在评估图片上相对fp32的PSNR/SSIM需达到下限
+"""
+
+import numpy as np
+import pytest
+import torch
+
+rrdbnet_arch = pytest.importorskip("basicsr.archs.rrdbnet_arch")
+
+from app.config import settings
+from app.core.precision import (
+    MAX_PSNR, apply_precision, bf16_supported, evaluate, load_images, psnr, ssim
+)
+
+# 各精度相对fp32的画质下限
+QUALITY_FLOOR = {
+    "bf16": {"psnr": 40.0, "ssim": 0.98},
+    "int8": {"psnr": 30.0, "ssim": 0.95},
+}
+
+
+@pytest.fixture(scope="module")
+def fp32_model():
+    """默认模型；权重文件不存在时使用固定种子的随机权重"""
+    torch.manual_seed(0)
+    net = rrdbnet_arch.RRDBNet(
+        num_in_ch=3, num_out_ch=3, num_feat=64, num_block=6, num_grow_ch=32, scale=4
+    )
+    weights = settings.model_dir / "RealESRGAN_x4plus_anime_6B.pth"
+    if weights.exists():
+        state = torch.load(weights, map_location="cpu")
+        net.load_state_dict(state.get("params_ema", state.get("params", state)))
+    return net.eval()
+
+
+def test_calibration_images_are_bundled():
+    assert len(load_images("calib")) >= 4
+    assert len(load_images("eval")) >= 2
+
+
+def test_metrics():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    noisy = np.clip(img.astype(int) + rng.integers(-8, 9, img.shape), 0, 255).astype(np.uint8)
+
+    assert psnr(img, img) == MAX_PSNR
+    assert ssim(img, img) == pytest.approx(1.0)
+    assert 25 < psnr(img, noisy) < 40
+    assert ssim(img, noisy) < 1.0
+
+
+@pytest.mark.parametrize("precision", ["bf16", "int8"])
+def test_reduced_precision_quality(fp32_model, precision):
+    if precision == "bf16" and not bf16_supported():
+        pytest.skip("CPU不支持bfloat16加速")
+
+    model = apply_precision(fp32_model, precision)
+    assert model is not fp32_model
+
+    quality = evaluate(fp32_model, model)
+    floor = QUALITY_FLOOR[precision]
+    assert quality["psnr"] >= floor["psnr"], quality
+    assert quality["ssim"] >= floor["ssim"], quality
@@ -0,0 +1,45 @@
+"""
+输出倍数规划测试
+按实测推理速度选择代价最小的路线，两次推理的预估耗时超出预算时退回单次推理后缩放
+"""
+
+import pytest
+
+from app.core.scale_planner import ModelCost, PlanPass, _estimate, choose_plan
+
+X4 = ModelCost("x4", scale=4, seconds_per_pixel=1e-4)
+X2_FAST = ModelCost("x2", scale=2, seconds_per_pixel=1e-5)
+X2_SLOW = ModelCost("x2", scale=2, seconds_per_pixel=1e-2)
+
+
+@pytest.mark.parametrize("outscale, alternatives, budget, route, passes", [
+    (4.0, [], 0.0, "direct", [("x4", 4, 1.0)]),
+    (2.0, [], 0.0, "pre_downscale", [("x4", 4, 0.5)]),
+    # 原生x2模型更快时改用它，更慢时仍预先缩小后用x4推理
+    (2.0, [X2_FAST], 0.0, "native", [("x2", 2, 1.0)]),
+    (2.0, [X2_SLOW], 0.0, "pre_downscale", [("x4", 4, 0.5)]),
+    # 倍数低于目标倍数的模型不参与
+    (3.0, [X2_FAST], 0.0, "pre_downscale", [("x4", 4, 0.75)]),
+    # 超过模型倍数：预算内两次推理，否则单次推理后缩放
+    (8.0, [], 100.0, "chain", [("x4", 4, 1.0), ("x4", 4, 0.5)]),
+    (8.0, [], 1.0, "model_resize", [("x4", 4, 1.0)]),
+    (16.0, [], 1000.0, "chain", [("x4", 4, 1.0), ("x4", 4, 1.0)]),
+])
+def test_choose_plan(outscale, alternatives, budget, route, passes):
+    plan = choose_plan(100, 100, outscale, X4, alternatives, chain_budget=budget)
+    assert plan.route == route
+    assert [(p.model_name, p.scale, pytest.approx(p.input_scale)) for p in plan.passes] == passes
+    assert plan.outscale == outscale
+
+
+def test_chain_budget_boundary():
+    # 两次推理：100x100和200x200像素，预估1秒 + 4秒
+    assert choose_plan(100, 100, 8.0, X4, chain_budget=5.0).route == "chain"
+    assert choose_plan(100, 100, 8.0, X4, chain_budget=4.99).route == "model_resize"
+
+
+def test_estimate_scales_pixels_through_passes():
+    costs = {"x4": 1e-4, "x2": 1e-5}
+    passes = [PlanPass("x4", 4, input_scale=0.5), PlanPass("x2", 2, input_scale=0.5)]
+    # 第一次推理50x50，第二次输入为200x200缩小一半即100x100
+    assert _estimate(100, 100, passes, costs) == pytest.approx(50 * 50 * 1e-4 + 100 * 100 * 1e-5)
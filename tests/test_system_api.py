@@ -0,0 +1,30 @@
+"""
+系统状态接口测试
+进程模式下模型信息返回各推理进程的状态，而不是API进程内为空的模型注册表
+"""
+
+import asyncio
+
+from app.api.v1 import system
+from app.config import settings
+from app.core.worker_pool import worker_pool
+
+
+def test_model_info_in_process_mode_reports_workers(monkeypatch):
+    workers = [{"index": 0, "ready": False}, {"index": 1, "ready": True}]
+    monkeypatch.setattr(settings, "use_worker_processes", True)
+    monkeypatch.setattr(worker_pool, "get_stats", lambda: {"enabled": True, "workers": workers, "pending": 0})
+
+    info = asyncio.run(system.get_model_info())
+    assert info["worker_processes"] is True
+    assert info["model_loaded"] is True
+    assert info["workers"] == workers
+    assert "loaded_models" not in info
+    assert all("loaded" not in spec for spec in info["available_models"])
+
+
+def test_model_info_in_thread_mode(monkeypatch):
+    monkeypatch.setattr(settings, "use_worker_processes", False)
+    info = asyncio.run(system.get_model_info())
+    assert "worker_processes" not in info
+    assert "loaded_models" in info
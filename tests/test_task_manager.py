@@ -0,0 +1,49 @@
+"""
+任务管理器测试
+处理参数覆盖所有影响输出的配置，配置不同时缓存键不同；写入缓存的任务不改用其他模型
+"""
+
+import pytest
+
+from app.config import settings
+from app.core.result_cache import ResultCache
+from app.core.task_manager import TaskManager, UpscaleJob
+
+
+def cache_key(**overrides) -> str:
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    return ResultCache.make_key(b"image", TaskManager._processing_params(".png"))
+
+
+@pytest.fixture(autouse=True)
+def restore_settings(monkeypatch):
+    for name in ("engine", "cpu_precision", "use_half_precision"):
+        monkeypatch.setattr(settings, name, getattr(settings, name))
+
+
+@pytest.mark.parametrize("changed", [
+    {"cpu_precision": "int8"},
+    {"cpu_precision": "bf16"},
+    {"engine": "onnx"},
+])
+def test_cache_key_tracks_engine_and_precision(changed):
+    base = cache_key(engine="cpu", cpu_precision="fp32")
+    assert cache_key(**changed) != base
+
+
+def test_half_only_applies_to_torch_engine():
+    settings.use_half_precision = True
+    settings.engine = "cpu"
+    assert TaskManager._processing_params(".png")["half"] is False
+    settings.engine = "torch"
+    params = TaskManager._processing_params(".png")
+    assert params["half"] is True
+    assert params["precision"] == "fp32"
+
+
+def test_cached_jobs_keep_the_requested_model():
+    # 缓存键按默认模型计算，写入缓存的任务不能改用其他模型
+    assert UpscaleJob("t1", b"", ".png").allow_substitute
+    assert not UpscaleJob("t1", b"", ".png", cache_key="key").allow_substitute
+    assert not UpscaleJob("t1", b"", ".png", model_name="RealESRGAN_x2plus").allow_substitute
@@ -0,0 +1,95 @@
+"""
+瓦片大小规划测试
+整图放得下时不分块，否则选择预算内最大的32对齐瓦片且不低于下限；
+内存不足时瓦片逐次减半到下限
+"""
+
+import math
+
+import pytest
+
+import torch
+
+from app.core.tiling import TILE_ALIGN, image_bytes, is_out_of_memory, select_tile_size, shrink_tile_size
+
+# 每个输入像素的激活内存（字节），乘以安全系数2
+ACTIVATION = 1000.0
+
+
+def budget_for_tile(tile: int, height: int, width: int, pad: int = 10, parallel: int = 1) -> float:
+    """恰好容纳指定瓦片（含填充）的内存预算"""
+    return image_bytes(height, width, 4) + (tile + 2 * pad) ** 2 * ACTIVATION * 2 * parallel
+
+
+def select(height: int, width: int, budget: float, **kwargs) -> int:
+    return select_tile_size(height, width, scale=4, activation_bytes=ACTIVATION,
+                            budget=budget, tile_pad=10, **kwargs)
+
+
+def test_whole_image_when_it_fits():
+    assert select(100, 100, budget=1e12) == 0
+    # 含预填充的整图放不下，但计算出的瓦片不小于图片最长边时同样整图推理
+    assert select(100, 100, budget=budget_for_tile(128, 100, 100), pre_pad=50) == 0
+    assert select(200, 200, budget=budget_for_tile(128, 200, 200), pre_pad=50) == 128
+
+
+@pytest.mark.parametrize("tile", [64, 96, 256, 512])
+def test_largest_aligned_tile_within_budget(tile):
+    height, width = 2000, 3000
+    assert select(height, width, budget_for_tile(tile, height, width)) == tile
+    # 预算略少一点时退到下一个对齐尺寸
+    assert select(height, width, budget_for_tile(tile, height, width) - 1) == tile - TILE_ALIGN
+
+
+def test_tile_is_aligned():
+    height, width = 2000, 3000
+    for extra in range(0, 10 ** 8, 7 * 10 ** 6):
+        tile = select(height, width, budget_for_tile(64, height, width) + extra)
+        assert tile % TILE_ALIGN == 0
+
+
+def test_parallel_tiles_share_budget():
+    height, width = 2000, 3000
+    budget = budget_for_tile(256, height, width)
+    shared = select(height, width, budget, parallel=4)
+    assert shared < 256
+    assert shared == (int(math.sqrt((budget - image_bytes(height, width, 4)) / (ACTIVATION * 2 * 4))) - 20) \
+        // TILE_ALIGN * TILE_ALIGN
+
+
+@pytest.mark.parametrize("budget", [0.0, -1e9, 1e6])
+def test_min_tile_floor(budget):
+    assert select(2000, 3000, budget) == TILE_ALIGN
+    assert select(2000, 3000, budget, min_tile=128) == 128
+
+
+def test_shrink_halves_to_floor():
+    # 整图推理从最长边的一半开始
+    assert shrink_tile_size(0, 1000, 3000) == 1472
+    sizes = [512]
+    while (tile := shrink_tile_size(sizes[-1], 2000, 3000, min_tile=64)) is not None:
+        sizes.append(tile)
+    assert sizes == [512, 256, 128, 64]
+
+
+@pytest.mark.parametrize("tile, min_tile, expected", [
+    (96, 32, 32),
+    (100, 64, 64),
+    (64, 64, None),
+    (32, 64, None),
+])
+def test_shrink_alignment_and_floor(tile, min_tile, expected):
+    assert shrink_tile_size(tile, 2000, 3000, min_tile=min_tile) == expected
+
+
+@pytest.mark.parametrize("error, expected", [
+    (MemoryError(), True),
+    (torch.cuda.OutOfMemoryError("CUDA out of memory. Tried to allocate 2.00 GiB"), True),
+    (RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB"), True),
+    (RuntimeError("[enforce fail at alloc_cpu.cpp:114] . DefaultCPUAllocator: can't allocate memory"), True),
+    (RuntimeError("onnxruntime: Failed to allocate memory for requested buffer"), True),
+    (RuntimeError("Given groups=1, weight of size [64, 3, 3, 3], expected input to have 3 channels"), False),
+    (ValueError("out of memory"), False),
+])
+def test_out_of_memory_classification(error, expected):
+    assert is_out_of_memory(error) is expected
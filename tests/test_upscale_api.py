@@ -0,0 +1,397 @@
+"""
+图片处理接口测试
+推理替换为按瓦片执行的桩函数，通过TestClient验证结果缓存、相同输入的挂靠、
+SSE状态推送和长轮询、批量查询的增量游标、瓦片之间取消任务，以及内联模式直接返回图片并登记结果、客户端断开连接时取消任务；
+模型就绪前就绪检查和上传返回503；上传在请求体到达过程中检查，超限时不再接收剩余内容，超过1MB的上传也不写入临时文件
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import httpx
+import numpy as np
+import pytest
+import starlette.formparsers
+from fastapi.testclient import TestClient
+
+from app.api.v1 import upscale
+from app.config import settings
+from app.core.artifact_index import artifact_index
+from app.core.model_manager import ModelManager, model_manager
+from app.core.result_cache import result_cache
+from app.core.scale_planner import PlanPass, ScalePlan
+from app.core.task_manager import TaskManager
+from app.main import app
+from app.utils.exceptions import TaskCancelledError
+
+# 桩推理的瓦片数
+TILES = 8
+
+
+class StubInference:
+    """按瓦片推理的桩：每个瓦片之前执行检查点，可在指定瓦片处暂停"""
+
+    def __init__(self):
+        self.calls = 0
+        self.tiles_done = 0
+        self.pause_at: int = -1
+        self.tile_seconds = 0.0
+        self.paused = threading.Event()
+        self.resume = threading.Event()
+
+    def __call__(self, img, plan, on_progress=None, check=None, on_downgrade=None):
+        self.calls += 1
+        for tile in range(TILES):
+            if tile == self.pause_at:
+                self.paused.set()
+                self.resume.wait(10)
+            if check is not None:
+                check()
+            time.sleep(self.tile_seconds)
+            self.tiles_done += 1
+            if on_progress is not None:
+                on_progress(tile + 1, TILES)
+        return cv2.resize(img, None, fx=plan.outscale, fy=plan.outscale)
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    """输出和缓存目录位于临时目录，模型视为已加载，推理由桩函数执行"""
+    output_dir = tmp_path / "outputs"
+    monkeypatch.setattr(settings, "output_dir", output_dir)
+    monkeypatch.setattr(settings, "upload_dir", tmp_path / "uploads")
+    monkeypatch.setattr(settings, "cache_enabled", True)
+    monkeypatch.setattr(settings, "use_worker_processes", False)
+    for name, value in [("_output_dir", output_dir), ("_artifacts", {}), ("_total_bytes", 0)]:
+        monkeypatch.setattr(artifact_index, name, value)
+    for name, value in [("_cache_dir", output_dir / "cache"), ("_entries", OrderedDict()),
+                        ("_sizes", {}), ("_total_bytes", 0)]:
+        monkeypatch.setattr(result_cache, name, value)
+
+    monkeypatch.setattr(ModelManager, "load_model", lambda self, name=None: True)
+    monkeypatch.setattr(ModelManager, "is_available", property(lambda self: True))
+    monkeypatch.setattr(TaskManager, "_plan", staticmethod(
+        lambda job, img: ScalePlan("direct", 4.0, [PlanPass("stub_x4", 4)])
+    ))
+    inference = StubInference()
+    monkeypatch.setattr(TaskManager, "_infer", staticmethod(inference))
+    return inference
+
+
+@pytest.fixture
+def client(stub):
+    with TestClient(app) as client:
+        yield client
+
+
+def image(seed: int = 0) -> bytes:
+    img = np.random.default_rng(seed).integers(0, 256, (16, 24, 3), dtype=np.uint8)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def submit(client, data: bytes) -> dict:
+    response = client.post("/upscale", files={"file": ("input.png", data, "image/png")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def wait_finished(client, task_id: str) -> dict:
+    return client.get(f"/status/{task_id}", params={"wait": 10}).json()
+
+
+def test_identical_upload_is_served_from_cache(client, stub):
+    first = submit(client, image())
+    assert wait_finished(client, first["task_id"])["status"] == "completed"
+
+    second = submit(client, image())
+    assert second["status"] == "completed"
+    assert wait_finished(client, second["task_id"])["message"] == "处理完成（缓存命中）"
+    assert stub.calls == 1
+
+    downloads = [client.get(f"/download/{task['task_id']}") for task in (first, second)]
+    assert all(response.status_code == 200 for response in downloads)
+    assert downloads[0].content == downloads[1].content
+    assert cv2.imdecode(np.frombuffer(downloads[0].content, np.uint8), cv2.IMREAD_COLOR).shape == (64, 96, 3)
+
+    # 不同输入不命中
+    third = submit(client, image(seed=1))
+    assert wait_finished(client, third["task_id"])["status"] == "completed"
+    assert stub.calls == 2
+
+
+def test_identical_upload_follows_in_flight_task(client, stub):
+    stub.pause_at = 2
+    primary = submit(client, image())
+    assert stub.paused.wait(10)
+
+    follower = submit(client, image())
+    assert follower["status"] == "processing"
+    stub.resume.set()
+
+    for task in (primary, follower):
+        status = wait_finished(client, task["task_id"])
+        assert status["status"] == "completed"
+        assert client.get(status["download_url"]).status_code == 200
+    assert stub.calls == 1
+
+
+def bulk(client, task_ids, since=None) -> dict:
+    response = client.post("/status/bulk", json={"task_ids": task_ids, "since": since})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_bulk_status_since_cursor(client):
+    first = submit(client, image())["task_id"]
+    wait_finished(client, first)
+
+    full = bulk(client, [first, "missing"])
+    assert [task["task_id"] for task in full["tasks"]] == [first, "missing"]
+    assert full["tasks"][0]["status"] == "completed"
+    assert full["tasks"][1]["status"] == "not_found"
+    cursor = full["cursor"]
+
+    # 游标之后没有变化
+    assert bulk(client, [first, "missing"], since=cursor)["tasks"] == []
+
+    second = submit(client, image(seed=1))["task_id"]
+    wait_finished(client, second)
+    changed = bulk(client, [first, second], since=cursor)
+    assert [task["task_id"] for task in changed["tasks"]] == [second]
+    assert changed["cursor"] > cursor
+
+    # 游标超过当前序号（例如服务已重启）时返回全部任务
+    beyond = bulk(client, [first, second], since=changed["cursor"] + 1000)
+    assert [task["task_id"] for task in beyond["tasks"]] == [first, second]
+    assert beyond["cursor"] == changed["cursor"]
+
+
+def test_cancel_running_task_between_tiles(client, stub):
+    stub.pause_at = 3
+    task_id = submit(client, image())["task_id"]
+    assert stub.paused.wait(10)
+
+    response = client.delete(f"/task/{task_id}")
+    assert response.status_code == 200
+    assert response.json()["data"]["status"] == "cancelled"
+    stub.resume.set()
+
+    status = wait_finished(client, task_id)
+    assert status["status"] == "cancelled"
+    assert status["message"] == "任务已被用户取消"
+    # 在暂停后的下一个瓦片之前中止，不产生结果
+    assert stub.tiles_done == 3
+    assert client.get(f"/download/{task_id}").status_code == 404
+
+    # 已结束的任务再次删除时移除记录
+    assert client.delete(f"/task/{task_id}").json()["message"] == "任务已删除"
+
+
+def test_inline_returns_image_and_registers_artifact(client, stub):
+    response = client.post("/upscale", params={"response": "inline"},
+                           files={"file": ("input.png", image(), "image/png")})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "image/png"
+    output = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+    assert output.shape == (64, 96, 3)
+
+    # 响应发送后登记结果，可按任务ID查询和下载相同内容，不写入结果缓存
+    task_id = response.headers["X-Task-Id"]
+    assert artifact_index.get(task_id) is not None
+    download = client.get(f"/download/{task_id}")
+    assert download.status_code == 200
+    assert download.content == response.content
+    assert client.get(f"/status/{task_id}").json()["status"] == "completed"
+    assert result_cache.get_stats()["entries"] == 0
+    assert stub.calls == 1
+
+
+class DisconnectedRequest:
+    """客户端已断开连接的请求"""
+
+    async def is_disconnected(self) -> bool:
+        return True
+
+
+def test_inline_job_is_cancelled_on_disconnect(monkeypatch):
+    monkeypatch.setattr(upscale, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+    async def run():
+        manager = TaskManager()
+        manager._queue = asyncio.Queue()
+        pending = asyncio.ensure_future(manager.run_inline("t1", b"image", ".png"))
+        await asyncio.sleep(0)
+        job = manager._queue.get_nowait()
+
+        with pytest.raises(TaskCancelledError):
+            await upscale._wait_unless_disconnected(DisconnectedRequest(), pending)
+        await asyncio.sleep(0)
+        return job
+
+    job = asyncio.run(run())
+    # 工作协程取出任务时跳过，处理中则在下一个检查点中止
+    assert job.future.cancelled()
+    with pytest.raises(TaskCancelledError):
+        job.check()
+
+
+def chunked_post(body: bytes, headers: dict, chunk_size: int = 64 * 1024):
+    """以分块到达的请求体直接调用ASGI应用，返回已接收的块数、总块数和响应"""
+    parts = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    received = 0
+    messages = []
+
+    async def receive():
+        nonlocal received
+        if received == len(parts):
+            return {"type": "http.disconnect"}
+        received += 1
+        return {"type": "http.request", "body": parts[received - 1], "more_body": received < len(parts)}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/upscale", "raw_path": b"/upscale",
+        "query_string": b"", "root_path": "",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    content = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return received, len(parts), status, json.loads(content)
+
+
+def multipart(data: bytes, filename: str = "input.png"):
+    request = httpx.Request("POST", "http://testserver/upscale", files={"file": (filename, data, "image/png")})
+    return request.read(), dict(request.headers)
+
+
+def test_oversized_image_is_rejected_before_body_arrives(client, monkeypatch):
+    monkeypatch.setattr(settings, "max_input_pixels", 100)
+    body, headers = multipart(image() + b"\x00" * (2 * 1024 * 1024))
+
+    received, total, status, error = chunked_post(body, headers)
+    assert status == 400
+    assert error["error_message"].startswith("图片尺寸超出限制")
+    # 第一块即解析出尺寸，剩余请求体不再接收
+    assert received == 1 < total
+
+
+def test_unsupported_format_is_rejected_before_file_content(client):
+    body, headers = multipart(image() + b"\x00" * (2 * 1024 * 1024), filename="input.gif")
+
+    received, total, status, error = chunked_post(body, headers)
+    assert status == 400
+    assert error["error_message"] == "不支持的文件格式: .gif"
+    assert received == 1 < total
+
+
+def test_invalid_outscale_is_rejected(client):
+    response = client.post("/upscale", files={"file": ("input.png", image(), "image/png")},
+                           data={"outscale": "9"})
+    assert response.status_code == 400
+    assert response.json()["error_code"] == "VALIDATION_ERROR"
+
+
+def test_large_upload_is_not_spooled_to_disk(client, monkeypatch):
+    def spool(*args, **kwargs):
+        raise AssertionError("上传内容被写入临时文件")
+
+    monkeypatch.setattr(starlette.formparsers, "SpooledTemporaryFile", spool)
+    monkeypatch.setattr(settings, "save_uploads", False)
+    img = np.random.default_rng(0).integers(0, 256, (400, 1000, 3), dtype=np.uint8)
+    data = cv2.imencode(".png", img)[1].tobytes()
+    assert len(data) > 1024 * 1024
+
+    task = submit(client, data)
+    assert wait_finished(client, task["task_id"])["status"] == "completed"
+    assert not settings.upload_dir.exists() or not any(settings.upload_dir.iterdir())
+
+
+def test_not_ready_until_model_loads(client, monkeypatch):
+    state = {"ready": False}
+    monkeypatch.setattr(ModelManager, "is_available", property(lambda self: state["ready"]))
+    retry_after = str(settings.ready_retry_after)
+
+    ready = client.get("/health/ready")
+    assert ready.status_code == 503
+    assert ready.headers["Retry-After"] == retry_after
+    assert ready.json()["status"] == "loading"
+    upload = client.post("/upscale", files={"file": ("input.png", image(), "image/png")})
+    assert upload.status_code == 503
+    assert upload.headers["Retry-After"] == retry_after
+    # 存活检查不依赖模型状态
+    assert client.get("/health/live").status_code == 200
+
+    state["ready"] = True
+    assert client.get("/health/ready").json()["status"] == "ready"
+    task = submit(client, image())
+    assert wait_finished(client, task["task_id"])["status"] == "completed"
+
+
+def test_failed_model_load_is_not_retried(client, monkeypatch):
+    monkeypatch.setattr(ModelManager, "is_available", property(lambda self: False))
+    monkeypatch.setattr(model_manager, "_load_error", "模型文件不存在")
+
+    ready = client.get("/health/ready")
+    assert ready.status_code == 503
+    assert "Retry-After" not in ready.headers
+    assert ready.json()["error"] == "模型文件不存在"
+    upload = client.post("/upscale", files={"file": ("input.png", image(), "image/png")})
+    assert upload.status_code == 503
+    assert "Retry-After" not in upload.headers
+
+
+def stream_events(client, task_id: str) -> list:
+    with client.stream("GET", f"/status/{task_id}/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return [json.loads(line[len("data: "):]) for line in response.iter_lines() if line.startswith("data: ")]
+
+
+def test_status_stream_emits_progress_until_finished(client, stub):
+    stub.tile_seconds = 0.05
+    task_id = submit(client, image())["task_id"]
+
+    events = stream_events(client, task_id)
+    # 任务结束后服务端关闭连接，最后一个事件为结束状态
+    assert events[-1]["status"] == "completed"
+    assert events[-1]["download_url"] == f"/download/{task_id}"
+    progress = [event["progress"] for event in events]
+    assert progress == sorted(progress)
+    assert any(0 < value < 100 for value in progress)
+
+
+def test_status_stream_for_unknown_task_closes(client):
+    events = stream_events(client, "missing")
+    assert [event["status"] for event in events] == ["not_found"]
+
+
+def test_long_poll_returns_when_task_finishes(client, stub):
+    stub.tile_seconds = 0.05
+    task_id = submit(client, image())["task_id"]
+
+    started = time.monotonic()
+    status = client.get(f"/status/{task_id}", params={"wait": 30}).json()
+    assert status["status"] == "completed"
+    assert time.monotonic() - started < 10
+
+
+def test_long_poll_returns_current_state_on_timeout(client, stub):
+    stub.pause_at = 2
+    task_id = submit(client, image())["task_id"]
+    assert stub.paused.wait(10)
+
+    started = time.monotonic()
+    status = client.get(f"/status/{task_id}", params={"wait": 0.5}).json()
+    assert time.monotonic() - started >= 0.5
+    assert status["status"] == "processing"
+    assert 0 < status["progress"] < 100
+    stub.resume.set()
+    assert wait_finished(client, task_id)["status"] == "completed"
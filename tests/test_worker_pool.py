@@ -0,0 +1,216 @@
+"""
+推理进程池测试
+推理进程替换为读取桩权重文件的进程；验证按未完成任务数分配、共享内存取消标记、
+进程崩溃后释放共享内存并重启、加载失败时的重启退避，以及重新加载时替换进程
+就绪后才回收旧进程
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.core.scale_planner import PlanPass, ScalePlan
+from app.core.worker_pool import InferenceWorkerPool, _serve
+from app.utils.exceptions import ImageProcessingError, TaskCancelledError
+
+# 桩权重文件路径的环境变量，内容为“输出值 加载耗时 每个瓦片耗时”
+WEIGHTS_ENV = "STUB_WORKER_WEIGHTS"
+TILES = 4
+
+# 推理进程处理该输出倍数的任务时崩溃
+CRASH_OUTSCALE = 3.0
+
+IMG = np.zeros((8, 8, 3), dtype=np.uint8)
+
+
+class StubModels:
+    """推理进程中的桩模型管理器"""
+
+    def plan_scale(self, height, width, outscale, model_name=None, allow_substitute=True):
+        if outscale == CRASH_OUTSCALE:
+            os._exit(1)
+        return ScalePlan("direct", outscale, [PlanPass("stub", 1)])
+
+    def release_memory(self):
+        pass
+
+
+class StubTaskManager:
+    """按瓦片推理的桩，输出填充为权重文件中的值"""
+
+    def __init__(self, value: int, tile_seconds: float):
+        self.value = value
+        self.tile_seconds = tile_seconds
+
+    def _infer(self, img, plan, on_progress=None, check=None, on_downgrade=None):
+        for tile in range(TILES):
+            check()
+            time.sleep(self.tile_seconds)
+            on_progress(tile + 1, TILES)
+        return np.full_like(img, self.value)
+
+
+def stub_worker(index, conn):
+    """推理进程桩：权重文件无效时加载失败退出"""
+    value, load_seconds, tile_seconds = open(os.environ[WEIGHTS_ENV]).read().split()
+    models = StubModels()
+    task_manager = StubTaskManager(int(value), float(tile_seconds))
+    time.sleep(float(load_seconds))
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        _serve(request, lambda *message: conn.send(message), models, task_manager)
+
+
+class Job:
+    """提交给进程池的任务"""
+
+    model_name = None
+    allow_substitute = False
+    deadline = None
+
+    def __init__(self, outscale: float = 1.0):
+        self.outscale = outscale
+        self.cancelled = False
+
+    def check(self):
+        if self.cancelled:
+            raise TaskCancelledError("任务已取消")
+
+
+def wait_until(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def weights(tmp_path, monkeypatch):
+    path = tmp_path / "weights"
+    path.write_text("1 0 0")
+    monkeypatch.setenv(WEIGHTS_ENV, str(path))
+    return path
+
+
+@pytest.fixture
+def pool(weights):
+    pool = InferenceWorkerPool(target=stub_worker)
+    yield pool
+    pool.stop()
+
+
+def start(pool: InferenceWorkerPool, num_workers: int):
+    pool.start(num_workers)
+    wait_until(lambda: pool.ready_workers == num_workers)
+
+
+def infer(pool: InferenceWorkerPool, job: Job = None) -> int:
+    return int(asyncio.run(pool.infer(IMG, job or Job()))[0, 0, 0])
+
+
+def pids(pool: InferenceWorkerPool) -> list:
+    return [worker["pid"] for worker in pool.get_stats()["workers"]]
+
+
+def test_reload_single_worker_keeps_serving(pool, weights):
+    start(pool, 1)
+    old_pid = pids(pool)[0]
+    assert infer(pool) == 1
+
+    weights.write_text("2 1.0 0")
+    with ThreadPoolExecutor(1) as executor:
+        reloading = executor.submit(pool.reload)
+        wait_until(lambda: pool._standby is not None)
+        # 替换进程加载期间由旧进程处理
+        assert infer(pool) == 1
+        assert reloading.result(timeout=30) is True
+
+    assert infer(pool) == 2
+    assert pids(pool) != [old_pid]
+    wait_until(lambda: not pool._retired)
+    assert pool.get_stats()["workers"][0]["alive"]
+
+
+def test_failed_reload_keeps_old_worker(pool, weights):
+    start(pool, 1)
+    old_pid = pids(pool)[0]
+
+    weights.write_text("broken 0 0")
+    assert pool.reload() is False
+    assert pids(pool) == [old_pid]
+    assert pool.get_stats()["workers"][0]["alive"]
+    assert infer(pool) == 1
+
+
+def shared_blocks() -> set:
+    return {path.name for path in Path("/dev/shm").glob("psm_*")}
+
+
+def test_jobs_go_to_least_loaded_worker(pool, weights):
+    weights.write_text("1 0 0.1")
+    start(pool, 2)
+
+    async def run():
+        return await asyncio.gather(*(pool.infer(IMG, Job()) for _ in range(4)))
+
+    assert all(output[0, 0, 0] == 1 for output in asyncio.run(run()))
+    assert [worker["completed"] for worker in pool.get_stats()["workers"]] == [2, 2]
+
+
+def test_cancel_flag_stops_worker_between_tiles(pool, weights):
+    weights.write_text("1 0 0.2")
+    start(pool, 1)
+    job = Job()
+    progress = []
+
+    def on_progress(done, total):
+        progress.append(done)
+        job.cancelled = True
+
+    with pytest.raises(TaskCancelledError):
+        asyncio.run(pool.infer(IMG, job, on_progress=on_progress))
+    time.sleep(0.5)
+    # 取消标记在下一个瓦片前生效
+    assert len(progress) < TILES
+    assert infer(pool) == 1
+
+
+def test_worker_crash_fails_job_and_releases_shared_memory(pool, weights):
+    start(pool, 1)
+    before = shared_blocks()
+
+    with pytest.raises(ImageProcessingError, match="推理进程异常退出"):
+        infer(pool, Job(outscale=CRASH_OUTSCALE))
+    assert shared_blocks() == before
+
+    # 已就绪的进程崩溃后立即重启
+    wait_until(lambda: pool.ready_workers == 1)
+    assert pool.get_stats()["workers"][0]["restarts"] == 1
+    assert infer(pool) == 1
+
+
+def test_restart_backs_off_while_loading_fails(pool, weights):
+    weights.write_text("broken 0 0")
+    pool.start(1)
+    worker = pool._workers[0]
+    wait_until(lambda: worker.failures == 2)
+    # 第一次失败后等待1秒，第二次失败后等待3秒
+    assert worker.restarts == 1
+    assert 1.0 < worker.restart_at - time.monotonic() <= 3.0
+
+    weights.write_text("1 0 0")
+    wait_until(lambda: pool.ready_workers == 1)
+    assert worker.restarts == 2
+    assert worker.failures == 0
+    assert infer(pool) == 1